@@ -0,0 +1,91 @@
+import functools
+import timeit
+from absl import app
+from absl import flags
+from absl import logging as log
+from typing import Any, Callable, List, Tuple
+
+from randomizer.logic.constants import LevelNum, RoomNum
+from randomizer.logic.inventory import Inventory
+from randomizer.logic.item import Item
+from randomizer.logic.location import Location
+from randomizer.logic.main import ZoraRandomizer
+from randomizer.logic.settings import Settings
+
+flags.DEFINE_integer(name='number',
+                     default=200000,
+                     help='How many times to call each inventory method.')
+flags.DEFINE_integer(name='seed', default=4, help='The seed to time the validator with.')
+flags.DEFINE_integer(name='validator_runs',
+                     default=50,
+                     help='How many times to validate the seed.')
+COMMAND_LINE_FLAGS = flags.FLAGS
+
+ITEMS_FOUND = [
+    Item.WOOD_SWORD, Item.BOMBS, Item.BLUE_CANDLE, Item.WOOD_ARROWS, Item.BOW, Item.RECORDER,
+    Item.HEART_CONTAINER, Item.WOOD_SWORD, Item.KEY, Item.TRIFORCE, Item.BLUE_RING, Item.LADDER,
+    Item.WOOD_ARROWS, Item.RAFT, Item.BOOMERANG, Item.POWER_BRACELET
+]
+
+
+def GetItemsAndLocations() -> List[Tuple[Item, Location]]:
+  return [(item, Location.LevelRoom(LevelNum.LEVEL_1, RoomNum(room_num)))
+          for room_num, item in enumerate(ITEMS_FOUND)]
+
+
+def GetFilledInventory() -> Inventory:
+  inventory = Inventory()
+  for (item, location) in GetItemsAndLocations():
+    inventory.AddItem(item, location)
+  return inventory
+
+
+def TimeAddingItems() -> None:
+  inventory = Inventory()
+  pairs = GetItemsAndLocations()
+
+  def AddItems() -> None:
+    inventory.Reset()
+    for (item, location) in pairs:
+      inventory.AddItem(item, location)
+
+  number = COMMAND_LINE_FLAGS.number // len(ITEMS_FOUND)
+  seconds = timeit.timeit(AddItems, number=number)
+  print("%-30s %8.1f ns/call" % ("AddItem", 1e9 * seconds / (number * len(ITEMS_FOUND))))
+
+
+def TimeChecks() -> None:
+  inventory = GetFilledInventory()
+  checks: List[Tuple[str, Callable[[], Any]]] = [
+      ("Has(LADDER)", functools.partial(inventory.Has, Item.LADDER)),
+      ("HasSword", inventory.HasSword),
+      ("HasReusableWeapon", inventory.HasReusableWeapon),
+      ("HasReusableWeaponOrBoomerang", inventory.HasReusableWeaponOrBoomerang),
+      ("HasFireSource", inventory.HasFireSource),
+      ("HasBowAndArrows", inventory.HasBowAndArrows),
+      ("HasBowSilverArrowsAndSword", inventory.HasBowSilverArrowsAndSword),
+      ("HasKey", inventory.HasKey),
+  ]
+  for (name, check) in checks:
+    seconds = timeit.timeit(check, number=COMMAND_LINE_FLAGS.number)
+    print("%-30s %8.1f ns/call" % (name, 1e9 * seconds / COMMAND_LINE_FLAGS.number))
+
+
+def TimeValidator() -> None:
+  randomizer = ZoraRandomizer(Settings(seed=COMMAND_LINE_FLAGS.seed, flag_string=''))
+  randomizer.Randomize()
+  seconds = timeit.timeit(randomizer.validator.IsSeedValid,
+                          number=COMMAND_LINE_FLAGS.validator_runs)
+  print("%-30s %8.3f ms/call" %
+        ("Validator.IsSeedValid", 1e3 * seconds / COMMAND_LINE_FLAGS.validator_runs))
+
+
+def main(unused_argv: Any) -> None:
+  log.set_verbosity(log.WARNING)
+  TimeAddingItems()
+  TimeChecks()
+  TimeValidator()
+
+
+if __name__ == '__main__':
+  app.run(main)
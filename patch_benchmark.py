@@ -0,0 +1,52 @@
+import json
+import statistics
+import timeit
+from absl import app
+from absl import flags
+from typing import Any, List
+
+from randomizer.logic.main import ZoraRandomizer
+from randomizer.logic.patch import PatchJSONEncoder
+from randomizer.logic.settings import Settings
+
+flags.DEFINE_list(name='seeds',
+                  default=['2', '3', '4', '5', '9', '10', '13'],
+                  help='The seed numbers to generate.')
+flags.DEFINE_string(name='flag_string',
+                    default='',
+                    help='The flags to use when randomizing the game')
+flags.DEFINE_integer(name='number', default=20, help='How many times to call GetPatch() per seed.')
+COMMAND_LINE_FLAGS = flags.FLAGS
+
+
+def main(unused_argv: Any) -> None:
+  times: List[float] = []
+  json_times: List[float] = []
+  entries: List[int] = []
+  json_sizes: List[int] = []
+  binary_sizes: List[int] = []
+  for seed in COMMAND_LINE_FLAGS.seeds:
+    randomizer = ZoraRandomizer(Settings(seed=int(seed), flag_string=COMMAND_LINE_FLAGS.flag_string))
+    randomizer.Randomize()
+    # Each call draws from the seed's generator, so only the first patch is the seed's own.
+    patch = randomizer.GetPatch()
+    entries.append(len(patch.GetAddresses()))
+    json_sizes.append(len(json.dumps(patch, cls=PatchJSONEncoder)))
+    binary_sizes.append(len(patch.ToBytes()))
+    seconds = timeit.timeit(randomizer.GetPatch, number=COMMAND_LINE_FLAGS.number)
+    times.append(seconds / COMMAND_LINE_FLAGS.number)
+    seconds = timeit.timeit(lambda: json.dumps(randomizer.GetPatch(), cls=PatchJSONEncoder),
+                            number=COMMAND_LINE_FLAGS.number)
+    json_times.append(seconds / COMMAND_LINE_FLAGS.number)
+
+  print("GetPatch()        mean %8.2f ms  median %8.2f ms" %
+        (1000 * statistics.mean(times), 1000 * statistics.median(times)))
+  print("GetPatch() + JSON mean %8.2f ms  median %8.2f ms" %
+        (1000 * statistics.mean(json_times), 1000 * statistics.median(json_times)))
+  print("Patch entries     mean %8.1f" % statistics.mean(entries))
+  print("JSON size         mean %8.0f bytes" % statistics.mean(json_sizes))
+  print("Binary size       mean %8.0f bytes" % statistics.mean(binary_sizes))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,179 @@
+import collections
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Why a request was turned away.
+QUEUE_FULL = 'queue_full'
+CLIENT_LIMIT = 'client_limit'
+WAIT_TIMEOUT = 'wait_timeout'
+
+
+class Overloaded(Exception):
+    """A request was turned away because the process is generating as many seeds as it can."""
+
+    def __init__(self, message, reason, retry_after):
+        """
+        Args:
+            message (str): What happened.
+            reason (str): QUEUE_FULL, CLIENT_LIMIT or WAIT_TIMEOUT.
+            retry_after (int): Seconds the client should wait before trying again.
+        """
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, client):
+        self.client = client
+        self.admitted = False
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    """
+    Limits how many seeds a process generates at once.  Requests over the limit wait in a short
+    queue, and once that is full they are turned away straight away, rather than piling up until
+    the server times them all out.
+
+    Each client may only have so many generations running or waiting, and a slot that frees up goes
+    to the waiting request whose client has the fewest generations running (the longest waiting of
+    those), so that one client sending a lot of requests doesn't crowd out the others.  Like the
+    result cache, this is per process.
+    """
+
+    # Number of recent generation times that Retry-After estimates are based on.
+    RECENT_GENERATIONS = 20
+    # Assumed generation time until there are recent ones to go by.
+    DEFAULT_GENERATION_TIME = 1.0
+
+    def __init__(self, max_running, max_waiting, max_per_client, max_wait):
+        """
+        Args:
+            max_running (int): Generations that may run at once.
+            max_waiting (int): Requests that may wait for one of them to finish.
+            max_per_client (int): Generations each client may have running or waiting.
+            max_wait (float): Seconds a request waits before it's turned away.
+        """
+        self.max_running = max_running
+        self.max_waiting = max_waiting
+        self.max_per_client = max_per_client
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        # Client -> number of its generations running / waiting.
+        self._running = collections.Counter()
+        self._waiting_per_client = collections.Counter()
+        self._running_count = 0
+        # Waiting requests, in the order they arrived.
+        self._waiting = []
+        self._generation_times = collections.deque(maxlen=self.RECENT_GENERATIONS)
+        self.admitted = 0
+        self.waited = 0
+        self.shed = collections.Counter()
+
+    @contextmanager
+    def admit(self, client):
+        """
+        Wait for a slot for the client, and hold it for the duration of the with block.
+
+        Args:
+            client (str): Who the request is from.
+
+        Raises:
+            Overloaded: The request was turned away.
+
+        """
+        self._acquire(client)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(client, time.monotonic() - start_time)
+
+    def _acquire(self, client):
+        with self._lock:
+            # Even with slots free, so that one client can't take all of them.
+            if self._running[client] + self._waiting_per_client[client] >= self.max_per_client:
+                raise self._shed(CLIENT_LIMIT, "Too many seeds are being generated for you")
+            if self._running_count < self.max_running and not self._waiting:
+                self._start(client)
+                return
+            if len(self._waiting) >= self.max_waiting:
+                raise self._shed(QUEUE_FULL, "Too many seeds are being generated")
+            waiter = _Waiter(client)
+            self._waiting.append(waiter)
+            self._waiting_per_client[client] += 1
+            self.waited += 1
+
+        if waiter.event.wait(self.max_wait):
+            return
+        with self._lock:
+            # The slot may have been granted just as the wait ran out.
+            if waiter.admitted:
+                return
+            self._remove_waiter(waiter)
+            raise self._shed(WAIT_TIMEOUT, "Timed out waiting for other seeds to be generated")
+
+    def _release(self, client, generation_time):
+        with self._lock:
+            self._generation_times.append(generation_time)
+            self._running[client] -= 1
+            if not self._running[client]:
+                del self._running[client]
+            self._running_count -= 1
+            while self._waiting and self._running_count < self.max_running:
+                waiter = min(self._waiting, key=lambda w: self._running[w.client])
+                self._remove_waiter(waiter)
+                self._start(waiter.client)
+                waiter.admitted = True
+                waiter.event.set()
+
+    def _start(self, client):
+        self._running[client] += 1
+        self._running_count += 1
+        self.admitted += 1
+
+    def _remove_waiter(self, waiter):
+        self._waiting.remove(waiter)
+        self._waiting_per_client[waiter.client] -= 1
+        if not self._waiting_per_client[waiter.client]:
+            del self._waiting_per_client[waiter.client]
+
+    def _shed(self, reason, message):
+        self.shed[reason] += 1
+        return Overloaded(message, reason, self._estimate_retry_after())
+
+    def _average_generation_time(self):
+        if not self._generation_times:
+            return self.DEFAULT_GENERATION_TIME
+        return sum(self._generation_times) / len(self._generation_times)
+
+    def _estimate_retry_after(self):
+        """Guess how long it'll take for the requests already waiting to get through."""
+        ahead = len(self._waiting) + 1
+        return max(1, math.ceil(self._average_generation_time() * ahead /
+                                max(self.max_running, 1)))
+
+    def estimate_retry_after(self):
+        """Return a guess at how many seconds a new request would wait for a slot, at least 1."""
+        with self._lock:
+            return self._estimate_retry_after()
+
+    def get_stats(self):
+        """Return the current queue depth and the counters of admitted and shed requests."""
+        with self._lock:
+            return {
+                'running': self._running_count,
+                'waiting': len(self._waiting),
+                'clients': len(set(self._running) | set(self._waiting_per_client)),
+                'admitted': self.admitted,
+                'waited': self.waited,
+                'shed': {reason: self.shed[reason]
+                         for reason in (QUEUE_FULL, CLIENT_LIMIT, WAIT_TIMEOUT)},
+                'average_generation_ms': round(self._average_generation_time() * 1000, 1),
+                'max_running': self.max_running,
+                'max_waiting': self.max_waiting,
+                'max_per_client': self.max_per_client,
+            }
@@ -12,3 +12,4 @@ class GenerateForm(forms.Form):
     flags = forms.Field(required=False, initial='')
     debug_mode = forms.BooleanField(required=False, initial=False)
     race_mode = forms.BooleanField(required=False, initial=False)
+    stats = forms.BooleanField(required=False, initial=False)
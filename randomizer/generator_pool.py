@@ -0,0 +1,299 @@
+"""
+Talking to the generator daemon run by "manage.py run_generator_pool" over its Unix socket.
+
+Each message is a 4-byte big-endian length followed by that many bytes.  A request is one message, a
+JSON object with the seed, flag string, mode, debug mode and time budget.  The response is a JSON
+message with either an error, or the generation stats followed by a second message holding the patch
+as Patch.ToBytes() output.  A connection can carry any number of requests, one after another.  A
+client that closes its connection while its seed is being generated cancels the generation.
+"""
+import json
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+
+from .logic.flags import FlagError
+from .logic.main import ZoraRandomizer
+from .logic.patch import Patch
+from .logic.settings import Settings
+from .logic.stats import (GenerationAbortedError, GenerationBudget, GenerationCancelledError,
+                          GenerationStats, GenerationTimeoutError)
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('>I')
+# Much more than any patch, but little enough that a garbled length can't exhaust memory.
+MAX_MESSAGE_LENGTH = 16 * 1024 * 1024
+
+
+class GeneratorPoolError(Exception):
+    """The generator daemon failed to generate a seed it was asked for."""
+
+
+class GeneratorPoolUnavailableError(GeneratorPoolError):
+    """The generator daemon isn't running, so the seed wasn't even asked for."""
+
+
+def send_message(sock, payload):
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _receive_exactly(sock, length):
+    data = bytearray(length)
+    view = memoryview(data)
+    received = 0
+    while received < length:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise GeneratorPoolError("Connection closed in the middle of a message")
+        received += count
+    return bytes(data)
+
+
+def receive_message(sock):
+    """
+    Returns:
+        bytes: The message, or None if the connection was closed before it started.
+
+    """
+    header = sock.recv(_LENGTH.size, socket.MSG_WAITALL)
+    if not header:
+        return None
+    if len(header) < _LENGTH.size:
+        header += _receive_exactly(sock, _LENGTH.size - len(header))
+    (length,) = _LENGTH.unpack(header)
+    if length > MAX_MESSAGE_LENGTH:
+        raise GeneratorPoolError("Message of {} bytes is too long".format(length))
+    return _receive_exactly(sock, length)
+
+
+def is_connection_closed(sock):
+    """
+    Check whether the other end has closed a connection it isn't expected to send anything on, e.g.
+    because it's waiting for a response.
+
+    Returns:
+        bool: True if it's closed, False if it's open or there's no telling.
+
+    """
+    try:
+        (readable, _, _) = select.select([sock], [], [], 0)
+        return bool(readable) and not sock.recv(1, socket.MSG_PEEK)
+    except OSError:
+        return True
+    except ValueError:
+        # The socket is already closed on this end, or doesn't allow peeking (e.g. TLS).
+        return False
+
+
+def _stats_for_json(stats):
+    return {'phase_times': stats.phase_times, 'attempts': stats.attempts}
+
+
+def _stats_from_json(response):
+    stats = GenerationStats()
+    stats.phase_times.update(response['phase_times'])
+    stats.attempts.update(response['attempts'])
+    return stats
+
+
+def handle_request(payload, is_cancelled=None):
+    """
+    Generate the seed a request asks for.  This is what the daemon's workers run.
+
+    Args:
+        payload (bytes): The request message.
+        is_cancelled (callable): Tells whether the client has given up on the seed.
+
+    Returns:
+        list[bytes]: The response messages.
+
+    """
+    request = json.loads(payload)
+    budget = GenerationBudget(request.get('budget'), is_cancelled)
+    try:
+        randomizer = ZoraRandomizer(Settings(request['seed'], request['flag_string'],
+                                             request['mode'], request['debug_mode']))
+        stats = randomizer.Randomize(budget)
+        patch = randomizer.GetPatch()
+    except FlagError as e:
+        return [json.dumps({'error': e.args[0], 'flag_error': True}).encode()]
+    except GenerationAbortedError as e:
+        return [json.dumps(dict(_stats_for_json(e.stats), error=e.args[0],
+                                aborted=e.stats.aborted)).encode()]
+    except Exception as e:
+        logger.exception("Generating {!r} failed".format(request))
+        return [json.dumps({'error': repr(e)}).encode()]
+    return [json.dumps(_stats_for_json(stats)).encode(), patch.ToBytes()]
+
+
+def serve_connection(sock):
+    """Answer requests on a connection until the client closes it."""
+    with sock:
+        while True:
+            payload = receive_message(sock)
+            if payload is None:
+                return
+            for message in handle_request(payload, lambda: is_connection_closed(sock)):
+                send_message(sock, message)
+
+
+class GeneratorPoolClient:
+    """
+    Client for the generator daemon, which keeps connections open between requests.  It can be
+    shared by the threads of a web worker: each request takes a connection of its own.
+    """
+
+    def __init__(self, path, timeout, max_idle_connections=4):
+        """
+        Args:
+            path (str): The daemon's socket.
+            timeout (float): Seconds to wait for the daemon to accept or answer a request.
+            max_idle_connections (int): How many connections to keep open between requests.
+        """
+        self.path = path
+        self.timeout = timeout
+        self.max_idle_connections = max_idle_connections
+        self._lock = threading.Lock()
+        self._idle_connections = []
+
+    def close(self):
+        """Close the connections kept open between requests."""
+        with self._lock:
+            idle_connections, self._idle_connections = self._idle_connections, []
+        for sock in idle_connections:
+            sock.close()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _wait_for_response(self, sock, budget):
+        """
+        Wait until the daemon starts to answer, and close the connection (which makes the daemon
+        stop generating) if the request is cancelled first.
+        """
+        give_up_time = time.monotonic() + self.timeout
+        poll_interval = GenerationBudget.CANCELLATION_POLL_INTERVAL
+        while True:
+            (readable, _, _) = select.select([sock], [], [], poll_interval)
+            if readable:
+                return
+            if budget.IsCancelled():
+                stats = GenerationStats()
+                stats.aborted = 'cancelled'
+                raise GenerationCancelledError("Generation was cancelled", stats)
+            if time.monotonic() > give_up_time:
+                raise socket.timeout("Timed out waiting for the generator daemon")
+
+    def _request(self, sock, payload, budget):
+        send_message(sock, payload)
+        if budget is not None:
+            self._wait_for_response(sock, budget)
+        header = receive_message(sock)
+        if header is None:
+            raise GeneratorPoolError("The generator daemon closed the connection")
+        response = json.loads(header)
+        if 'error' in response:
+            return response, None
+        patch_data = receive_message(sock)
+        if patch_data is None:
+            raise GeneratorPoolError("The generator daemon closed the connection")
+        return response, patch_data
+
+    def generate(self, seed_settings, budget=None):
+        """
+        Have the daemon generate a seed.
+
+        Args:
+            seed_settings (randomizer.logic.settings.Settings): The seed's settings.
+            budget (GenerationBudget): How long the daemon may take to generate the seed, and
+                whether to stop it early.
+
+        Returns:
+            (randomizer.logic.patch.Patch, GenerationStats): The seed's patch, and where the
+                daemon's time went.
+
+        Raises:
+            FlagError: The flags are invalid.
+            GenerationAbortedError: The budget was used up, the daemon didn't answer in time, or
+                the request was cancelled.
+            GeneratorPoolUnavailableError: The daemon isn't there.
+            GeneratorPoolError: The daemon failed to generate the seed.
+
+        """
+        payload = json.dumps({
+            'seed': seed_settings.seed,
+            'flag_string': seed_settings.flag_string,
+            'mode': seed_settings.mode,
+            'debug_mode': seed_settings.debug_mode,
+            # What's left of it, rather than all of it, since the request may wait to be accepted.
+            'budget': budget.Remaining() if budget is not None else None,
+        }).encode()
+
+        with self._lock:
+            sock = self._idle_connections.pop() if self._idle_connections else None
+        try:
+            if sock is not None:
+                try:
+                    response, patch_data = self._request(sock, payload, budget)
+                except (socket.timeout, GenerationCancelledError):
+                    raise
+                except (OSError, GeneratorPoolError):
+                    # The daemon may have restarted since the connection was last used.
+                    sock.close()
+                    sock = None
+            if sock is None:
+                try:
+                    sock = self._connect()
+                except OSError as e:
+                    raise GeneratorPoolUnavailableError(
+                        "Can't connect to the generator daemon at {}: {!r}".format(self.path, e)
+                    ) from e
+                response, patch_data = self._request(sock, payload, budget)
+        except GeneratorPoolUnavailableError:
+            raise
+        except GenerationCancelledError:
+            # Closing the connection tells the daemon to stop.
+            sock.close()
+            raise
+        except socket.timeout as e:
+            # The daemon has the request, so there's no point generating the seed here as well.
+            sock.close()
+            stats = GenerationStats()
+            stats.aborted = 'timeout'
+            message = "The generator daemon didn't answer within {:g}s".format(self.timeout)
+            raise GenerationTimeoutError(message, stats) from e
+        except (OSError, GeneratorPoolError, ValueError) as e:
+            if sock is not None:
+                sock.close()
+            raise GeneratorPoolError(
+                "Generator daemon at {} failed: {!r}".format(self.path, e)) from e
+
+        with self._lock:
+            if len(self._idle_connections) < self.max_idle_connections:
+                self._idle_connections.append(sock)
+                sock = None
+        if sock is not None:
+            sock.close()
+
+        if response.get('flag_error'):
+            raise FlagError(response['error'])
+        if response.get('aborted'):
+            stats = _stats_from_json(response)
+            stats.aborted = response['aborted']
+            error_class = (GenerationTimeoutError if stats.aborted == 'timeout' else
+                           GenerationCancelledError)
+            raise error_class(response['error'], stats)
+        if 'error' in response:
+            raise GeneratorPoolError("Generator daemon failed: {}".format(response['error']))
+        return Patch.FromBytes(patch_data), _stats_from_json(response)
@@ -0,0 +1,162 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import mmap
+import struct
+import zlib
+
+from .patch import Patch
+
+# A seed archive is one file holding many pre-generated patches, laid out as:
+#
+#   header     magic, format version, entry count, and where the string table and index are
+#   data       each patch as zlib-compressed Patch.ToBytes() output, back to back
+#   strings    JSON lists of the archive's versions and (normalized) flag strings
+#   index      a fixed-width entry per patch, sorted by key, so it can be binary searched in place
+#
+# An index entry's key is (version id, seed, flag string id), where the ids are positions in the
+# string table.  Since the key is packed big-endian at the start of the entry, sorting the entries'
+# bytes sorts them by key.
+#
+# The archive is meant to be memory-mapped, so that looking up a seed only touches the pages of the
+# index that the search visits and the patch itself.
+
+ARCHIVE_MAGIC = b'ZORA'
+ARCHIVE_FORMAT_VERSION = 1
+
+# (version, seed, flag string) of a patch in an archive.
+ArchiveKey = Tuple[str, int, str]
+
+
+class ArchiveError(ValueError):
+  pass
+
+
+_HEADER = struct.Struct('>4sH2xIQIQ')
+_INDEX_ENTRY = struct.Struct('>HIHQII')
+_INDEX_KEY = struct.Struct('>HIH')
+
+
+def WriteSeedArchive(filename: str, patches: Iterable[Tuple[ArchiveKey, bytes]]) -> int:
+  """Writes a seed archive.
+
+  Args:
+    filename: The archive to write.
+    patches: The key of each patch, along with the patch as zlib-compressed Patch.ToBytes() output
+      (which is how the website stores patches too).  They can come in any order.
+
+  Returns:
+    The number of patches in the archive.
+  """
+  versions: Dict[str, int] = {}
+  flag_strings: Dict[str, int] = {}
+  entries: List[bytes] = []
+  with open(filename, 'wb') as archive:
+    # The header is rewritten at the end, once the string table and index have been placed.
+    archive.write(bytes(_HEADER.size))
+    offset = _HEADER.size
+    for ((version, seed, flag_string), encoded_patch) in patches:
+      version_id = versions.setdefault(version, len(versions))
+      flag_string_id = flag_strings.setdefault(flag_string, len(flag_strings))
+      entries.append(
+          _INDEX_ENTRY.pack(version_id, seed, flag_string_id, offset, len(encoded_patch),
+                            zlib.crc32(encoded_patch)))
+      archive.write(encoded_patch)
+      offset += len(encoded_patch)
+
+    entries.sort()
+    for (entry, next_entry) in zip(entries, entries[1:]):
+      if entry[:_INDEX_KEY.size] == next_entry[:_INDEX_KEY.size]:
+        raise ArchiveError("Seed %d is in the archive more than once" %
+                           _INDEX_KEY.unpack_from(entry)[1])
+
+    strings = json.dumps({
+        'versions': list(versions),
+        'flag_strings': list(flag_strings),
+    }).encode()
+    archive.write(strings)
+    archive.write(b''.join(entries))
+    archive.seek(0)
+    archive.write(
+        _HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_FORMAT_VERSION, len(entries), offset, len(strings),
+                     offset + len(strings)))
+  return len(entries)
+
+
+class SeedArchive:
+  """Reads patches from a seed archive written by WriteSeedArchive(), through a memory map."""
+
+  def __init__(self, filename: str) -> None:
+    self.filename = filename
+    with open(filename, 'rb') as archive:
+      self._mmap = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      if len(self._mmap) < _HEADER.size:
+        raise ArchiveError("%s is too short to be a seed archive" % filename)
+      (magic, format_version, self._num_entries, strings_offset, strings_length,
+       self._index_offset) = _HEADER.unpack_from(self._mmap)
+      if magic != ARCHIVE_MAGIC or format_version != ARCHIVE_FORMAT_VERSION:
+        raise ArchiveError("%s isn't a version %d seed archive" %
+                           (filename, ARCHIVE_FORMAT_VERSION))
+      if self._index_offset + self._num_entries * _INDEX_ENTRY.size > len(self._mmap):
+        raise ArchiveError("%s is truncated" % filename)
+      strings = json.loads(self._mmap[strings_offset:strings_offset + strings_length])
+    except Exception:
+      self._mmap.close()
+      raise
+    self._version_ids = {version: id for (id, version) in enumerate(strings['versions'])}
+    self._flag_string_ids = {
+        flag_string: id for (id, flag_string) in enumerate(strings['flag_strings'])
+    }
+
+  def __len__(self) -> int:
+    return self._num_entries
+
+  def __enter__(self) -> "SeedArchive":
+    return self
+
+  def __exit__(self, *unused_exc_info: object) -> None:
+    self.Close()
+
+  def Close(self) -> None:
+    self._mmap.close()
+
+  def _FindEntry(self, version: str, seed: int, flag_string: str) -> Optional[Tuple[int, int, int]]:
+    """Binary searches the index for a key.  Returns the patch's offset, length and CRC-32."""
+    if (version not in self._version_ids or flag_string not in self._flag_string_ids or
+        not 0 <= seed <= 0xFFFFFFFF):
+      return None
+    key = _INDEX_KEY.pack(self._version_ids[version], seed, self._flag_string_ids[flag_string])
+    low = 0
+    high = self._num_entries
+    while low < high:
+      middle = (low + high) // 2
+      entry_offset = self._index_offset + middle * _INDEX_ENTRY.size
+      entry_key = self._mmap[entry_offset:entry_offset + _INDEX_KEY.size]
+      if entry_key < key:
+        low = middle + 1
+      elif entry_key > key:
+        high = middle
+      else:
+        return _INDEX_ENTRY.unpack_from(self._mmap, entry_offset)[3:]
+    return None
+
+  def GetEncodedPatch(self, version: str, seed: int, flag_string: str) -> Optional[bytes]:
+    """Returns the zlib-compressed Patch.ToBytes() output of a seed, or None if it isn't there."""
+    entry = self._FindEntry(version, seed, flag_string)
+    if entry is None:
+      return None
+    (offset, length, crc) = entry
+    encoded_patch = self._mmap[offset:offset + length]
+    if zlib.crc32(encoded_patch) != crc:
+      raise ArchiveError("Seed %d in %s is corrupt" % (seed, self.filename))
+    return encoded_patch
+
+  def GetPatch(self, version: str, seed: int, flag_string: str) -> Optional[Patch]:
+    """Returns the patch of a seed, or None if it isn't in the archive.
+
+    The flag string has to be normalized, as Settings.flag_string is.
+    """
+    encoded_patch = self.GetEncodedPatch(version, seed, flag_string)
+    if encoded_patch is None:
+      return None
+    return Patch.FromBytes(zlib.decompress(encoded_patch))
@@ -74,10 +74,10 @@ class WallType(IntEnum):
     return 'Q'
 
   @classmethod
-  def RandomValue(cls) -> "WallType":
+  def RandomValue(cls, rng: random.Random) -> "WallType":
     while True:
       try:
-        return cls(random.randrange(0x0, 0x7))
+        return cls(rng.randrange(0x0, 0x7))
       except ValueError:
         continue
 
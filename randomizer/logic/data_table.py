@@ -1,4 +1,5 @@
 import math
+import os
 import random
 import sys
 from typing import Dict, List, Tuple, Union
@@ -11,6 +12,21 @@ from .location import Location
 from .patch import Patch
 from .room import Room
 
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def _ReadVanillaData(filename: str, num_bytes: int) -> bytes:
+  with open(os.path.join(DATA_DIRECTORY, filename), 'rb') as data_file:
+    return data_file.read(num_bytes)
+
+
+# The vanilla tables are read once per process and never modified. Each DataTable makes its own
+# mutable copies, and pre-forked server workers share these pages with the parent process.
+VANILLA_OVERWORLD_DATA = _ReadVanillaData('overworld-data.bin', 0x300)
+VANILLA_LEVEL_1_TO_6_DATA = _ReadVanillaData('level-1-6-data.bin', 0x300)
+VANILLA_LEVEL_7_TO_9_DATA = _ReadVanillaData('level-7-9-data.bin', 0x300)
+VANILLA_LEVEL_METADATA = _ReadVanillaData('level-metadata.bin', 0x9D8)
+
 
 class DataTable():
   NES_FILE_OFFSET = 0x10
@@ -68,11 +84,12 @@ class DataTable():
       SpriteSet.PATRA_SPRITE_SET: [0xDB, 0xA7]
   }
 
-  def __init__(self) -> None:
-    self.overworld_raw_data = list(open("randomizer/data/overworld-data.bin", 'rb').read(0x300))
-    self.level_1_to_6_raw_data = list(open("randomizer/data/level-1-6-data.bin", 'rb').read(0x300))
-    self.level_7_to_9_raw_data = list(open("randomizer/data/level-7-9-data.bin", 'rb').read(0x300))
-    self.level_metadata = list(open("randomizer/data/level-metadata.bin", 'rb').read(0x9D8))
+  def __init__(self, rng: random.Random) -> None:
+    self.rng = rng
+    self.overworld_raw_data = list(VANILLA_OVERWORLD_DATA)
+    self.level_1_to_6_raw_data = VANILLA_LEVEL_1_TO_6_DATA
+    self.level_7_to_9_raw_data = VANILLA_LEVEL_7_TO_9_DATA
+    self.level_metadata = list(VANILLA_LEVEL_METADATA)
     self.overworld_caves: List[Cave] = []
     self.level_1_to_6_rooms: List[Room] = []
     self.level_7_to_9_rooms: List[Room] = []
@@ -112,10 +129,10 @@ class DataTable():
     self._ReadOverworldData()
     self.level_1_to_6_rooms = self._ReadDataForLevelGrid(self.level_1_to_6_raw_data)
     self.level_7_to_9_rooms = self._ReadDataForLevelGrid(self.level_7_to_9_raw_data)
-    self.level_metadata = list(open("randomizer/data/level-metadata.bin", 'rb').read(0x9D8))
+    self.level_metadata = list(VANILLA_LEVEL_METADATA)
     self.sprite_set_patch = Patch()
 
-  def _ReadDataForLevelGrid(self, level_data: List[int]) -> List[Room]:
+  def _ReadDataForLevelGrid(self, level_data: bytes) -> List[Room]:
     rooms: List[Room] = []
     for room_num in Range.VALID_ROOM_NUMBERS:
       room_data: List[int] = []
@@ -194,18 +211,18 @@ class DataTable():
   def AdjustHungryEnemyForSpriteSet(self, sprite_set: SpriteSet) -> None:
     sprite_code = 0xB4  # Wizzrobe
     if sprite_set == SpriteSet.DARKNUT_SPRITE_SET:
-      sprite_code = random.choice([0xAC, 0xB0])  # Gibdo, Darknut
+      sprite_code = self.rng.choice([0xAC, 0xB0])  # Gibdo, Darknut
     elif sprite_set == SpriteSet.GORIYA_SPRITE_SET:
-      sprite_code = random.choice([0xAC, 0xB0])  # Rope, Stalfos, Wallmaster, Goriya
+      sprite_code = self.rng.choice([0xAC, 0xB0])  # Rope, Stalfos, Wallmaster, Goriya
     self.misc_data_patch.AddData(self.HUNGRY_ENEMY_SPRITE_CODE_ADDRESS, [sprite_code])
 
   def RandomizeBombUpgrades(self) -> None:
     done = False
     while not done:
-      price = random.randrange(75, 125)
+      price = self.rng.randrange(75, 125)
       if price == 100:
         continue
-      quantity = random.randrange(2, 6)
+      quantity = self.rng.randrange(2, 6)
       if price not in range(110, 126) or quantity not in [2, 3]:
         done = True
     self.misc_data_patch.AddData(self.BOMB_UPGRADE_PRICE_ADDRESS, [price])
@@ -221,9 +238,9 @@ class DataTable():
     # Change white and magical sword heart container requirements.
     # Note that it's stored in the upper 4 bits, not the lower 4 bits, of that byte
     self.misc_data_patch.AddData(self.WHITE_SWORD_REQUIRED_HEARTS_ADDRESS,
-                                 [random.randrange(4, 6) * 0x10])
+                                 [self.rng.randrange(4, 6) * 0x10])
     self.misc_data_patch.AddData(self.MAGICAL_SWORD_REQUIRED_HEARTS_ADDRESS,
-                                 [random.randrange(8, 12) * 0x10])
+                                 [self.rng.randrange(8, 12) * 0x10])
 
   def SetBombUpgradeLevel(self, level_num: int, first_upgrader: bool) -> None:
     address = self.FIRST_BOMB_UPGRADE_LEVEL_ADDRESS if first_upgrader else self.SECOND_BOMB_UPGRADE_LEVEL_ADDRESS
@@ -371,10 +388,10 @@ class DataTable():
 
   def SetItemPositionsForLevel(self, level_num: LevelNum, item_positions: List[int]) -> None:
     enemy_quantities = []
-    enemy_quantities.append(random.randrange(1, 3))
-    enemy_quantities.append(random.randrange(3, 5))
-    enemy_quantities.append(random.randrange(5, 7))
-    enemy_quantities.append(random.randrange(6, 8))
+    enemy_quantities.append(self.rng.randrange(1, 3))
+    enemy_quantities.append(self.rng.randrange(3, 5))
+    enemy_quantities.append(self.rng.randrange(5, 7))
+    enemy_quantities.append(self.rng.randrange(6, 8))
     enemy_quantities.sort()
 
     assert item_positions[0] == 0x89
@@ -445,3 +462,14 @@ class DataTable():
           self._GetOverworldCaveDataIndex(cave_type, 0, is_second_byte=True),
           self.overworld_caves[cave_num].GetPriceData())
     return patch
+
+
+# The vanilla tables, as a patch writing them where they are in the ROM.  Bytes of a seed's patch
+# that match it can be left out, since the ROM already has them.
+VANILLA_DATA_PATCH = Patch()
+VANILLA_DATA_PATCH.AddData(DataTable.OVERWORLD_DATA_START_ADDRESS, VANILLA_OVERWORLD_DATA)
+VANILLA_DATA_PATCH.AddData(DataTable.LEVEL_1_TO_6_DATA_START_ADDRESS, VANILLA_LEVEL_1_TO_6_DATA)
+VANILLA_DATA_PATCH.AddData(DataTable.LEVEL_7_TO_9_DATA_START_ADDRESS, VANILLA_LEVEL_7_TO_9_DATA)
+VANILLA_DATA_PATCH.AddData(DataTable.LEVEL_METADATA_ADDRESS, VANILLA_LEVEL_METADATA)
+# Merge the writes now, since the patch is shared between threads.
+VANILLA_DATA_PATCH.GetRuns()
@@ -65,5 +65,5 @@ class Direction(IntEnum):
     return self in [Direction.NORTH, Direction.WEST, Direction.EAST, Direction.SOUTH]
 
   @classmethod
-  def RandomCardinalDirection(cls) -> "Direction":
-    return random.choice([Direction.NORTH, Direction.WEST, Direction.EAST, Direction.SOUTH])
+  def RandomCardinalDirection(cls, rng: random.Random) -> "Direction":
+    return rng.choice([Direction.NORTH, Direction.WEST, Direction.EAST, Direction.SOUTH])
@@ -16,6 +16,7 @@ from .location import Location
 from .room import Room
 from .room_type import RoomType
 from .settings import Settings
+from .stats import GenerationStats
 
 COLORS: Dict[int, "Fore"] = {
     0: Fore.WHITE,
@@ -56,9 +57,12 @@ OK_BORDER_TYPES_FOR_TRANSPORT_STAIRCASE = [
 
 class LevelPlanGenerator:
 
-  def __init__(self, data_table: DataTable, settings: Settings) -> None:
+  def __init__(self, data_table: DataTable, settings: Settings, rng: random.Random,
+               stats: GenerationStats) -> None:
     self.data_table = data_table
     self.settings = settings
+    self.rng = rng
+    self.stats = stats
 
   def _GenerateStairwayItemPool(self) -> List[Item]:
     stairway_item_pool = [
@@ -66,7 +70,7 @@ class LevelPlanGenerator:
         Item.RED_CANDLE, Item.BOOMERANG, Item.BOOK, Item.MAGICAL_KEY, Item.RED_RING,
         Item.SILVER_ARROWS
     ]
-    random.shuffle(stairway_item_pool)
+    self.rng.shuffle(stairway_item_pool)
 
     return [
         Item.BOW,
@@ -91,8 +95,8 @@ class LevelPlanGenerator:
     enemy_sprite_set_pool: List[SpriteSet] = enemy_sprite_sets.copy()
     enemy_sprite_set_pool.extend(enemy_sprite_sets)
     for unused_counter in range(0, 3):
-      enemy_sprite_set_pool.append(random.choice(enemy_sprite_sets))
-    random.shuffle(enemy_sprite_set_pool)
+      enemy_sprite_set_pool.append(self.rng.choice(enemy_sprite_sets))
+    self.rng.shuffle(enemy_sprite_set_pool)
     return enemy_sprite_set_pool
 
   def _GenerateBossSpriteSetAssignments(self) -> List[SpriteSet]:
@@ -103,11 +107,11 @@ class LevelPlanGenerator:
     boss_sprite_set_pool.extend(boss_sprite_sets)
     for unused_counter in range(0, 3):
       boss_sprite_set_pool.append(
-          random.choice([SpriteSet.DODONGO_SPRITE_SET, SpriteSet.GLEEOK_SPRITE_SET]))
+          self.rng.choice([SpriteSet.DODONGO_SPRITE_SET, SpriteSet.GLEEOK_SPRITE_SET]))
 
-    random.shuffle(boss_sprite_set_pool)
+    self.rng.shuffle(boss_sprite_set_pool)
     while boss_sprite_set_pool[8] != SpriteSet.PATRA_SPRITE_SET:
-      random.shuffle(boss_sprite_set_pool)
+      self.rng.shuffle(boss_sprite_set_pool)
     return boss_sprite_set_pool
 
   def _GeneratePaletteAssignments(self) -> List[Tuple[int, int, int, int]]:
@@ -120,7 +124,7 @@ class LevelPlanGenerator:
                                                  (0x0C, 0x26, 0x23, 0x02), (0x0F, 0x05, 0x23, 0x01),
                                                  (0x0F, 0x08, 0x19, 0x01), (0x02, 0x2D, 0x1A, 0x02),
                                                  (0x07, 0x18, 0x38, 0x02)]
-    random.shuffle(palettes)
+    self.rng.shuffle(palettes)
     return palettes[:9]
 
   def GenerateLevelPlan(
@@ -162,9 +166,9 @@ class LevelPlanGenerator:
         Enemy.ELDER, Enemy.ELDER_2, Enemy.ELDER_3, Enemy.ELDER_4, Enemy.RUPEE_BOSS, Enemy.ELDER_6,
         Enemy.ELDER_8, Enemy.RUPEE_BOSS
     ]
-    random.shuffle(level_group_assignments)
-    random.shuffle(elder_group_a)
-    random.shuffle(elder_group_b)
+    self.rng.shuffle(level_group_assignments)
+    self.rng.shuffle(elder_group_a)
+    self.rng.shuffle(elder_group_b)
 
     for level_num in Range.VALID_LEVEL_NUMBERS:
       # Skip ELDER_1 in L9 since that's a triforce check which we place as a border
@@ -221,7 +225,8 @@ class LevelPlanGenerator:
     ]
     done = False
     while not done:
-      random.shuffle(blocking_border_type_pool)
+      self.stats.CountAttempt('level_plan_blocking_borders')
+      self.rng.shuffle(blocking_border_type_pool)
       done = True
       for level_num in Range.VALID_LEVEL_NUMBERS:
         if level_num == LevelNum.LEVEL_9:
@@ -244,7 +249,7 @@ class LevelPlanGenerator:
       item_pool: List[Item] = []
       stairway_rooms_to_assign = level_plan[level_num]['transport_stairway_room_nums'].copy()
 
-      border_pool.append(random.choice(minor_border_types))
+      border_pool.append(self.rng.choice(minor_border_types))
       blocking_border_type = blocking_border_type_pool.pop(0)
       border_pool.append(blocking_border_type)
 
@@ -264,8 +269,9 @@ class LevelPlanGenerator:
         item_pool.append(stairway_item_pool.pop(0))
 
       while True:
-        random.shuffle(border_pool)
-        random.shuffle(item_pool)
+        self.stats.CountAttempt('level_plan_borders')
+        self.rng.shuffle(border_pool)
+        self.rng.shuffle(item_pool)
         if ((BorderType.LOCKED_DOOR in border_pool or Item.KEY in item_pool) and
             border_pool.index(BorderType.LOCKED_DOOR) != item_pool.index(Item.KEY)):
           continue
@@ -290,12 +296,13 @@ class LevelPlanGenerator:
       log.info("target num rooms: %d" % target_num_rooms)
       num_rooms: List[int] = []
       while True:
+        self.stats.CountAttempt('level_plan_num_rooms')
         num_rooms = []
         for area_num in range(num_areas):
           if area_num == num_areas - 1:
             num_rooms.append(1)
           else:
-            num_rooms.append(random.randrange(3, num_areas + level_num))
+            num_rooms.append(self.rng.randrange(3, num_areas + level_num))
         if 1 in num_rooms and sum(num_rooms) == target_num_rooms:
           log.info("Gotta plan! %s" % num_rooms)
           break
@@ -338,7 +345,7 @@ class LevelPlanGenerator:
       for area_num in range(num_areas):
         if num_rooms[area_num] != 1:
           path_length_max = max(3, num_rooms[area_num] - 2, 3)
-          level_plan[level_num][str(area_num + 1)]['path_length'] = random.randrange(
+          level_plan[level_num][str(area_num + 1)]['path_length'] = self.rng.randrange(
               2, path_length_max)
           level_plan[level_num][str(area_num + 1)]['stairway_border'] = False
         else:
@@ -372,12 +379,16 @@ class LevelPlanGenerator:
 
 class DungeonGenerator:
 
-  def __init__(self, data_table: DataTable, settings: Settings) -> None:
+  def __init__(self, data_table: DataTable, settings: Settings, rng: random.Random,
+               stats: GenerationStats) -> None:
     self.data_table = data_table
     self.settings = settings
-    self.grid_generator_a: GridGenerator = GridGenerator(self.data_table)
-    self.grid_generator_b: GridGenerator = GridGenerator(self.data_table)
-    self.level_plan_generator = LevelPlanGenerator(self.data_table, self.settings)
+    self.rng = rng
+    self.stats = stats
+    self.grid_generator_a: GridGenerator = GridGenerator(self.data_table, self.rng, self.stats)
+    self.grid_generator_b: GridGenerator = GridGenerator(self.data_table, self.rng, self.stats)
+    self.level_plan_generator = LevelPlanGenerator(self.data_table, self.settings, self.rng,
+                                                   self.stats)
     self.level_plan: Dict[Union[LevelNum, str], Any] = {}
 
     # The following lists have placeholder values for one-indexing
@@ -401,13 +412,16 @@ class DungeonGenerator:
     for level_num in Range.VALID_LEVEL_NUMBERS:
       positions = [
           0x89,
-          RoomType.GetValidPositionForRoomTypes(RoomType.CIRCLE_BLOCK_WALL_ROOM,
+          RoomType.GetValidPositionForRoomTypes(self.rng,
+                                                RoomType.CIRCLE_BLOCK_WALL_ROOM,
                                                 RoomType.ZIGZAG_ROOM,
                                                 is_item_position=True),
-          RoomType.GetValidPositionForRoomTypes(RoomType.VERTICAL_LINES,
+          RoomType.GetValidPositionForRoomTypes(self.rng,
+                                                RoomType.VERTICAL_LINES,
                                                 RoomType.SINGLE_SIX_BLOCK_ROOM,
                                                 is_item_position=True),
-          RoomType.GetValidPositionForRoomTypes(RoomType.HORIZONTAL_LINES,
+          RoomType.GetValidPositionForRoomTypes(self.rng,
+                                                RoomType.HORIZONTAL_LINES,
                                                 RoomType.SPIRAL_STAIR_ROOM,
                                                 is_item_position=True)
       ]
@@ -419,7 +433,7 @@ class DungeonGenerator:
         if room_type == RoomType.TURNSTILE_ROOM:
           continue
         room_type = RoomType(room_type)
-        random.shuffle(values)
+        self.rng.shuffle(values)
         for v in values:
           if RoomType.IsValidPositionForRoomType(positions[v], room_type, is_item_position=True):
             self.item_position_dict[level_num][room_type] = v
@@ -480,33 +494,39 @@ class DungeonGenerator:
   ## End of Helper Methods ##
 
   def Generate(self) -> None:
-    self.grid_generator_a.GenerateLevelGrid(num_levels=6,
-                                            min_level_size=15,
-                                            max_level_size=28,
-                                            num_stairway_rooms=8)
-    self.grid_generator_a.GenerateMapData(is_7_to_9=False)
-    self.grid_generator_a.Print()
-    self.level_rooms_a = self.grid_generator_a.GetLevelRoomNumbers()
-
-    self.grid_generator_b.GenerateLevelGrid(num_levels=3,
-                                            min_level_size=30,
-                                            max_level_size=60,
-                                            num_stairway_rooms=12)
-    self.grid_generator_b.AddSixToLevelNumbers()
-    self.grid_generator_b.GenerateMapData(is_7_to_9=True)
-    self.grid_generator_b.Print()
-    self.level_rooms_b = self.grid_generator_b.GetLevelRoomNumbers()
-    self.GenerateItemPositions()
-    self.level_plan = self.level_plan_generator.GenerateLevelPlan(
-        self._GetNumberOfRoomsPerLevel(), self._GetStairwayRoomsForGrid(GridId.GRID_A),
-        self._GetStairwayRoomsForGrid(GridId.GRID_B))
-
-    self.GenerateLevelStartRooms()
-    self.CreateLevelRooms()
-    self.GenerateLevels()
-    self.RandomizeOverworldCaves()
-    self.RandomizeShops()
-    self.data_table.RandomizeBombUpgrades()
+    with self.stats.Time('grid'):
+      self.grid_generator_a.GenerateLevelGrid(num_levels=6,
+                                              min_level_size=15,
+                                              max_level_size=28,
+                                              num_stairway_rooms=8)
+      self.grid_generator_a.GenerateMapData(is_7_to_9=False)
+      self.grid_generator_a.Print()
+      self.level_rooms_a = self.grid_generator_a.GetLevelRoomNumbers()
+
+      self.grid_generator_b.GenerateLevelGrid(num_levels=3,
+                                              min_level_size=30,
+                                              max_level_size=60,
+                                              num_stairway_rooms=12)
+      self.grid_generator_b.AddSixToLevelNumbers()
+      self.grid_generator_b.GenerateMapData(is_7_to_9=True)
+      self.grid_generator_b.Print()
+      self.level_rooms_b = self.grid_generator_b.GetLevelRoomNumbers()
+
+    with self.stats.Time('level_plan'):
+      self.GenerateItemPositions()
+      self.level_plan = self.level_plan_generator.GenerateLevelPlan(
+          self._GetNumberOfRoomsPerLevel(), self._GetStairwayRoomsForGrid(GridId.GRID_A),
+          self._GetStairwayRoomsForGrid(GridId.GRID_B))
+
+    with self.stats.Time('room_trees'):
+      self.GenerateLevelStartRooms()
+      self.CreateLevelRooms()
+      self.GenerateLevels()
+
+    with self.stats.Time('overworld'):
+      self.RandomizeOverworldCaves()
+      self.RandomizeShops()
+      self.data_table.RandomizeBombUpgrades()
 
   def CreateLevelRooms(self) -> None:
     for grid_id in [GridId.GRID_A, GridId.GRID_B]:
@@ -552,7 +572,7 @@ class DungeonGenerator:
           if (potential_gateway not in Range.VALID_ROOM_NUMBERS or
               level_num != self._GetLevelNumForRoomNum(potential_gateway, grid_id)):
             possible_start_rooms.append((room_num, entrance_direction))
-    return random.choice(possible_start_rooms)
+    return self.rng.choice(possible_start_rooms)
 
   def _GetColorForPrinting(self, room_num: RoomNum, level_num: Optional[LevelNum] = None) -> Fore:
     grid_gen = self._GetGridGenerator(level_num)
@@ -638,26 +658,40 @@ class DungeonGenerator:
 
   def GenerateLevels(self) -> None:
     for level_num in Range.VALID_LEVEL_NUMBERS:
-      self.CreateRoomTree(level_num)
-      self.LinkUpRooms(level_num)
-      self.AddEnemies(level_num)
-
-      self.data_table.ClearStaircaseRoomNumbersForLevel(level_num)
-      for stairway_room_num in self.level_plan[level_num]['item_stairway_room_nums']:
-        log.info("Adding item staircase %x for level %d" % (stairway_room_num, level_num))
-        self.data_table.AddStaircaseRoomNumberForLevel(level_num, stairway_room_num)
-      for stairway_room_num in self.level_plan[level_num]['transport_stairway_room_nums']:
-        log.info("Adding transport staircase %x for level %d" % (stairway_room_num, level_num))
-        self.data_table.AddStaircaseRoomNumberForLevel(level_num, stairway_room_num)
-      if self.settings.debug_mode:
-        self.Print(level_num)
+      self.GenerateLevel(level_num)
     self.data_table.SetLevelGrid(GridId.GRID_A, self.room_grid_a)
     self.data_table.SetLevelGrid(GridId.GRID_B, self.room_grid_b)
     if self.settings.debug_mode:
       input("done!")
 
+  def GenerateLevel(self, level_num: LevelNum) -> None:
+    self.CreateRoomTree(level_num)
+    self.LinkUpRooms(level_num)
+    self.AddEnemies(level_num)
+
+    self.data_table.ClearStaircaseRoomNumbersForLevel(level_num)
+    for stairway_room_num in self.level_plan[level_num]['item_stairway_room_nums']:
+      log.info("Adding item staircase %x for level %d" % (stairway_room_num, level_num))
+      self.data_table.AddStaircaseRoomNumberForLevel(level_num, stairway_room_num)
+    for stairway_room_num in self.level_plan[level_num]['transport_stairway_room_nums']:
+      log.info("Adding transport staircase %x for level %d" % (stairway_room_num, level_num))
+      self.data_table.AddStaircaseRoomNumberForLevel(level_num, stairway_room_num)
+    if self.settings.debug_mode:
+      self.Print(level_num)
+
+  def RegenerateLevel(self, level_num: LevelNum) -> None:
+    """Lays out a level again, keeping the grids, the level plan and the rest of the dungeon."""
+    with self.stats.Time('room_trees'):
+      self.GenerateLevel(level_num)
+
+  def RegenerateOverworldCaves(self) -> None:
+    """Reassigns the levels and caves to overworld screens, keeping the levels themselves."""
+    with self.stats.Time('overworld'):
+      self.RandomizeOverworldCaves()
+
   def CreateRoomTree(self, level_num: LevelNum) -> None:
     while True:
+      self.stats.CountAttempt('room_tree')
       self.ResetRooms(level_num)
       self._GenerateLevelStartRoom(level_num)
       if not self.TryCreateRoomTree(level_num):
@@ -706,7 +740,7 @@ class DungeonGenerator:
       # Transport stair case
       if (actual_num_rooms[area_id] == self.level_plan[level_num][str(area_id)]['path_length'] and
           self.level_plan[level_num][str(area_id)]['stairway_border'] == True):
-        next_room_num = random.choice(level_room_nums)
+        next_room_num = self.rng.choice(level_room_nums)
         next_room = self._GetRoom(next_room_num, level_num)
         level_room_nums.remove(next_room_num)
         assigned_room_nums.append(next_room_num)
@@ -722,13 +756,16 @@ class DungeonGenerator:
 
         current_room.SetStairsDestination(stairway_room_num)
         next_room.SetStairsDestination(stairway_room_num)
-        current_room_type = RoomType.RandomValueOkayForStairs()
-        next_room_type = RoomType.RandomValueOkayForStairs()
+        current_room_type = RoomType.RandomValueOkayForStairs(self.rng)
+        next_room_type = RoomType.RandomValueOkayForStairs(self.rng)
         current_room.SetRoomType(current_room_type)
         next_room.SetRoomType(next_room_type)
         current_room.SetRoomAction(current_room_type.GetRoomActionIfHasStairs())
         next_room.SetRoomAction(next_room_type.GetRoomActionIfHasStairs())
-        return_position = RoomType.GetValidPositionForRoomTypes(current_room_type, next_room_type)
+        return_position = RoomType.GetValidPositionForRoomTypes(self.rng,
+                                                                current_room_type,
+                                                                next_room_type,
+                                                                stats=self.stats)
         stairway_room.SetReturnPosition(return_position)
         current_room.SetLockingDirection(Direction.STAIRCASE)
         next_room.SetLockLevel(current_room.GetLockLevel() + 1)
@@ -743,7 +780,7 @@ class DungeonGenerator:
         border_type = self.level_plan[level_num][str(area_id)]['border_type']
 
         maybe_next_dirs = Range.CARDINAL_DIRECTIONS.copy()
-        random.shuffle(maybe_next_dirs)
+        self.rng.shuffle(maybe_next_dirs)
         next_dir = Direction.NO_DIRECTION
         for maybe_next_dir in maybe_next_dirs:
 
@@ -792,11 +829,11 @@ class DungeonGenerator:
       counter += 1
       if counter > 1000:
         return False
-      maybe_parent_room_num = random.choice(assigned_room_nums)
+      maybe_parent_room_num = self.rng.choice(assigned_room_nums)
       maybe_parent_room = self._GetRoom(maybe_parent_room_num, level_num)
       current_area = maybe_parent_room.GetLockLevel()
 
-      maybe_direction = random.choice(Range.CARDINAL_DIRECTIONS)
+      maybe_direction = self.rng.choice(Range.CARDINAL_DIRECTIONS)
       maybe_child_room_num = GetNextRoomNum(maybe_parent_room_num, maybe_direction)
 
       # Don't expand into a room that's not available for expansion
@@ -862,8 +899,8 @@ class DungeonGenerator:
           backup_item_room_nums.append(room_num)
       # else:
       #log.info("Is an entrance")
-      random.shuffle(good_item_room_nums)
-      random.shuffle(backup_item_room_nums)
+      self.rng.shuffle(good_item_room_nums)
+      self.rng.shuffle(backup_item_room_nums)
       items_to_place = self.level_plan[level_num][area_id]['items']
 
       for item in [Item.HEART_CONTAINER, Item.TRIFORCE, Item.NOTHING, Item.BLUE_POTION]:
@@ -879,10 +916,10 @@ class DungeonGenerator:
         item_room_num = good_item_room_nums.pop()
         item_room = self._GetRoom(item_room_num, level_num)
         enemy = Enemy.RandomHardEnemyOrMiniBossOkayForSpriteSets(
-            self.level_plan[level_num]['boss_sprite_set'],
+            self.rng, self.level_plan[level_num]['boss_sprite_set'],
             self.level_plan[level_num]['enemy_sprite_set'])
         item_room.SetEnemy(enemy)
-        item_room.SetEnemyQuantityCode(random.randrange(2, 3))
+        item_room.SetEnemyQuantityCode(self.rng.randrange(2, 3))
         if item.IsMajorItem():
           stairway_room_num = item_stairway_room_nums.pop(0)
           log.info("MAJOR ITEM TO PLACE: %s. Item room %x -> Stairway %x" %
@@ -895,19 +932,20 @@ class DungeonGenerator:
           stairway_room.SetItemPositionCode(0)
           item_room.SetStairsDestination(stairway_room_num)
           item_room.SetInnerPalette(DungeonPalette.WATER)
-          room_type = RoomType.RandomValueOkayForStairs()
+          room_type = RoomType.RandomValueOkayForStairs(self.rng)
           item_room.SetRoomAction(room_type.GetRoomActionIfHasStairs())
           item_room.SetRoomType(room_type)
-          stairway_room.SetReturnPosition(RoomType.GetValidPositionForRoomType(room_type))
+          stairway_room.SetReturnPosition(
+              RoomType.GetValidPositionForRoomType(self.rng, room_type, stats=self.stats))
           item_room.SetDebugString("S %s" % item.name)
         else:
-          room_type = RoomType.RandomValue(okay_for_enemy=enemy)
+          room_type = RoomType.RandomValue(self.rng, okay_for_enemy=enemy)
           item_room.SetRoomType(room_type)
           item_room.SetItem(item)
           item_room.SetItemPositionCode(self.item_position_dict[level_num][room_type])
           item_room.SetDebugString("F %s" % item.name)
           item_room.SetRoomAction(
-              random.choice([
+              self.rng.choice([
                   RoomAction.NO_ROOM_ACTION,
                   RoomAction.KILLING_ENEMIES_OPENS_SHUTTER_DOORS_AND_DROPS_ITEM
               ]))
@@ -953,8 +991,9 @@ class DungeonGenerator:
         border_room.SetWallType(border_dir, wall_type)
         next_room.SetWallType(border_dir.Reverse(), wall_type)
         border_room.SetEnemy(
-            Enemy.RandomEnemyOkayForSpriteSet(self.level_plan[level_num]['enemy_sprite_set']))
-        border_room.SetEnemyQuantityCode(random.randrange(1, 3))
+            Enemy.RandomEnemyOkayForSpriteSet(self.rng,
+                                              self.level_plan[level_num]['enemy_sprite_set']))
+        border_room.SetEnemyQuantityCode(self.rng.randrange(1, 3))
       elif border_type in OK_BORDER_TYPES_FOR_TRANSPORT_STAIRCASE or border_type == BorderType.BOSS:
         okay_enemies = {
             BorderType.BOOMERANG_BLOCK: [Enemy.RED_KEESE, Enemy.DARK_KEESE],
@@ -963,24 +1002,26 @@ class DungeonGenerator:
             BorderType.RECORDER_BLOCK: [Enemy.SINGLE_DIGDOGGER, Enemy.TRIPLE_DIGDOGGER],
             BorderType.WAND_BLOCK: [Enemy.MANHANDALA],
             BorderType.BOSS: [
-                Enemy.RandomBossFromSpriteSet(self.level_plan[level_num]['boss_sprite_set'])
+                Enemy.RandomBossFromSpriteSet(self.rng,
+                                              self.level_plan[level_num]['boss_sprite_set'])
             ],
             BorderType.MINI_BOSS: [
                 Enemy.RandomHardEnemyOrMiniBossOkayForSpriteSets(
+                    self.rng,
                     boss_sprite_set=self.level_plan[level_num]['boss_sprite_set'],
                     enemy_sprite_set=self.level_plan[level_num]['enemy_sprite_set'])
             ]
         }
-        enemy = random.choice(okay_enemies[border_type])
+        enemy = self.rng.choice(okay_enemies[border_type])
         border_room.SetEnemy(enemy)
-        border_room.SetEnemyQuantityCode(random.randrange(0, 3))
+        border_room.SetEnemyQuantityCode(self.rng.randrange(0, 3))
         if border_room.GetLockingDirection() != Direction.STAIRCASE:
-          room_type = RoomType.RandomValue(okay_for_enemy=enemy)
+          room_type = RoomType.RandomValue(self.rng, okay_for_enemy=enemy)
           border_room.SetRoomType(room_type)
           border_room.SetWallType(border_dir, WallType.SHUTTER_DOOR)
           border_room.SetRoomAction(RoomAction.KILLING_ENEMIES_OPENS_SHUTTER_DOORS)
         if border_type == BorderType.BOSS:
-          room_type = RoomType.RandomValue(okay_for_enemy=enemy)
+          room_type = RoomType.RandomValue(self.rng, okay_for_enemy=enemy)
           border_room.SetRoomType(room_type)
           border_room.SetItem(Item.HEART_CONTAINER)
           border_room.SetItemPositionCode(self.item_position_dict[level_num][room_type])
@@ -1045,7 +1086,7 @@ class DungeonGenerator:
   def PlaceNonBorderElders(self, level_num: LevelNum) -> bool:
     possible_room_nums: List[RoomNum] = []
     all_room_nums = self._GetRoomNumsForLevel(level_num)
-    random.shuffle(all_room_nums)
+    self.rng.shuffle(all_room_nums)
     for room_num in all_room_nums:
       log.info("Room %x" % room_num)
       room = self._GetRoom(room_num, level_num)
@@ -1092,17 +1133,18 @@ class DungeonGenerator:
       if (room.GetEnemy() == Enemy.NO_ENEMY and room.GetRoomType() == RoomType.PLAIN_ROOM and
           room.GetItem() == Item.NOTHING):
         enemy = Enemy.RandomEnemyOkayForSpriteSet(
-            sprite_set=self.level_plan[level_num]['enemy_sprite_set'])
-        room_type = RoomType.RandomValue(okay_for_enemy=enemy)
+            self.rng, sprite_set=self.level_plan[level_num]['enemy_sprite_set'])
+        room_type = RoomType.RandomValue(self.rng, okay_for_enemy=enemy)
         room.SetEnemy(enemy)
-        room.SetEnemyQuantityCode(random.randrange(1, 2))
+        room.SetEnemyQuantityCode(self.rng.randrange(1, 2))
         room.SetRoomType(room_type)
-        item = random.choice([Item.BOMBS, Item.FIVE_RUPEES, Item.RUPEE, Item.NOTHING, Item.NOTHING])
+        item = self.rng.choice(
+            [Item.BOMBS, Item.FIVE_RUPEES, Item.RUPEE, Item.NOTHING, Item.NOTHING])
         room.SetItem(item)
         room.SetItemPositionCode(self.item_position_dict[level_num][room_type])
         if item != Item.NOTHING:
           room.SetRoomAction(
-              random.choice([
+              self.rng.choice([
                   RoomAction.NO_ROOM_ACTION,
                   RoomAction.KILLING_ENEMIES_OPENS_SHUTTER_DOORS_AND_DROPS_ITEM
               ]))
@@ -1124,9 +1166,9 @@ class DungeonGenerator:
       if level_num < 4:
         wall_type = WallType.BOMB_HOLE
       elif level_num < 7:
-        wall_type = random.choice([WallType.OPEN_DOOR, WallType.BOMB_HOLE])
+        wall_type = self.rng.choice([WallType.OPEN_DOOR, WallType.BOMB_HOLE])
       else:
-        wall_type = random.choice([WallType.OPEN_DOOR, WallType.BOMB_HOLE, WallType.SOLID_WALL])
+        wall_type = self.rng.choice([WallType.OPEN_DOOR, WallType.BOMB_HOLE, WallType.SOLID_WALL])
 
       self._GetRoom(room_num, level_num).SetWallType(Direction.EAST, wall_type)
       self._GetRoom(right_room_num, level_num).SetWallType(Direction.WEST, wall_type)
@@ -1147,29 +1189,32 @@ class DungeonGenerator:
           Enemy.ELDER_6, Enemy.ELDER_8, Enemy.MUGGER
       ]:
         continue
-      wall_type = random.choice([WallType.OPEN_DOOR, WallType.BOMB_HOLE])
+      wall_type = self.rng.choice([WallType.OPEN_DOOR, WallType.BOMB_HOLE])
       wall_type = WallType.BOMB_HOLE
       self._GetRoom(room_num, level_num).SetWallType(Direction.SOUTH, wall_type)
       self._GetRoom(bottom_room_num, level_num).SetWallType(Direction.NORTH, wall_type)
 
   def RandomizeShops(self) -> None:
-    minor_items = [(Item.BOMBS, random.randrange(5, 20)), (Item.BOMBS, random.randrange(20, 35)),
-                   (Item.MAGICAL_SHIELD, random.randrange(125, 160)),
-                   (Item.SINGLE_HEART, random.randrange(1, 20)),
-                   (Item.KEY, random.randrange(230, 255)), (Item.FAIRY, random.randrange(20, 35)),
-                   (Item.BLUE_POTION, random.randrange(30, 55)),
-                   (Item.RED_POTION, random.randrange(55, 85))]
+    minor_items = [(Item.BOMBS, self.rng.randrange(5, 20)),
+                   (Item.BOMBS, self.rng.randrange(20, 35)),
+                   (Item.MAGICAL_SHIELD, self.rng.randrange(125, 160)),
+                   (Item.SINGLE_HEART, self.rng.randrange(1, 20)),
+                   (Item.KEY, self.rng.randrange(230, 255)),
+                   (Item.FAIRY, self.rng.randrange(20, 35)),
+                   (Item.BLUE_POTION, self.rng.randrange(30, 55)),
+                   (Item.RED_POTION, self.rng.randrange(55, 85))]
     major_items = [
-        (Item.BLUE_CANDLE, random.randrange(50, 80)),
-        (Item.WOOD_ARROWS, random.randrange(60, 100)),
-        (Item.BAIT, random.randrange(60, 100)),
-        (Item.BLUE_RING, random.randrange(125, 175)),
+        (Item.BLUE_CANDLE, self.rng.randrange(50, 80)),
+        (Item.WOOD_ARROWS, self.rng.randrange(60, 100)),
+        (Item.BAIT, self.rng.randrange(60, 100)),
+        (Item.BLUE_RING, self.rng.randrange(125, 175)),
         (Item.OVERWORLD_NO_ITEM, 0),
     ]
 
     while True:
-      random.shuffle(major_items)
-      random.shuffle(minor_items)
+      self.stats.CheckBudget()
+      self.rng.shuffle(major_items)
+      self.rng.shuffle(minor_items)
       if (minor_items[0][0] == minor_items[1][0] or minor_items[2][0] == minor_items[3][0] or
           minor_items[4][0] == minor_items[5][0] or minor_items[6][0] == minor_items[7][0]):
         continue
@@ -1208,12 +1253,12 @@ class DungeonGenerator:
     all_screens.sort()
     for screen in all_screens:
       destinations.append(self.data_table.GetCaveDestination(screen))
-    random.shuffle(destinations)
+    self.rng.shuffle(destinations)
 
     assert len(destinations) == len(screen_nums)
 
     # Assign Wood Sword cave to an open cave
-    wood_sword_cave_screen_num = random.choice(Screen.POSSIBLE_FIRST_WEAPON_SCREENS)
+    wood_sword_cave_screen_num = self.rng.choice(Screen.POSSIBLE_FIRST_WEAPON_SCREENS)
     screen_nums.remove(wood_sword_cave_screen_num)
     destinations.remove(CaveType.WOOD_SWORD_CAVE)
     self.data_table.SetCaveDestination(wood_sword_cave_screen_num, CaveType.WOOD_SWORD_CAVE)
@@ -1222,7 +1267,8 @@ class DungeonGenerator:
     log.info(screen_nums)
 
     while True:
-      random.shuffle(screen_nums)
+      self.stats.CheckBudget()
+      self.rng.shuffle(screen_nums)
       if screen_nums[0] not in [0x03, 0x07, 0x0A, 0x1E, 0x6D]:  # From Sinistral's research
         any_road_screen_num = screen_nums.pop(0)
         any_road_screen_nums.append(any_road_screen_num)
@@ -285,15 +285,16 @@ class Enemy(IntEnum):
 
   @classmethod
   def RandomEnemyOkayForSpriteSet(cls,
+                                  rng: random.Random,
                                   sprite_set: SpriteSet,
                                   must_be_in_sprite_set: bool = False,
                                   must_be_harder_enemy: bool = False) -> "Enemy":
     while True:
       try:
-        enemy = cls(random.randrange(0x0, 0x7F))
+        enemy = cls(rng.randrange(0x0, 0x7F))
       except ValueError:
         continue
-      if enemy.HasTraps() and random.choice([True, True, True, True, True, True, True, False]):
+      if enemy.HasTraps() and rng.choice([True, True, True, True, True, True, True, False]):
         continue
 
       if ((not must_be_in_sprite_set and enemy.IsInAllSpriteSets()) or
@@ -303,23 +304,24 @@ class Enemy(IntEnum):
         return enemy
 
   @classmethod
-  def RandomBossFromSpriteSet(cls, boss_sprite_set: SpriteSet) -> "Enemy":
+  def RandomBossFromSpriteSet(cls, rng: random.Random, boss_sprite_set: SpriteSet) -> "Enemy":
     if boss_sprite_set == SpriteSet.DODONGO_SPRITE_SET:
-      return random.choice([
+      return rng.choice([
           Enemy.SINGLE_DODONGO, Enemy.TRIPLE_DODONGO, Enemy.SINGLE_DIGDOGGER,
           Enemy.TRIPLE_DIGDOGGER, Enemy.AQUAMENTUS, Enemy.AQUAMENTUS, Enemy.MOLDORM, Enemy.MOLDORM
       ])
     if boss_sprite_set == SpriteSet.GLEEOK_SPRITE_SET:
-      return random.choice([
+      return rng.choice([
           Enemy.BLUE_GOHMA, Enemy.BLUE_GOHMA, Enemy.RED_GOHMA, Enemy.RED_GOHMA, Enemy.MANHANDALA,
           Enemy.MANHANDALA, Enemy.MANHANDALA, Enemy.MANHANDALA, Enemy.GLEEOK_1, Enemy.GLEEOK_2,
           Enemy.GLEEOK_3, Enemy.GLEEOK_4
       ])
     # boss_sprite_set == SpriteSet.PATRA_SPRITE_SET:
-    return random.choice([Enemy.PATRA_1, Enemy.PATRA_2])
+    return rng.choice([Enemy.PATRA_1, Enemy.PATRA_2])
 
   @classmethod
-  def RandomHardEnemyOrMiniBossOkayForSpriteSets(cls, boss_sprite_set: SpriteSet,
+  def RandomHardEnemyOrMiniBossOkayForSpriteSets(cls, rng: random.Random,
+                                                 boss_sprite_set: SpriteSet,
                                                  enemy_sprite_set: SpriteSet) -> "Enemy":
     assert boss_sprite_set in [
         SpriteSet.DODONGO_SPRITE_SET, SpriteSet.GLEEOK_SPRITE_SET, SpriteSet.PATRA_SPRITE_SET
@@ -329,7 +331,7 @@ class Enemy(IntEnum):
     ]
     while True:
       try:
-        enemy = cls(random.randrange(0x0, 0x7F))
+        enemy = cls(rng.randrange(0x0, 0x7F))
       except ValueError:
         continue
 
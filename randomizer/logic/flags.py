@@ -147,6 +147,31 @@ class ItemsCategory(FlagCategory):
   name = 'Item Settings'
   flags = [ProgressiveItems, ShuffleShopItems,]
 """
+
+
+class AssumedFill(Flag):
+  name = 'Assumed Fill Item Placement'
+  description = 'Places each item only where it can be reached, instead of shuffling all items and retrying until the seed is beatable.'
+  inverse_description = "(Items are shuffled and the seed is checked for beatability afterwards.)"
+  value = 'Ia'
+  modes = ['standard']
+
+
+class PartialRegeneration(Flag):
+  name = 'Partial Dungeon Regeneration'
+  description = 'When items can\'t be shuffled into a beatable seed, lays out again only the level (or the overworld cave assignment) that got in the way.'
+  inverse_description = "(The whole dungeon is generated again when items can't be shuffled into a beatable seed.)"
+  value = 'Ir'
+  modes = ['standard']
+
+
+class ItemPlacementCategory(FlagCategory):
+  name = 'Item Placement'
+  flags = [
+      AssumedFill,
+      PartialRegeneration,
+  ]
+
 # ******** Speedups
 
 
@@ -263,6 +288,7 @@ class AdvancedPreset(Preset):
 CATEGORIES = (
     DifficultyCategory,
     # ItemsCategory,
+    ItemPlacementCategory,
     SpeedupsCategory,
     ExtrasCategory,
 )
@@ -6,6 +6,7 @@ from typing import List
 from .constants import LevelNum, Range, RoomNum, WallType
 from .direction import Direction
 from .data_table import DataTable
+from .stats import GenerationStats
 
 
 def GetNextRoomNum(room_num: RoomNum, direction: Direction) -> RoomNum:
@@ -16,8 +17,10 @@ def GetNextRoomNum(room_num: RoomNum, direction: Direction) -> RoomNum:
 
 class GridGenerator:
 
-  def __init__(self, data_table: DataTable) -> None:
+  def __init__(self, data_table: DataTable, rng: random.Random, stats: GenerationStats) -> None:
     self.data_table = data_table
+    self.rng = rng
+    self.stats = stats
     self.Initialize()
     self.foo: bool
 
@@ -53,13 +56,15 @@ class GridGenerator:
                         num_stairway_rooms: int = 6) -> None:
     self.foo = True if num_levels == 3 else False
     while True:
+      self.stats.CountAttempt('grid')
       level_sizes: List[int] = []
       while not sum(level_sizes[1:]) == 0x80 - num_stairway_rooms:
+        self.stats.CountAttempt('grid_level_sizes')
         level_sizes.clear()
         # "Level 0" used to reference item/transport stairways
         level_sizes = [num_stairway_rooms]
         for unused_counter in range(0, num_levels):
-          level_sizes.append(random.randint(min_level_size, max_level_size))
+          level_sizes.append(self.rng.randint(min_level_size, max_level_size))
       level_sizes.sort()
 
       self.Initialize()
@@ -94,11 +99,12 @@ class GridGenerator:
 
   def _ExpandLevel(self, level_num: LevelNum) -> bool:
     if not self.level_room_numbers[level_num]:
-      return self._ClaimRoomForLevel(level_num, random.choice(Range.VALID_ROOM_NUMBERS))
+      return self._ClaimRoomForLevel(level_num, self.rng.choice(Range.VALID_ROOM_NUMBERS))
 
-    random_room_in_level = random.choice(self.level_room_numbers[level_num])
+    random_room_in_level = self.rng.choice(self.level_room_numbers[level_num])
     last_room_added = self.level_room_numbers[level_num][-1]
-    original_room_num = random.choice([random_room_in_level, random_room_in_level, last_room_added])
+    original_room_num = self.rng.choice(
+        [random_room_in_level, random_room_in_level, last_room_added])
 
     new_direction_pool = [
         Direction.NORTH,
@@ -107,9 +113,9 @@ class GridGenerator:
         Direction.EAST,
     ]
 
-    new_direction_pool.extend([random.choice([Direction.EAST, Direction.WEST])])
+    new_direction_pool.extend([self.rng.choice([Direction.EAST, Direction.WEST])])
 
-    new_direction = random.choice(new_direction_pool)
+    new_direction = self.rng.choice(new_direction_pool)
     new_room_num = GetNextRoomNum(original_room_num, new_direction)
 
     if original_room_num % 16 == 15 and new_room_num % 16 == 0:
@@ -118,7 +124,7 @@ class GridGenerator:
       return False
 
     if new_room_num % 16 in [0, 15] or new_room_num / 16 in [0, 7]:
-      if random.choice([False, True, True, True]):
+      if self.rng.choice([False, True, True, True]):
         return False
 
     # Make sure levels aren't more than 8 rooms wide
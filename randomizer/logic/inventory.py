@@ -1,5 +1,5 @@
 from absl import logging as log
-from typing import Set, Tuple
+from typing import Dict, Set, Tuple
 
 from .constants import LevelNum, RoomNum
 from .direction import Direction
@@ -7,10 +7,50 @@ from .item import Item
 from .location import Location
 
 
+# Inventory contents as a bitmask, with bit n set if the item with value n is in the inventory.
+ItemMask = int
+
+
+def ItemBit(item: Item) -> ItemMask:
+  return 1 << item
+
+
+# TODO: Make these work correctly with the Magical sword as well.
+SWORD = ItemBit(Item.WOOD_SWORD) | ItemBit(Item.WHITE_SWORD)
+SWORD_OR_WAND = SWORD | ItemBit(Item.WAND)
+REUSABLE_WEAPON = SWORD_OR_WAND | ItemBit(Item.RED_CANDLE)
+BOOMERANG = ItemBit(Item.BOOMERANG) | ItemBit(Item.MAGICAL_BOOMERANG)
+REUSABLE_WEAPON_OR_BOOMERANG = REUSABLE_WEAPON | BOOMERANG
+CANDLE = ItemBit(Item.BLUE_CANDLE) | ItemBit(Item.RED_CANDLE)
+WAND_AND_BOOK = ItemBit(Item.WAND) | ItemBit(Item.BOOK)
+ARROWS = ItemBit(Item.WOOD_ARROWS) | ItemBit(Item.SILVER_ARROWS)
+BOW = ItemBit(Item.BOW)
+BOW_AND_SILVER_ARROWS = BOW | ItemBit(Item.SILVER_ARROWS)
+RING = ItemBit(Item.BLUE_RING) | ItemBit(Item.RED_RING)
+RECORDER = ItemBit(Item.RECORDER)
+MAGICAL_KEY = ItemBit(Item.MAGICAL_KEY)
+
+# Items that don't matter for beating the game, so they never go in the inventory.
+IGNORED_ITEMS = (ItemBit(Item.OVERWORLD_NO_ITEM) | ItemBit(Item.MAP) | ItemBit(Item.COMPASS) |
+                 ItemBit(Item.MAGICAL_SHIELD) | ItemBit(Item.BOMBS) | ItemBit(Item.FIVE_RUPEES) |
+                 ItemBit(Item.RUPEE) | ItemBit(Item.SINGLE_HEART) | ItemBit(Item.FAIRY))
+
+# For items that get upgraded when found again: which item is added instead if another one is
+# already in the inventory, checked in order.  E.g. a second wood sword is a white sword, and a
+# wood sword found after that is a magical sword.
+PROGRESSIVE_UPGRADES: Dict[Item, Tuple[Tuple[ItemMask, ItemMask], ...]] = {
+    Item.WOOD_SWORD: ((ItemBit(Item.WOOD_SWORD), ItemBit(Item.WHITE_SWORD)),
+                      (ItemBit(Item.WHITE_SWORD), ItemBit(Item.MAGICAL_SWORD))),
+    Item.BLUE_RING: ((ItemBit(Item.BLUE_RING), ItemBit(Item.RED_RING)),),
+    Item.BLUE_CANDLE: ((ItemBit(Item.BLUE_CANDLE), ItemBit(Item.RED_CANDLE)),),
+    Item.WOOD_ARROWS: ((ItemBit(Item.WOOD_ARROWS), ItemBit(Item.SILVER_ARROWS)),),
+}
+
+
 class Inventory():
 
   def __init__(self) -> None:
-    self.items: Set[Item]
+    self.items: ItemMask
     self.item_locations: Set[int]
     self.locations_where_keys_were_used: Set[Tuple[LevelNum, RoomNum, Direction]]
     self.num_heart_containers: int
@@ -20,7 +60,7 @@ class Inventory():
     self.Reset()
 
   def Reset(self) -> None:
-    self.items = set()
+    self.items = 0
     self.item_locations = set()
     self.locations_where_keys_were_used = set()
     self.num_heart_containers = 3
@@ -38,14 +78,10 @@ class Inventory():
     return self.still_making_progress_bit
 
   def AddItem(self, item: Item, item_location: Location) -> None:
-    if item in [
-        Item.OVERWORLD_NO_ITEM, Item.MAP, Item.COMPASS, Item.MAGICAL_SHIELD, Item.BOMBS,
-        Item.FIVE_RUPEES, Item.RUPEE, Item.SINGLE_HEART, Item.FAIRY
-    ]:
+    if ItemBit(item) & IGNORED_ITEMS:
       return
-    assert item in range(0, 0x21) or item in [
-        Item.TRIFORCE_OF_POWER_PLACEHOLDER_ITEM, Item.KIDNAPPED_PLACEHOLDER_ITEM
-    ]
+    assert 0 <= item < 0x21 or item in (Item.TRIFORCE_OF_POWER_PLACEHOLDER_ITEM,
+                                        Item.KIDNAPPED_PLACEHOLDER_ITEM)
     if item_location.GetUniqueIdentifier() in self.item_locations:
       return
     self.item_locations.add(item_location.GetUniqueIdentifier())
@@ -58,7 +94,14 @@ class Inventory():
     elif item == Item.KIDNAPPED_PLACEHOLDER_ITEM:
       log.info("    Found Kidnapped in L%d Room %x", item_location.GetLevelNum(),
                item_location.GetRoomNum())
-    elif item == Item.HEART_CONTAINER:
+    self._AddItem(item)
+
+  def AddAssumedItem(self, item: Item) -> None:
+    """Adds an item that isn't picked up from any location, i.e. one assumed to be collected."""
+    self._AddItem(item)
+
+  def _AddItem(self, item: Item) -> None:
+    if item == Item.HEART_CONTAINER:
       self.num_heart_containers += 1
       assert self.num_heart_containers <= 16
       return
@@ -74,18 +117,12 @@ class Inventory():
 
     log.info("    Found %s", item)
 
-    if item == Item.WOOD_SWORD and Item.WOOD_SWORD in self.items:
-      self.items.add(Item.WHITE_SWORD)
-    elif item == Item.WOOD_SWORD and Item.WHITE_SWORD in self.items:
-      self.items.add(Item.MAGICAL_SWORD)
-    elif item == Item.BLUE_RING and Item.BLUE_RING in self.items:
-      self.items.add(Item.RED_RING)
-    elif item == Item.BLUE_CANDLE and Item.BLUE_CANDLE in self.items:
-      self.items.add(Item.RED_CANDLE)
-    elif item == Item.WOOD_ARROWS and Item.WOOD_ARROWS in self.items:
-      self.items.add(Item.SILVER_ARROWS)
-    else:
-      self.items.add(item)
+    item_bit = ItemBit(item)
+    for (already_found, upgraded_item_bit) in PROGRESSIVE_UPGRADES.get(item, ()):
+      if self.items & already_found:
+        item_bit = upgraded_item_bit
+        break
+    self.items |= item_bit
 
   def GetHeartCount(self) -> int:
     return self.num_heart_containers
@@ -94,11 +131,11 @@ class Inventory():
     return self.num_triforce_pieces
 
   def HasKey(self) -> bool:
-    return self.Has(Item.MAGICAL_KEY) or self.num_keys > 0
+    return bool(self.items & MAGICAL_KEY) or self.num_keys > 0
 
   def UseKey(self, level_num: LevelNum, room_num: RoomNum, exit_direction: Direction) -> None:
     assert self.HasKey()
-    if self.Has(Item.MAGICAL_KEY):
+    if self.items & MAGICAL_KEY:
       return
     if (level_num, room_num, exit_direction) in self.locations_where_keys_were_used:
       return
@@ -106,40 +143,41 @@ class Inventory():
     self.locations_where_keys_were_used.add((level_num, room_num, exit_direction))
 
   # Methods to check what's in the inventory
+  def GetItemMask(self) -> ItemMask:
+    return self.items
+
   def Has(self, item: Item) -> bool:
-    return item in self.items
+    return bool(self.items & (1 << item))
 
-  # TODO: Make this work correctly with the Magical sword as well.
   def HasSword(self) -> bool:
-    return Item.WOOD_SWORD in self.items or Item.WHITE_SWORD in self.items
+    return bool(self.items & SWORD)
 
   def HasSwordOrWand(self) -> bool:
-    return self.HasSword() or Item.WAND in self.items
+    return bool(self.items & SWORD_OR_WAND)
 
   def HasReusableWeapon(self) -> bool:
-    return self.HasSwordOrWand() or Item.RED_CANDLE in self.items
+    return bool(self.items & REUSABLE_WEAPON)
 
   def HasReusableWeaponOrBoomerang(self) -> bool:
-    return self.HasReusableWeapon() or self.HasBoomerang()
+    return bool(self.items & REUSABLE_WEAPON_OR_BOOMERANG)
 
   def HasRecorderAndReusableWeapon(self) -> bool:
-    return Item.RECORDER in self.items and self.HasReusableWeapon()
+    return bool(self.items & RECORDER) and bool(self.items & REUSABLE_WEAPON)
 
   def HasBowAndArrows(self) -> bool:
-    return (Item.BOW in self.items and
-            (Item.WOOD_ARROWS in self.items or Item.SILVER_ARROWS in self.items))
+    return bool(self.items & BOW) and bool(self.items & ARROWS)
 
   def HasBowSilverArrowsAndSword(self) -> bool:
-    return self.HasSword() and Item.BOW in self.items and Item.SILVER_ARROWS in self.items
+    return self.items & BOW_AND_SILVER_ARROWS == BOW_AND_SILVER_ARROWS and bool(self.items & SWORD)
 
   def HasCandle(self) -> bool:
-    return Item.BLUE_CANDLE in self.items or Item.RED_CANDLE in self.items
+    return bool(self.items & CANDLE)
 
   def HasFireSource(self) -> bool:
-    return self.HasCandle() or (self.Has(Item.WAND) and self.Has(Item.BOOK))
+    return bool(self.items & CANDLE) or self.items & WAND_AND_BOOK == WAND_AND_BOOK
 
   def HasBoomerang(self) -> bool:
-    return Item.BOOMERANG in self.items or Item.MAGICAL_BOOMERANG in self.items
+    return bool(self.items & BOOMERANG)
 
   def HasRing(self) -> bool:
-    return Item.BLUE_RING in self.items or Item.RED_RING in self.items
+    return bool(self.items & RING)
@@ -1,9 +1,9 @@
 from absl import logging as log
 from collections import defaultdict
 import random
-from typing import DefaultDict, List, Tuple, Iterable
+from typing import DefaultDict, Dict, List, Optional, Tuple, Iterable
 
-from .constants import CaveType, LevelNum, Range, RoomNum, WallType
+from .constants import CaveType, LevelNum, LevelNumOrCaveType, Range, RoomNum, WallType
 from .data_table import DataTable
 from .direction import Direction
 from .enemy import Enemy
@@ -11,6 +11,8 @@ from . import flags
 from .item import Item
 from .location import Location
 from .settings import Settings
+from .stats import GenerationStats
+from .validator import Validator
 
 #class NotAllItemsWereShuffledAndIDontKnowWhyException(Exception):
 #  pass
@@ -18,10 +20,21 @@ from .settings import Settings
 
 class ItemRandomizer():
 
-  def __init__(self, data_table: DataTable, settings: Settings) -> None:
+  def __init__(self, data_table: DataTable, settings: Settings, rng: random.Random,
+               stats: GenerationStats) -> None:
     self.data_table = data_table
     self.settings = settings
-    self.item_shuffler = ItemShuffler(settings)
+    self.rng = rng
+    self.item_shuffler: ItemShuffler
+    if self.settings.IsEnabled(flags.AssumedFill):
+      self.item_shuffler = AssumedFillItemShuffler(settings, rng, stats, data_table)
+    else:
+      self.item_shuffler = ItemShuffler(settings, rng, stats)
+    # Locations of the items to shuffle, in traversal order. The dungeon layout doesn't change
+    # between item reshuffles, so the levels only need to be traversed once per layout.
+    self.item_locations: List[Location] = []
+    # The items at those locations as the dungeon generator placed them, before any shuffling.
+    self.generated_items: List[Item] = []
     self.hints: List[str] = []
     self.letter_cave_text: str = ""
 
@@ -41,6 +54,10 @@ class ItemRandomizer():
     self.item_shuffler.ResetState()
     self.data_table.ClearAllVisitMarkers()
 
+  def ResetItemLocations(self) -> None:
+    """Forgets the cached item locations. Must be called whenever a new dungeon is generated."""
+    self.item_locations.clear()
+
   def Randomize(self) -> None:
     log.info("A")
     found_bad_thing = False
@@ -51,13 +68,38 @@ class ItemRandomizer():
     self.WriteItemsAndLocationsToTable()
 
   def ReadItemsAndLocationsFromTable(self) -> None:
+    if not self.item_locations:
+      self._FindItemLocations()
+      self.generated_items = [self._ReadItem(location) for location in self.item_locations]
+    # Every shuffled item is a major item or a triforce, so the items written by the previous
+    # shuffle are still found at exactly these locations.
+    for location in self.item_locations:
+      self.item_shuffler.AddLocationAndItem(location, self._ReadItem(location))
+
+  def RestoreGeneratedItems(self) -> None:
+    """Puts the items back where the dungeon generator placed them, undoing the shuffles.
+
+    Needed before laying out a level again, since that places the level's own items anew and the
+    items shuffled into it would otherwise go missing.
+    """
+    for (location, item) in zip(self.item_locations, self.generated_items):
+      if location.IsLevelRoom():
+        self.data_table.SetRoomItem(item, location)
+      else:
+        self.data_table.SetCaveItem(item, location)
+
+  def _ReadItem(self, location: Location) -> Item:
+    if location.IsLevelRoom():
+      return self.data_table.GetRoomItem(location)
+    return self.data_table.GetCaveItem(location)
+
+  def _FindItemLocations(self) -> None:
     for level_num in Range.VALID_LEVEL_NUMBERS:
       log.info("level %d" % level_num)
-      self._ReadItemsAndLocationsForUndergroundLevel(level_num)
+      self._FindItemLocationsForUndergroundLevel(level_num)
     for location in self._GetOverworldItemLocationsToShuffle():
       log.info("OW")
-      item_num = self.data_table.GetCaveItem(location)
-      self.item_shuffler.AddLocationAndItem(location, item_num)
+      self.item_locations.append(location)
 
   def _GetOverworldItemLocationsToShuffle(self) -> List[Location]:
     items: List[Location] = []
@@ -79,16 +121,15 @@ class ItemRandomizer():
           items.append(shop_location)
     return items
 
-  def _ReadItemsAndLocationsForUndergroundLevel(self, level_num: LevelNum) -> None:
+  def _FindItemLocationsForUndergroundLevel(self, level_num: LevelNum) -> None:
     level_start_room_num = self.data_table.GetLevelStartRoomNumber(level_num)
     level_entrance_direction = self.data_table.GetLevelEntranceDirection(level_num)
     log.info("Traversing level %d.  Start room is %x. Dir is %s " %
              (level_num, level_start_room_num, level_entrance_direction))
-    self._ReadItemsAndLocationsRecursively(level_num, level_start_room_num,
-                                           level_entrance_direction)
+    self._FindItemLocationsRecursively(level_num, level_start_room_num, level_entrance_direction)
 
-  def _ReadItemsAndLocationsRecursively(self, level_num: LevelNum, room_num: RoomNum,
-                                        entrance_direction: Direction) -> None:
+  def _FindItemLocationsRecursively(self, level_num: LevelNum, room_num: RoomNum,
+                                    entrance_direction: Direction) -> None:
     if room_num not in Range.VALID_ROOM_NUMBERS:
       log.warning("Invalid room num")
       return  # No escaping back into the overworld! :)
@@ -100,28 +141,28 @@ class ItemRandomizer():
     item = room.GetItem()
     if item.IsMajorItem() or item == Item.TRIFORCE:
       log.info("---------------------------------- Found %s --------------------------" % item)
-      self.item_shuffler.AddLocationAndItem(Location.LevelRoom(level_num, room_num), item)
+      self.item_locations.append(Location.LevelRoom(level_num, room_num))
 
     # Stair cases (bad pun intended)
     if room.IsItemStaircase():
       return  # Dead end, no need to traverse further.
     if room.IsTransportStairway():
       for upstairs_room in [room.GetStairwayRoomLeftExit(), room.GetStairwayRoomRightExit()]:
-        self._ReadItemsAndLocationsRecursively(level_num, upstairs_room, Direction.STAIRCASE)
+        self._FindItemLocationsRecursively(level_num, upstairs_room, Direction.STAIRCASE)
       return
     # Regular (non-staircase) room case.  Check all four cardinal directions, plus "down".
     for direction in (Direction.WEST, Direction.NORTH, Direction.EAST, Direction.SOUTH):
       if direction == entrance_direction:
         continue
       elif room.GetWallType(direction) != WallType.SOLID_WALL:
-        self._ReadItemsAndLocationsRecursively(level_num, RoomNum(room_num + direction),
-                                               direction.Reverse())
+        self._FindItemLocationsRecursively(level_num, RoomNum(room_num + direction),
+                                           direction.Reverse())
         continue
       else:
         pass
     if room.HasStairs():
-      self._ReadItemsAndLocationsRecursively(level_num, room.GetStairsDestination(),
-                                             Direction.STAIRCASE)
+      self._FindItemLocationsRecursively(level_num, room.GetStairsDestination(),
+                                         Direction.STAIRCASE)
 
   def ShuffleItems(self) -> None:
     self.item_shuffler.ShuffleItems()
@@ -150,7 +191,7 @@ class ItemRandomizer():
       if level_num == LevelNum.LEVEL_7:
         tbr += "IN LEVEL SEVEN"
       else:
-        tbr += random.choice(["OFF", "DOWN", "DEEP"])
+        tbr += self.rng.choice(["OFF", "DOWN", "DEEP"])
         tbr += " IN LEVEL %d" % level_num.value
     else:
       tbr += "IN THE OVERWORLD"
@@ -190,8 +231,10 @@ class ItemRandomizer():
 
 class ItemShuffler():
 
-  def __init__(self, settings: Settings) -> None:
+  def __init__(self, settings: Settings, rng: random.Random, stats: GenerationStats) -> None:
     self.settings = settings
+    self.rng = rng
+    self.stats = stats
     self.item_num_list: List[Item] = []
     self.per_level_item_location_lists: DefaultDict[int, List[Location]] = defaultdict(list)
     self.per_level_item_lists: DefaultDict[int, List[Item]] = defaultdict(list)
@@ -245,7 +288,7 @@ class ItemShuffler():
     log.info("Shuffling items")
     log.info(self.item_num_list)
     log.info(len(self.item_num_list))
-    random.shuffle(self.item_num_list)
+    self.rng.shuffle(self.item_num_list)
 
     for level_or_cave_num in Range.VALID_LEVEL_NUMS_AND_CAVE_TYPES_WITH_SHOPS_FIRST:
       if level_or_cave_num in Range.VALID_LEVEL_NUMBERS:
@@ -270,11 +313,13 @@ class ItemShuffler():
                 Item.WOOD_ARROWS, Item.WOOD_SWORD, Item.BOOMERANG, Item.BLUE_CANDLE, Item.BLUE_RING
             ]):
           log.info("Shufflin!")
-          random.shuffle(self.item_num_list)
+          self.stats.CountAttempt('item_reshuffle')
+          self.rng.shuffle(self.item_num_list)
         while (CaveType(level_or_cave_num) == CaveType.WOOD_SWORD_CAVE and
                self.item_num_list[0] not in [Item.WOOD_SWORD, Item.WAND]):
           log.info("Shufflin!")
-          random.shuffle(self.item_num_list)
+          self.stats.CountAttempt('item_reshuffle')
+          self.rng.shuffle(self.item_num_list)
       except ValueError:
         pass
 
@@ -283,7 +328,7 @@ class ItemShuffler():
         num_locations_needing_an_item = num_locations_needing_an_item - 1
 
       if level_or_cave_num in Range.VALID_LEVEL_NUMBERS:  # Technically this could be for OW and caves too
-        random.shuffle(self.per_level_item_lists[level_or_cave_num])
+        self.rng.shuffle(self.per_level_item_lists[level_or_cave_num])
 
     if self.settings.debug_mode and self.item_num_list:
       log.fatal("NotAllItemsWereShuffledAndIDontKnowWhyException()")
@@ -294,3 +339,110 @@ class ItemShuffler():
       for location, item_num in zip(self.per_level_item_location_lists[level_num_or_cave_type],
                                     self.per_level_item_lists[level_num_or_cave_type]):
         yield (location, item_num)
+
+
+class AssumedFillItemShuffler(ItemShuffler):
+  """Places items one at a time using assumed fill rather than shuffling them all at once.
+
+  Each item goes in a random location such that the game can still be beaten assuming that all of
+  the items not placed yet have been collected. Once the last item is placed, nothing is assumed
+  any more and the seed is beatable by construction, so it doesn't need to be reshuffled.
+  """
+
+  # Unfilled locations hold an item that the validator picks up but never adds to its inventory.
+  PLACEHOLDER_ITEM = Item.RUPEE
+
+  def __init__(self, settings: Settings, rng: random.Random, stats: GenerationStats,
+               data_table: DataTable) -> None:
+    super().__init__(settings, rng, stats)
+    self.data_table = data_table
+    self.validator = Validator(data_table, settings, stats)
+
+  def ShuffleItems(self) -> None:
+    self.validator.ResetLogicGraph()
+    locations: List[Location] = []
+    for level_or_cave_num in Range.VALID_LEVEL_NUMS_AND_CAVE_TYPES:
+      locations.extend(self.per_level_item_location_lists[level_or_cave_num])
+    for location in locations:
+      self._WriteItem(location, self.PLACEHOLDER_ITEM)
+
+    # Items with the fewest possible locations are placed first: the wood sword cave weapon, then
+    # the triforces, then the upgrade items that can't be sold in shops. Heart containers and the
+    # shield are rarely needed for progress, so they go last into whatever locations are left.
+    self.rng.shuffle(self.item_num_list)
+    items_to_place: List[Tuple[Item, Optional[LevelNumOrCaveType]]] = []
+    for item in self.item_num_list:
+      if item in [Item.WOOD_SWORD, Item.WAND]:
+        items_to_place.append((item, CaveType.WOOD_SWORD_CAVE))
+        self.item_num_list.remove(item)
+        break
+    for level_num in Range.VALID_LEVEL_NUMBERS:
+      if level_num != LevelNum.LEVEL_9:
+        items_to_place.append((Item.TRIFORCE, level_num))
+    self.item_num_list.sort(key=self._GetPlacementOrder)
+    items_to_place.extend((item, None) for item in self.item_num_list)
+    self.item_num_list.clear()
+
+    # If the game can't be beaten even with every item, no placement will help. Place the items
+    # anywhere and leave it to the validator to reject the dungeon.
+    is_beatable = self.validator.CanRescueKidnapped(
+        item for (item, unused_destination) in items_to_place)
+
+    placed_items: Dict[int, Item] = {}
+    empty_locations = list(locations)
+    for counter, (item, destination) in enumerate(items_to_place):
+      assumed_items = [
+          unplaced_item for (unplaced_item, unused_destination) in items_to_place[counter + 1:]
+      ]
+      candidates = [
+          location for location in empty_locations
+          if self._CanPlaceItem(item, location, destination)
+      ] or empty_locations
+      self.rng.shuffle(candidates)
+      chosen_location = candidates[0]
+      if is_beatable:
+        for location in candidates:
+          self._WriteItem(location, item)
+          if self.validator.CanRescueKidnapped(assumed_items):
+            chosen_location = location
+            break
+          self._WriteItem(location, self.PLACEHOLDER_ITEM)
+        else:
+          log.warning("No location left for %s that keeps the seed beatable" % item)
+          self.stats.CountAttempt('assumed_fill_dead_end')
+          is_beatable = False
+      self._WriteItem(chosen_location, item)
+      empty_locations.remove(chosen_location)
+      placed_items[chosen_location.GetUniqueIdentifier()] = item
+
+    for level_or_cave_num, location_list in self.per_level_item_location_lists.items():
+      self.per_level_item_lists[level_or_cave_num] = [
+          placed_items[location.GetUniqueIdentifier()] for location in location_list
+      ]
+
+  @staticmethod
+  def _GetPlacementOrder(item: Item) -> int:
+    if item.IsAnIncrementalUpgradeItem():
+      return 0
+    if item in [Item.HEART_CONTAINER, Item.MAGICAL_SHIELD]:
+      return 2
+    return 1
+
+  def _CanPlaceItem(self, item: Item, location: Location,
+                    destination: Optional[LevelNumOrCaveType]) -> bool:
+    if destination is not None:
+      return location.GetLevelOrCaveNum() == destination
+    if location.IsLevelRoom():
+      return True
+    cave_type = location.GetCaveType()
+    if cave_type == CaveType.WOOD_SWORD_CAVE:
+      return item in [Item.WOOD_SWORD, Item.WAND]
+    if cave_type in [CaveType.SHOP_A, CaveType.SHOP_B, CaveType.SHOP_C]:
+      return not item.IsAnIncrementalUpgradeItem()
+    return True
+
+  def _WriteItem(self, location: Location, item: Item) -> None:
+    if location.IsLevelRoom():
+      self.data_table.SetRoomItem(item, location)
+    else:
+      self.data_table.SetCaveItem(item, location)
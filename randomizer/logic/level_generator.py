@@ -14,6 +14,7 @@ from .item import Item
 from .location import Location
 from .room import Room
 from .room_type import RoomType
+from .stats import GenerationStats
 
 MAIN_THRESHOLD = 25
 
@@ -65,10 +66,12 @@ class CheckResult(object):
 
 class LevelGenerator:
 
-  def __init__(self, data_table: DataTable) -> None:
+  def __init__(self, data_table: DataTable, rng: random.Random, stats: GenerationStats) -> None:
     self.data_table = data_table
-    self.grid_generator_a: GridGenerator = GridGenerator(self.data_table)
-    self.grid_generator_b: GridGenerator = GridGenerator(self.data_table)
+    self.rng = rng
+    self.stats = stats
+    self.grid_generator_a: GridGenerator = GridGenerator(self.data_table, self.rng, self.stats)
+    self.grid_generator_b: GridGenerator = GridGenerator(self.data_table, self.rng, self.stats)
 
     # The following lists have placeholder values for one-indexing
     self.level_start_rooms: List[RoomNum] = [RoomNum(-1)]
@@ -151,13 +154,13 @@ class LevelGenerator:
 
     is_done = False
     while not is_done:
-      minor_items = [(Item.BOMBS, random.randrange(5, 20)), (Item.BOMBS, random.randrange(20, 35)),
-                     (Item.MAGICAL_SHIELD, random.randrange(90, 125)),
-                     (Item.MAGICAL_SHIELD, random.randrange(125, 160)),
-                     (Item.SINGLE_HEART, random.randrange(1, 20)),
-                     (Item.SINGLE_HEART, random.randrange(1, 20)),
-                     (Item.KEY, random.randrange(70, 90)), (Item.KEY, random.randrange(90, 110))]
-      random.shuffle(minor_items)
+      minor_items = [(Item.BOMBS, self.rng.randrange(5, 20)), (Item.BOMBS, self.rng.randrange(20, 35)),
+                     (Item.MAGICAL_SHIELD, self.rng.randrange(90, 125)),
+                     (Item.MAGICAL_SHIELD, self.rng.randrange(125, 160)),
+                     (Item.SINGLE_HEART, self.rng.randrange(1, 20)),
+                     (Item.SINGLE_HEART, self.rng.randrange(1, 20)),
+                     (Item.KEY, self.rng.randrange(70, 90)), (Item.KEY, self.rng.randrange(90, 110))]
+      self.rng.shuffle(minor_items)
       if (minor_items[0][0] != minor_items[1][0] and minor_items[2][0] != minor_items[3][0] and
           minor_items[4][0] != minor_items[5][0] and minor_items[6][0] != minor_items[7][0]):
         is_done = True
@@ -166,13 +169,13 @@ class LevelGenerator:
                       [minor_items[4][0], Item.BLUE_RING, minor_items[5][0]],
                       [minor_items[6][0], Item.BAIT, minor_items[7][0]]]
     shop_price_data = [[minor_items[0][1],
-                        random.randrange(50, 80), minor_items[1][1]],
+                        self.rng.randrange(50, 80), minor_items[1][1]],
                        [minor_items[2][1],
-                        random.randrange(80, 100), minor_items[3][1]],
+                        self.rng.randrange(80, 100), minor_items[3][1]],
                        [minor_items[4][1],
-                        random.randrange(100, 125), minor_items[5][1]],
+                        self.rng.randrange(100, 125), minor_items[5][1]],
                        [minor_items[6][1],
-                        random.randrange(125, 150), minor_items[7][1]]]
+                        self.rng.randrange(125, 150), minor_items[7][1]]]
 
     for shop_num in range(0, 4):
       for position_num in range(0, 3):
@@ -181,9 +184,9 @@ class LevelGenerator:
         self.data_table.SetCavePrice(shop_price_data[shop_num][position_num], location)
 
     location = Location(cave_type=CaveType.POTION_SHOP, position_num=1)
-    self.data_table.SetCavePrice(random.randrange(30, 55), location)
+    self.data_table.SetCavePrice(self.rng.randrange(30, 55), location)
     location = Location(cave_type=CaveType.POTION_SHOP, position_num=3)
-    self.data_table.SetCavePrice(random.randrange(50, 75), location)
+    self.data_table.SetCavePrice(self.rng.randrange(50, 75), location)
 
   def RandomizeOverworldCaves(self) -> None:
     screen_nums: List[int] = []
@@ -195,7 +198,7 @@ class LevelGenerator:
     for screen_num in all_screen_nums:
       dest = self.data_table.GetCaveDestination(screen_num)
       screen_nums.append(dest)
-    random.shuffle(screen_nums)
+    self.rng.shuffle(screen_nums)
     for screen_num in Screen.ALL_SCREENS_WITH_1Q_CAVES:
       destination = screen_nums.pop()
       try:
@@ -217,8 +220,8 @@ class LevelGenerator:
     sprite_set_pool.extend(sprite_sets)
     sprite_set_pool.extend(sprite_sets)
     for unused_counter in range(0, 3):
-      sprite_set_pool.append(random.choice(sprite_sets))
-    random.shuffle(sprite_set_pool)
+      sprite_set_pool.append(self.rng.choice(sprite_sets))
+    self.rng.shuffle(sprite_set_pool)
     sprite_set_pool.insert(0, SpriteSet.NO_SPRITE_SET)  # For one-indexing
     self.sprite_sets = sprite_set_pool
 
@@ -230,10 +233,10 @@ class LevelGenerator:
     boss_sprite_set_pool.extend(boss_sprite_sets)
     for unused_counter in range(0, 3):
       boss_sprite_set_pool.append(
-          random.choice([SpriteSet.DODONGO_SPRITE_SET, SpriteSet.GLEEOK_SPRITE_SET]))
-    random.shuffle(boss_sprite_set_pool)
+          self.rng.choice([SpriteSet.DODONGO_SPRITE_SET, SpriteSet.GLEEOK_SPRITE_SET]))
+    self.rng.shuffle(boss_sprite_set_pool)
     while boss_sprite_set_pool[8] != SpriteSet.PATRA_SPRITE_SET:
-      random.shuffle(boss_sprite_set_pool)
+      self.rng.shuffle(boss_sprite_set_pool)
     boss_sprite_set_pool.insert(0, SpriteSet.NO_SPRITE_SET)  # For one-indexing
     self.boss_sprite_sets = boss_sprite_set_pool
 
@@ -251,7 +254,7 @@ class LevelGenerator:
                                                  (0x0C, 0x26, 0x23, 0x02), (0x0F, 0x05, 0x23, 0x01),
                                                  (0x0F, 0x08, 0x19, 0x01), (0x02, 0x2D, 0x1A, 0x02),
                                                  (0x07, 0x18, 0x38, 0x02)]
-    random.shuffle(palettes)
+    self.rng.shuffle(palettes)
     for level_num in Range.VALID_LEVEL_NUMBERS:
       (dark, medium, light, water) = palettes[level_num]
       self.data_table.WriteDungeonPalette(level_num, palettes[level_num])
@@ -267,7 +270,7 @@ class LevelGenerator:
     for room_type in range(0x00, 0x2A):
       room_type = RoomType(room_type)
       values = [0, 1, 2, 3]
-      random.shuffle(values)
+      self.rng.shuffle(values)
       for v in values:
         if room_type in [
             RoomType.VERTICAL_CHUTE_ROOM, RoomType.HORIZONTAL_CHUTE_ROOM,
@@ -307,7 +310,7 @@ class LevelGenerator:
           if (potential_gateway not in Range.VALID_ROOM_NUMBERS or
               level_num != self._GetLevelNumForRoomNum(potential_gateway, grid_id)):
             possible_start_rooms.append((room_num, entrance_direction))
-    return random.choice(possible_start_rooms)
+    return self.rng.choice(possible_start_rooms)
 
   def GenerateLevelStartRooms(self) -> None:
     for level_num in Range.VALID_LEVEL_NUMBERS:
@@ -362,7 +365,7 @@ class LevelGenerator:
     level_pool: List[int] = [1, 2, 3, 4, 5, 6, 7, 8]
     level_pool_a: List[int] = []
     level_pool_b: List[int] = []
-    random.shuffle(level_pool)
+    self.rng.shuffle(level_pool)
     for unused_counter in range(0, 4):
       level_pool_a.append(level_pool.pop(0))
       level_pool_b.append(level_pool.pop(0))
@@ -374,8 +377,8 @@ class LevelGenerator:
         Enemy.BOMB_UPGRADER, Enemy.BOMB_UPGRADER, Enemy.HUNGRY_ENEMY, Enemy.ELDER_6
     ]
     elder_group_b: List[Enemy] = [Enemy.ELDER, Enemy.ELDER_2, Enemy.ELDER_3, Enemy.ELDER_4]
-    random.shuffle(elder_group_a)
-    random.shuffle(elder_group_b)
+    self.rng.shuffle(elder_group_a)
+    self.rng.shuffle(elder_group_b)
 
     for n in range(0, 4):
       elder_assignments[level_pool_a[n]].append(elder_group_a.pop(0))
@@ -396,7 +399,7 @@ class LevelGenerator:
         Item.BOW, Item.BOOMERANG, Item.MAGICAL_BOOMERANG, Item.RAFT, Item.LADDER, Item.RECORDER,
         Item.WAND, Item.RED_CANDLE, Item.BOOK, Item.MAGICAL_KEY, Item.SILVER_ARROWS, Item.RED_RING
     ]
-    random.shuffle(major_item_pool)
+    self.rng.shuffle(major_item_pool)
     major_item_assignments: List[List[Item]] = [[], [], [], [], [], [], [], [], [], []]
     for n in Range.VALID_LEVEL_NUMBERS:
       major_item_assignments[n].append(major_item_pool.pop(0))
@@ -488,8 +491,8 @@ class LevelGenerator:
       room_type_pool_template.append(RoomType.BEAST_ROOM)
 
     while len(room_type_pool_template) < num_rooms:
-      allow_hard_to_place = random.choice([True, False])
-      room_type_pool_template.append(RoomType.RandomValue(allow_hard_to_place))
+      allow_hard_to_place = self.rng.choice([True, False])
+      room_type_pool_template.append(RoomType.RandomValue(self.rng, allow_hard_to_place))
 
     transport_stairway_rooms_template: List[Tuple[RoomNum, Direction]] = []
     for transport_stairway_room in transport_staircase_room_list:
@@ -502,10 +505,10 @@ class LevelGenerator:
       counter += 1
       #print()
       #print("-- Level %d, Step 1 (Add RoomTypes), Iteration %d ---" % (level_num, counter))
-      random.shuffle(room_type_pool_template)
-      random.shuffle(transport_stairway_rooms_template)
-      random.shuffle(item_staircase_room_list)
-      random.shuffle(room_nums_template)
+      self.rng.shuffle(room_type_pool_template)
+      self.rng.shuffle(transport_stairway_rooms_template)
+      self.rng.shuffle(item_staircase_room_list)
+      self.rng.shuffle(room_nums_template)
 
       if self.ReallyAddRoomTypes(
           level_num,
@@ -531,7 +534,7 @@ class LevelGenerator:
       while True:
         counter += 1
 
-        random.shuffle(room_type_pool)
+        self.rng.shuffle(room_type_pool)
         room = self._GetRoom(room_num, grid_id)
         room.ClearStairsDestination()
         room_type = room_type_pool[0]
@@ -560,7 +563,7 @@ class LevelGenerator:
         room.SetStairsDestination(stairway_room_num)
         room.SetInnerPalette(DungeonPalette.WATER)
         room.SetRoomType(RoomType.DIAMOND_STAIR_ROOM)  # Temp fix -- can take out?
-        room_type = RoomType.RandomValueOkayForStairs()
+        room_type = RoomType.RandomValueOkayForStairs(self.rng)
         room.SetRoomType(room_type)
         stairway_room.SetReturnPosition(
             0x85 if room_type.NeedsOffCenterStairReturnPosition() else 0x89)
@@ -575,7 +578,7 @@ class LevelGenerator:
         stairway_room.SetItem(Item.NOTHING)
         room.SetStairsDestination(stairway_room_num)
         room.SetRoomType(RoomType.DIAMOND_STAIR_ROOM)  # Temp fix -- can take out?
-        room_type = RoomType.RandomValueOkayForStairs()
+        room_type = RoomType.RandomValueOkayForStairs(self.rng)
         room.SetRoomType(room_type)
         stairway_room.SetReturnPosition(
             0x85 if room_type.NeedsOffCenterStairReturnPosition() else 0x89)
@@ -672,12 +675,12 @@ class LevelGenerator:
     #    with a random-ish number of each wall types.
     wall_type_pool_template: List[WallType] = []
     num_interior_walls = len(interior_walls)
-    num_bombholes = random.randrange(2, math.floor(num_interior_walls / 5) + 1)
-    num_lockeddoors = random.randrange(2, math.floor(num_interior_walls / 5) + 1)
-    num_shutterdoors = random.randrange(2, math.floor(num_interior_walls / 5) + 1)
-    num_solidwalls = random.randrange(0, math.floor(num_interior_walls / 6) + 1)
+    num_bombholes = self.rng.randrange(2, math.floor(num_interior_walls / 5) + 1)
+    num_lockeddoors = self.rng.randrange(2, math.floor(num_interior_walls / 5) + 1)
+    num_shutterdoors = self.rng.randrange(2, math.floor(num_interior_walls / 5) + 1)
+    num_solidwalls = self.rng.randrange(0, math.floor(num_interior_walls / 6) + 1)
     if level_num in [LevelNum.LEVEL_7, LevelNum.LEVEL_8, LevelNum.LEVEL_9]:
-      num_solidwalls = random.randrange(6, math.floor(num_interior_walls / 5) + 1)
+      num_solidwalls = self.rng.randrange(6, math.floor(num_interior_walls / 5) + 1)
     #if level_num == LevelNum.LEVEL_9:
     #  num_solidwalls = 40
     #  num_shutterdoors = 4
@@ -699,8 +702,8 @@ class LevelGenerator:
     while True:
       counter += 1
       #print("--- Level %d, Step 2 (Add WallTypes), Iteration %d ---" % (level_num, counter))
-      random.shuffle(wall_type_pool_template)
-      random.shuffle(interior_walls)
+      self.rng.shuffle(wall_type_pool_template)
+      self.rng.shuffle(interior_walls)
 
       if self.ReallyAddInteriorWalls(level_num, interior_walls.copy(),
                                      wall_type_pool_template.copy()):
@@ -725,7 +728,7 @@ class LevelGenerator:
           #print("---Inner counter timeout----")
           #print()
           return False
-        random.shuffle(wall_type_pool)
+        self.rng.shuffle(wall_type_pool)
         wall_type = wall_type_pool[0]
         room_1 = self._GetRoom(room_num_1, grid_id)
         room_2 = self._GetRoom(room_num_2, grid_id)
@@ -841,10 +844,10 @@ class LevelGenerator:
       enemy_pool_template.append(Enemy.THE_KIDNAPPED)
     num_bosses = math.floor(num_rooms / 10) + 1
     for unused_counter in range(num_bosses):
-      enemy_pool_template.append(Enemy.RandomBossFromSpriteSet(boss_sprite_set))
+      enemy_pool_template.append(Enemy.RandomBossFromSpriteSet(self.rng, boss_sprite_set))
     while len(enemy_pool_template) < num_rooms:
       enemy_pool_template.append(
-          Enemy.RandomEnemyOkayForSpriteSet(sprite_set,
+          Enemy.RandomEnemyOkayForSpriteSet(self.rng, sprite_set,
                                             must_be_in_sprite_set=(len(enemy_pool_template) %
                                                                    2 == 0)))
     room_nums = self._GetRoomNumsForLevel(level_num)
@@ -853,8 +856,8 @@ class LevelGenerator:
     while True:
       counter += 1
       #      print("--- Level %d, Step 3 (Add Enemies), Iteration %d ---" % (level_num, counter))
-      random.shuffle(enemy_pool_template)
-      random.shuffle(room_nums)
+      self.rng.shuffle(enemy_pool_template)
+      self.rng.shuffle(room_nums)
       if self.ReallyAddEnemies(level_num, room_nums.copy(), enemy_pool_template.copy()):
         #        print("---- Success after %d attempts ---" % counter)
         #input("sds")
@@ -876,7 +879,7 @@ class LevelGenerator:
       counter = 0
       while True:
         counter += 1
-        random.shuffle(enemy_pool)
+        self.rng.shuffle(enemy_pool)
         enemy = enemy_pool[0]
         #        print("Trying Enemy %s" % enemy)
         if self._EnemyChecksPass(room_type, enemy):
@@ -894,9 +897,9 @@ class LevelGenerator:
       if enemy == [Enemy.SINGLE_DODONGO, Enemy.TRIPLE_DODONGO]:
         room.SetEnemyQuantityCode(0)
       elif enemy.HasBubbles():
-        room.SetEnemyQuantityCode(random.randrange(2, 3))
+        room.SetEnemyQuantityCode(self.rng.randrange(2, 3))
       else:
-        room.SetEnemyQuantityCode(random.randrange(0, 3))
+        room.SetEnemyQuantityCode(self.rng.randrange(0, 3))
     assert len(enemy_pool) == 0
     #print("Add Enemies success. Yay!")
     return True
@@ -915,13 +918,13 @@ class LevelGenerator:
     for unused_counter in range(num_keys):
       minor_item_pool_template.append(Item.KEY)
     while len(minor_item_pool_template) < num_rooms:
-      minor_item_pool_template.append(random.choice([Item.BOMBS, Item.FIVE_RUPEES, Item.NOTHING]))
+      minor_item_pool_template.append(self.rng.choice([Item.BOMBS, Item.FIVE_RUPEES, Item.NOTHING]))
     counter = 0
     while True:
       #      print("-- Level %d, Step 4 (Add Enemies), Iteration %d ---" % (level_num, counter))
       counter += 1
-      random.shuffle(minor_item_pool_template)
-      random.shuffle(major_item_pool_template)
+      self.rng.shuffle(minor_item_pool_template)
+      self.rng.shuffle(major_item_pool_template)
       if self.ReallyAddItems(level_num, major_item_pool_template.copy(),
                              minor_item_pool_template.copy()):
         #        print("\n---- Success after %d attempts\n" % counter)
@@ -933,13 +936,13 @@ class LevelGenerator:
   def ReallyAddItems(self, level_num: LevelNum, major_item_pool: List[Item],
                      minor_item_pool: List[Item]) -> bool:
     room_nums = self._GetRoomNumsForLevel(level_num)
-    random.shuffle(room_nums)
+    self.rng.shuffle(room_nums)
     for room_num in room_nums:
       counter = 0
       room = self._GetRoomInLevel(room_num, level_num)
       while True:
         counter += 1
-        random.shuffle(minor_item_pool)
+        self.rng.shuffle(minor_item_pool)
         item = minor_item_pool[0]
         if self._ItemChecksPass(item, room):
           assert item == minor_item_pool.pop(0)
@@ -954,7 +957,7 @@ class LevelGenerator:
       if item == Item.HEART_CONTAINER:
         room.SetBossRoarSound(False)
         #room.SetBossRoarSound(True)
-        if (random.choice([True, False])):
+        if (self.rng.choice([True, False])):
           room.SetOuterPalette(DungeonPalette.ACCENT_COLOR)
         else:
           room.SetInnerPalette(DungeonPalette.ACCENT_COLOR)
@@ -996,7 +999,7 @@ class LevelGenerator:
       # If there's a room item, give it a 50/50 whether it's a drop or standing item.
       # Drop case: Killing enemies -> item drop and shutter doors open.
       # Standing item/no item case: Killing enemies -> pushing block -> shutter doors open
-      if item != Item.NOTHING and random.choice([True, False]):
+      if item != Item.NOTHING and self.rng.choice([True, False]):
         return RoomAction.KILLING_ENEMIES_OPENS_SHUTTER_DOORS_DROPS_ITEM_AND_MAKES_BLOCK_PUSHABLE
       return RoomAction.PUSHABLE_BLOCK_OPENS_SHUTTER_DOORS
 
@@ -1008,7 +1011,7 @@ class LevelGenerator:
       return RoomAction.PUSHABLE_BLOCK_MAKES_STAIRS_APPEAR
     # Make the item a drop around 50/50 of the time vs. a standing item.
     # HCs should be drops because we want them to be guarded by bosses.
-    if item != Item.NOTHING and (item == Item.HEART_CONTAINER or random.choice([True, False])):
+    if item != Item.NOTHING and (item == Item.HEART_CONTAINER or self.rng.choice([True, False])):
       return RoomAction.KILLING_ENEMIES_OPENS_SHUTTER_DOORS_AND_DROPS_ITEM
 
     if room.HasShutterDoor():
@@ -1260,7 +1263,7 @@ class LevelGenerator:
     if (room_type == RoomType.HUNGRY_ENEMY_PLACEHOLDER_ROOM_TYPE and
         direction == Direction.NORTH and wall_type == WallType.SOLID_WALL and
         # Added this to avoid deadlocks -- doesn't ALWAYS have to
-        random.choice([True, True, True, False])):
+        self.rng.choice([True, True, True, False])):
       return CheckResult("Hungry Enemy doesn't have a passage to guard")
     if room_type == RoomType.KIDNAPPED_ROOM:
       if direction == Direction.SOUTH and wall_type == WallType.SOLID_WALL:
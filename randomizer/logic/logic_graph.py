@@ -0,0 +1,255 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+from .constants import CaveType, LevelNum, Range, RoomNum, Screen, WallType
+from .data_table import DataTable
+from .direction import Direction
+from .enemy import Enemy
+from .inventory import (ARROWS, BOOMERANG, CANDLE, REUSABLE_WEAPON, RING, SWORD, SWORD_OR_WAND,
+                        ItemBit, ItemMask)
+from .item import Item
+from .room import Room
+from .room_type import RoomType
+from .settings import Settings
+from . import flags
+
+class Requirement():
+  """What it takes to get past something, e.g. a shutter door or a room's enemies.
+
+  Each clause is a mask of items of which at least one is needed (so several clauses together are an
+  AND of ORs), plus a minimum number of triforce pieces for the Elder.
+  """
+
+  def __init__(self, clauses: Tuple[ItemMask, ...] = (), num_triforce_pieces: int = 0) -> None:
+    self.clauses = clauses
+    self.num_triforce_pieces = num_triforce_pieces
+
+  def And(self, other: "Requirement") -> "Requirement":
+    return Requirement(self.clauses + other.clauses,
+                       max(self.num_triforce_pieces, other.num_triforce_pieces))
+
+  def IsMet(self, items: ItemMask, num_triforce_pieces: int) -> bool:
+    if num_triforce_pieces < self.num_triforce_pieces:
+      return False
+    for clause in self.clauses:
+      if not items & clause:
+        return False
+    return True
+
+  def GetMissingItems(self, items: ItemMask, num_triforce_pieces: int) -> List[List[Item]]:
+    """For each part of the requirement that isn't met, the items that would meet it."""
+    missing_items: List[List[Item]] = []
+    if num_triforce_pieces < self.num_triforce_pieces:
+      missing_items.append([Item.TRIFORCE])
+    for clause in self.clauses:
+      if not items & clause:
+        missing_items.append([item for item in Item if ItemBit(item) & clause])
+    return missing_items
+
+
+NO_REQUIREMENT = Requirement()
+
+# An edge out of a room: (exit direction, room number on the other side of the door, direction that
+# room gets entered from, what's needed to get through the door, whether the door is locked).  The
+# room number may be an invalid one.
+Edge = Tuple[Direction, RoomNum, Direction, Requirement, bool]
+
+
+class RoomNode():
+  """A level room, compiled for the validator.
+
+  The room's item isn't part of the node, since it changes with every item shuffle.  The room itself
+  is kept so that the item can be read when the node is visited.  Whether there is an item at all
+  doesn't change though: shuffles only ever move items between rooms that already have one.
+  """
+  NORMAL = 0
+  ITEM_STAIRCASE = 1
+  TRANSPORT_STAIRCASE = 2
+
+  def __init__(self, logic_graph: "LogicGraph", room_num: RoomNum, room: Room) -> None:
+    self.logic_graph = logic_graph
+    self.room_num = room_num
+    self.room = room
+    self.kind = RoomNode.NORMAL
+    if room.IsItemStaircase():
+      self.kind = RoomNode.ITEM_STAIRCASE
+    elif room.IsTransportStaircase():
+      self.kind = RoomNode.TRANSPORT_STAIRCASE
+    self.stairway_exits: List[RoomNum] = []
+    if self.kind == RoomNode.TRANSPORT_STAIRCASE:
+      self.stairway_exits = [room.GetStairwayRoomLeftExit(), room.GetStairwayRoomRightExit()]
+    self.has_item = room.HasItem()
+    enemy = room.GetEnemy()
+    self.has_the_beast = enemy == Enemy.THE_BEAST
+    self.has_the_kidnapped = enemy == Enemy.THE_KIDNAPPED
+    # Compiled lazily for each direction that the room actually gets entered from.
+    self.item_requirements: Dict[Direction, Optional[Requirement]] = {}
+    self.edges: Dict[Direction, List[Edge]] = {}
+    self.stairs_edges: Dict[Direction, Optional[Tuple[RoomNum, Requirement]]] = {}
+
+  def GetItemRequirement(self, entry_direction: Direction) -> Optional[Requirement]:
+    """What's needed to pick up the room's item, or None if it can't be picked up at all."""
+    if entry_direction not in self.item_requirements:
+      self.logic_graph.CompileRoomForEntryDirection(self, entry_direction)
+    return self.item_requirements[entry_direction]
+
+  def GetEdges(self, entry_direction: Direction) -> List[Edge]:
+    if entry_direction not in self.edges:
+      self.logic_graph.CompileRoomForEntryDirection(self, entry_direction)
+    return self.edges[entry_direction]
+
+  def GetStairsEdge(self, entry_direction: Direction) -> Optional[Tuple[RoomNum, Requirement]]:
+    if entry_direction not in self.stairs_edges:
+      self.logic_graph.CompileRoomForEntryDirection(self, entry_direction)
+    return self.stairs_edges[entry_direction]
+
+
+# The overworld screens whose caves can be entered, each group with what it takes to get into them.
+OVERWORLD_SCREEN_GROUPS: List[Tuple[Requirement, List[int]]] = [
+    (NO_REQUIREMENT, Screen.OPEN_CAVE_SCREENS),
+    (Requirement((SWORD_OR_WAND,)), Screen.BOMB_BLOCKED_CAVE_SCREENS),
+    (Requirement((CANDLE,)), Screen.CANDLE_BLOCKED_CAVE_SCREENS),
+    (Requirement((ItemBit(Item.POWER_BRACELET),)), Screen.POWER_BRACELET_BLOCKED_CAVE_SCREENS),
+    (Requirement((ItemBit(Item.RAFT),)), Screen.RAFT_BLOCKED_CAVE_SCREENS),
+    (Requirement((ItemBit(Item.RECORDER),)), Screen.RECORDER_BLOCKED_CAVE_SCREENS),
+]
+
+
+class LogicGraph():
+  """The rooms and overworld screens of a generated dungeon, compiled for the validator.
+
+  Rooms are numbered 0x00-0x7F for the grid shared by levels 1-6 and 0x80-0xFF for the one shared by
+  levels 7-9.  Each room's exits are compiled into edges labelled with the items needed to use them,
+  so that validating another item shuffle of the same dungeon doesn't have to decode rooms again.
+  A new graph has to be compiled whenever a new dungeon is generated.
+  """
+  NUM_NODES = 0x100
+
+  def __init__(self, data_table: DataTable, settings: Settings) -> None:
+    self.data_table = data_table
+    self.avoid_hard_combat = settings.IsEnabled(flags.AvoidHardCombat)
+    self.room_nodes: List[Optional[RoomNode]] = [None] * self.NUM_NODES
+    # For each group of overworld screens, the levels and caves that its screens lead to.
+    self.overworld_entrances: List[Tuple[Requirement, List[Union[LevelNum, CaveType]]]] = []
+    for (requirement, screen_numbers) in OVERWORLD_SCREEN_GROUPS:
+      destinations: List[Union[LevelNum, CaveType]] = []
+      for screen_number in screen_numbers:
+        level_num_or_cave_type = data_table.GetLevelNumberOrCaveType(screen_number)
+        if level_num_or_cave_type in Range.VALID_LEVEL_NUMBERS:
+          destinations.append(LevelNum(level_num_or_cave_type))
+        elif level_num_or_cave_type in Range.VALID_CAVE_TYPES_WITH_ITEMS:
+          destinations.append(CaveType(level_num_or_cave_type))
+      self.overworld_entrances.append((requirement, destinations))
+    self.level_entrances: Dict[LevelNum, Tuple[RoomNum, Direction]] = {
+        level_num: (data_table.GetLevelStartRoomNumber(level_num),
+                    data_table.GetLevelEntranceDirection(level_num))
+        for level_num in Range.VALID_LEVEL_NUMBERS
+    }
+
+  @staticmethod
+  def GetNodeId(level_num: LevelNum, room_num: RoomNum) -> int:
+    return room_num + 0x80 if level_num in [7, 8, 9] else room_num
+
+  def GetRoomNode(self, node_id: int, level_num: LevelNum, room_num: RoomNum) -> RoomNode:
+    room_node = self.room_nodes[node_id]
+    if room_node is None:
+      room_node = RoomNode(self, room_num, self.data_table.GetRoom(level_num, room_num))
+      self.room_nodes[node_id] = room_node
+    return room_node
+
+  def CompileRoomForEntryDirection(self, room_node: RoomNode, entry_direction: Direction) -> None:
+    room = room_node.room
+    room_type = room.GetRoomType()
+    enemy = room.GetEnemy()
+    can_defeat_enemies = self._GetRequirementToDefeatEnemies(room)
+
+    # Can't pick up an item in rooms with water/moats without a ladder.
+    # TODO: Make a better determination here based on the drop location and the entry direction.
+    item_requirement: Optional[Requirement] = NO_REQUIREMENT
+    if room_type.HasWater():
+      item_requirement = item_requirement.And(Requirement((ItemBit(Item.LADDER),)))
+    if room.HasDropBitSet():
+      item_requirement = item_requirement.And(can_defeat_enemies)
+    if ((room_type == RoomType.HORIZONTAL_CHUTE_ROOM and
+         entry_direction in [Direction.NORTH, Direction.SOUTH]) or
+        (room_type == RoomType.VERTICAL_CHUTE_ROOM and
+         entry_direction in [Direction.EAST, Direction.WEST]) or
+        room_type in [RoomType.T_ROOM, RoomType.SECOND_QUEST_T_LIKE_ROOM]):
+      item_requirement = None
+    room_node.item_requirements[entry_direction] = item_requirement
+
+    # Using up keys depends on the order of the traversal, so that's left to the validator.
+    edges: List[Edge] = []
+    for direction in (Direction.WEST, Direction.NORTH, Direction.EAST, Direction.SOUTH):
+      if direction == entry_direction:
+        continue
+      requirement = NO_REQUIREMENT
+      if enemy.HasHardCombatEnemies():
+        requirement = requirement.And(Requirement((REUSABLE_WEAPON,)))
+      # Hungry enemy's room doesn't have a closed shutter door, but it's not possible to move up in
+      # the room until the goriya has been properly fed.
+      if direction == Direction.NORTH and enemy == Enemy.HUNGRY_ENEMY:
+        requirement = requirement.And(Requirement((ItemBit(Item.BAIT),)))
+      if not room_type.AllowsDoorToDoorMovement(entry_direction, direction, False):
+        if not room_type.AllowsDoorToDoorMovement(entry_direction, direction, True):
+          continue
+        requirement = requirement.And(Requirement((ItemBit(Item.LADDER),)))
+      wall_type = room.GetWallType(direction)
+      if wall_type == WallType.SOLID_WALL:
+        continue
+      if wall_type == WallType.SHUTTER_DOOR:
+        requirement = requirement.And(can_defeat_enemies)
+      is_locked = wall_type in [WallType.LOCKED_DOOR_1, WallType.LOCKED_DOOR_2]
+      edges.append((direction, RoomNum(room_node.room_num + direction), direction.Reverse(),
+                    requirement, is_locked))
+    room_node.edges[entry_direction] = edges
+
+    stairs_edge: Optional[Tuple[RoomNum, Requirement]] = None
+    if entry_direction != Direction.STAIRCASE:
+      if room_type.HasUnobstructedStairs():
+        stairs_edge = (room.GetStairsDestination(), NO_REQUIREMENT)
+      elif room.HasStairs():
+        stairs_edge = (room.GetStairsDestination(), can_defeat_enemies)
+    room_node.stairs_edges[entry_direction] = stairs_edge
+
+  def _GetRequirementToDefeatEnemies(self, room: Room) -> Requirement:
+    enemy = room.GetEnemy()
+    if enemy.HasNoEnemiesToKill():
+      return NO_REQUIREMENT
+    clauses: List[ItemMask] = []
+    num_triforce_pieces = 0
+    if enemy.IsBoomerangOnly():
+      clauses.append(BOOMERANG)
+    if enemy.IsFireOnly():
+      # A candle, or the wand together with the book.
+      clauses.append(CANDLE | ItemBit(Item.WAND))
+      clauses.append(CANDLE | ItemBit(Item.BOOK))
+    if enemy.IsWandOnly():
+      clauses.append(ItemBit(Item.WAND))
+    if room.HasPowerBraceletRoomAction():
+      clauses.append(ItemBit(Item.POWER_BRACELET))
+    if room.HasKillingTheBeastOpensShutterDoorsRoomAction():
+      clauses.append(ItemBit(Item.TRIFORCE_OF_POWER_PLACEHOLDER_ITEM))
+    if enemy == Enemy.ELDER:
+      num_triforce_pieces = 8
+    if enemy == Enemy.THE_BEAST:
+      clauses.extend([SWORD, ItemBit(Item.BOW), ItemBit(Item.SILVER_ARROWS)])
+    if enemy.IsDigdogger():
+      clauses.extend([ItemBit(Item.RECORDER), REUSABLE_WEAPON])
+    if enemy.IsGohma():
+      clauses.extend([ItemBit(Item.BOW), ARROWS])
+    if enemy.HasWizzrobes():
+      clauses.append(SWORD)
+    if enemy.HasSwordOrWandRequiredEnemies():
+      clauses.append(SWORD_OR_WAND)
+    if enemy.HasOnlyZeroHPEnemies():
+      clauses.append(REUSABLE_WEAPON | BOOMERANG)
+    if enemy == Enemy.HUNGRY_ENEMY:
+      clauses.append(ItemBit(Item.BAIT))
+    if enemy.HasPolsVoice():
+      # A sword or the wand, or else the bow together with arrows.
+      clauses.append(SWORD_OR_WAND | ItemBit(Item.BOW))
+      clauses.append(SWORD_OR_WAND | ARROWS)
+    if self.avoid_hard_combat and enemy.HasHardCombatEnemies():
+      clauses.extend([RING, ItemBit(Item.WHITE_SWORD)])
+    clauses.append(REUSABLE_WEAPON)
+    return Requirement(tuple(clauses), num_triforce_pieces)
@@ -1,13 +1,16 @@
 from absl import logging as log
+import collections
 import math
 import os
 import random
-from typing import List
-from .data_table import DataTable
+from typing import Counter, List, Optional
+from .constants import LevelNum
+from .data_table import DATA_DIRECTORY, VANILLA_DATA_PATCH, DataTable
 from .dungeon_generator import DungeonGenerator
 from .item_randomizer import ItemRandomizer
 from .patch import Patch
 from .settings import Settings
+from .stats import GenerationBudget, GenerationStats
 from .text_data_table import TextDataTable
 from .validator import Validator
 from . import flags
@@ -16,35 +19,115 @@ VERSION = '1.0'
 
 
 class ZoraRandomizer():
+  # With partial regeneration, how many times to reshuffle the items before laying out part of the
+  # dungeon again, and how many parts to lay out again before starting over with a new dungeon.
+  MAX_ITEM_SHUFFLES_BEFORE_PARTIAL_REGENERATION = 100
+  MAX_PARTIAL_REGENERATIONS = 10
+  # Bytes left as they are in the vanilla ROM are still kept in the patch where there are no more
+  # than this many of them between changed bytes, since a new run costs about as much.
+  MAX_UNCHANGED_GAP = 6
+  # Where the hash code shown on the file select screen goes, in the display routine's placeholder.
+  HASH_CODE_ADDRESS = 0xAFD0
+  HASH_CODE_LENGTH = 4
 
   def __init__(self, settings: Settings) -> None:
     self.settings = settings
-    self.data_table = DataTable()
-    self.validator = Validator(self.data_table, self.settings)
-    self.item_randomizer = ItemRandomizer(self.data_table, self.settings)
+    # Every random decision for this seed is drawn from this generator rather than the global
+    # random module, so that several seeds can be generated concurrently in one process.
+    self.rng = random.Random(self.settings.seed)
+    self.stats = GenerationStats()
+    self.data_table = DataTable(self.rng)
+    self.validator = Validator(self.data_table, self.settings, self.stats)
+    self.item_randomizer = ItemRandomizer(self.data_table, self.settings, self.rng, self.stats)
     log.set_verbosity(log.WARNING)
 
-  def Randomize(self) -> None:
-    random.seed(self.settings.seed)
+  def Randomize(self, budget: Optional[GenerationBudget] = None) -> GenerationStats:
+    """Generates the seed.
+
+    Args:
+      budget: How long generation may take.  Without one, it runs until it's done.
+
+    Raises:
+      GenerationAbortedError: The budget was used up or cancelled first.
+    """
+    self.rng.seed(self.settings.seed)
+    self.stats.Reset()
+    self.stats.budget = budget or GenerationBudget()
 
     done = False
     while not done:
+      self.stats.CountAttempt('dungeon')
       self.data_table.ResetToVanilla()
-      self.dungeon_generator = DungeonGenerator(self.data_table, self.settings)
+      self.dungeon_generator = DungeonGenerator(self.data_table, self.settings, self.rng,
+                                                self.stats)
       self.dungeon_generator.Generate()
-      counter = 0
-      while True:
-        counter += 1
-        log.info("Re-randomizing items")
-        self.item_randomizer.Randomize()
-        log.info("Back to Validating")
-        if self.validator.IsSeedValid():
-          done = True
-          break
-        if counter > 1000:
+      self.item_randomizer.ResetItemLocations()
+      self.validator.ResetLogicGraph()
+      if not self.settings.IsEnabled(flags.PartialRegeneration):
+        done = self._ShuffleItemsUntilValid(1000)
+        continue
+      for unused_counter in range(self.MAX_PARTIAL_REGENERATIONS + 1):
+        blame: Counter[Optional[LevelNum]] = collections.Counter()
+        done = self._ShuffleItemsUntilValid(self.MAX_ITEM_SHUFFLES_BEFORE_PARTIAL_REGENERATION,
+                                            blame)
+        if done:
           break
+        self._RegeneratePartOfDungeon(blame)
+    return self.stats
+
+  def _ShuffleItemsUntilValid(self,
+                              max_counter: int,
+                              blame: Optional[Counter[Optional[LevelNum]]] = None) -> bool:
+    """Reshuffles the items until the seed is beatable, giving up after max_counter + 1 tries.
+
+    Args:
+      max_counter: How many times to retry after the first shuffle.
+      blame: If given, counts how many of the failed shuffles each level (or None, for the
+        overworld caves) was to blame for.
+    """
+    counter = 0
+    while True:
+      counter += 1
+      self.stats.CountAttempt('item_shuffle')
+      log.info("Re-randomizing items")
+      with self.stats.Time('items'):
+        self.item_randomizer.Randomize()
+      log.info("Back to Validating")
+      with self.stats.Time('validation'):
+        is_valid = self.validator.IsSeedValid()
+        if not is_valid and blame is not None:
+          failure = self.validator.GetFailure(self.item_randomizer.item_locations)
+          blame.update(failure.GetRegionsToBlame())
+      if is_valid:
+        return True
+      if counter > max_counter:
+        return False
+
+  def _RegeneratePartOfDungeon(self, blame: Counter[Optional[LevelNum]]) -> None:
+    if not blame:
+      # Only the item placement was ever at fault, so just keep reshuffling.
+      return
+    (level_num, num_failures) = blame.most_common(1)[0]
+    if level_num is None:
+      log.info("Regenerating the overworld caves (blamed for %d failures)" % num_failures)
+      self.stats.CountAttempt('overworld_regeneration')
+      self.dungeon_generator.RegenerateOverworldCaves()
+    else:
+      log.info("Regenerating level %d (blamed for %d failures)" % (level_num, num_failures))
+      self.stats.CountAttempt('level_regeneration')
+      # The level gets its own items placed again, so put back the ones shuffled away from it.
+      self.item_randomizer.RestoreGeneratedItems()
+      self.dungeon_generator.RegenerateLevel(level_num)
+      self.item_randomizer.ResetItemLocations()
+    self.validator.ResetLogicGraph()
 
   def GetPatch(self) -> Patch:
+    with self.stats.Time('patch'):
+      # Whole tables are written, but only the bytes that differ from the vanilla ROM are needed.
+      # The hash code is computed before this, so it doesn't change.
+      return self._GetPatch().GetDelta(VANILLA_DATA_PATCH, self.MAX_UNCHANGED_GAP)
+
+  def _GetPatch(self) -> Patch:
     patch = self.data_table.GetPatch()
     patch += self.RandomizeHP()
     # Old Zero HP code
@@ -53,6 +136,39 @@ class ZoraRandomizer():
     #  zeros.append(0x00)
     # patch.AddData(0x1FB5E, zeros)
 
+    patch += self._GetGameplayFixesPatch()
+
+    # Randomize secret prices
+    patch.AddData(0x18680, [self.rng.randrange(25, 40)])  # Medium secret
+    patch.AddData(0x18683, [self.rng.randrange(80, 125)])  # Large secret
+    patch.AddData(0x18686, [self.rng.randrange(5, 24)])  # Small secret
+    patch.AddData(0x48A0, [self.rng.randrange(15, 25)])  # Door repair
+
+    patch += self._GetCodeChangesPatch()
+
+    # Fix for ganon triforce
+    #patch.AddData(0x6BFB, [0x20, 0xE4, 0xFF])
+    #patch.AddData(0x1FFF4, [0x8E, 0x02, 0x06, 0x8E, 0x72, 0x06, 0xEE, 0x4F, 0x03, 0x60])
+
+    self._AddExtras(patch)
+    return patch
+
+  def GetBasePatch(self) -> Patch:
+    """Returns the part of the patch that is the same for every seed with these flags.
+
+    It doesn't use the seed or the random number generator, so it can be built once per version,
+    mode and flag string and shared by all of their seeds, which only need Patch.GetDelta() of it.
+    Everything in it is also in GetPatch().
+    """
+    patch = self._GetGameplayFixesPatch()
+    patch += self._GetCodeChangesPatch()
+    patch += self._GetHashCodeDisplayPatch()
+    patch += self._GetOptionsPatch()
+    patch += TextDataTable.GetBasePatch(self.settings)
+    return patch.GetDelta(VANILLA_DATA_PATCH, self.MAX_UNCHANGED_GAP)
+
+  def _GetGameplayFixesPatch(self) -> Patch:
+    patch = Patch()
     if self.settings.IsEnabled(flags.FastDungeonTransitions):
       # For fast scrolling. Puts NOPs instead of branching based on dungeon vs. Level 0 (OW)
       for addr in [0x141F3, 0x1426B, 0x1446B, 0x14478, 0x144AD]:
@@ -63,13 +179,10 @@ class ZoraRandomizer():
 
     # Auto-"use" the letter the first time entering a potion shop
     patch.AddData(0x4708, [0xEA, 0xEA, 0xEA, 0xEA, 0xEA, 0xEA, 0xAD, 0x66, 0x06, 0xC9, 0x01, 0xF0])
+    return patch
 
-    # Randomize secret prices
-    patch.AddData(0x18680, [random.randrange(25, 40)])  # Medium secret
-    patch.AddData(0x18683, [random.randrange(80, 125)])  # Large secret
-    patch.AddData(0x18686, [random.randrange(5, 24)])  # Small secret
-    patch.AddData(0x48A0, [random.randrange(15, 25)])  # Door repair
-
+  def _GetCodeChangesPatch(self) -> Patch:
+    patch = Patch()
     # Ropes.  DF = Burn only. Overwrite 2nd quest stuff w/ NOPs
     # patch.AddData(0x112D7, [0xA9, 0xDF, 0x99, 0xB3, 0x04, 0xEA, 0xEA, 0xEA, 0xEA, 0xEA, 0xEA, 0xEA])
 
@@ -96,14 +209,6 @@ class ZoraRandomizer():
     patch.AddData(0x178D0, [0xAD, 0x22, 0x05, 0xC9, 0x01, 0xF0, 0x03, 0x4C, 0x2F, 0x75, 0x60])
     patch.AddData(0x1934D, [0x00])
 
-    # Fix for ganon triforce
-    #patch.AddData(0x6BFB, [0x20, 0xE4, 0xFF])
-    #patch.AddData(0x1FFF4, [0x8E, 0x02, 0x06, 0x8E, 0x72, 0x06, 0xEE, 0x4F, 0x03, 0x60])
-
-    self._AddExtras(patch)
-    return patch
-
-  def _AddExtras(self, patch: Patch) -> None:
     if True:  # self.settings.IsEnabled(flags.ProgressiveItems):
       patch.AddData(0x6D06, [0x18, 0x79, 0x57, 0x06, 0xEA])
 
@@ -116,10 +221,36 @@ class ZoraRandomizer():
 
     # Change "no item" code from 0x03 (Mags) to 0x0E (Triforce of Power)
     patch.AddData(0x1785F, [0x0E])
+    return patch
 
+  def _AddExtras(self, patch: Patch) -> None:
     # Include everything above in the hash code.
     hash_code = patch.GetHashCode()
-    patch.AddData(0xAFD0, hash_code)
+    patch += self._GetHashCodeDisplayPatch()
+    # The last four bytes of the display routine are a placeholder for the hash code, so it has to
+    # come after them.
+    patch.AddData(self.HASH_CODE_ADDRESS, hash_code)
+
+    if self.settings.debug_mode:
+      patch += self.AddRecorderTune()
+
+    patch += self._GetOptionsPatch()
+
+    with self.stats.Time('text'):
+      text_data_table = TextDataTable(self.settings, self.data_table, self.rng)
+      patch += text_data_table.GetPatch()
+
+  @classmethod
+  def ReadHashCode(cls, patch: Patch) -> bytes:
+    """Returns the hash code that GetPatch() wrote into a patch, or b'' if it has none."""
+    for (start, data) in patch.GetRuns():
+      offset = cls.HASH_CODE_ADDRESS - start
+      if 0 <= offset and offset + cls.HASH_CODE_LENGTH <= len(data):
+        return data[offset:offset + cls.HASH_CODE_LENGTH]
+    return b''
+
+  def _GetHashCodeDisplayPatch(self) -> Patch:
+    patch = Patch()
     patch.AddData(0xA4CD, [0x4C, 0x90, 0xAF])
     patch.AddData(0xAFA0, [
         0xA2, 0x0A, 0xA9, 0xFF, 0x95, 0xAC, 0xCA, 0xD0, 0xFB, 0xA2, 0x04, 0xA0, 0x60, 0xBD, 0xBF,
@@ -127,10 +258,10 @@ class ZoraRandomizer():
         0x00, 0x95, 0xAC, 0xCA, 0xD0, 0xE9, 0x20, 0x9D, 0x97, 0xA9, 0x14, 0x85, 0x14, 0xE6, 0x13,
         0x60, 0xFF, 0xFF, 0x1E, 0x0A, 0x06, 0x01
     ])
+    return patch
 
-    if self.settings.debug_mode:
-      patch += self.AddRecorderTune()
-
+  def _GetOptionsPatch(self) -> Patch:
+    patch = Patch()
     if self.settings.IsEnabled(flags.DisableBeeping):
       # Turn off low health warning
       patch.AddData(0x1ED33, [0x00])
@@ -150,9 +281,7 @@ class ZoraRandomizer():
     patch.AddData(
         0x1A129,
         [0x0C, 0x18, 0x0D, 0x0E, 0x24, 0x24, 0x24, 0x24, 0x24, 0x24, 0x24, 0x24, 0x24, 0x24, 0x24])
-
-    text_data_table = TextDataTable(self.settings, self.data_table)
-    patch += text_data_table.GetPatch()
+    return patch
 
   def RandomizeHPValue(self, value: int) -> int:
     hp_setting = self.settings.get_flag_choice(flags.EnemyHP)
@@ -174,7 +303,7 @@ class ZoraRandomizer():
     else:
       # At least one HP setting should be enabled
       assert (False)
-    new_value = random.randrange(value + lower_modifier, value + upper_modifier)
+    new_value = self.rng.randrange(value + lower_modifier, value + upper_modifier)
     if new_value > 0xF:
       return 0xF
     elif new_value < 0x0:
@@ -218,13 +347,13 @@ class ZoraRandomizer():
 
     # take this out -- just for testing with one seed
     patch.AddData(0x18629, [0x05])
-    random.seed(1999)
+    self.rng.seed(1999)
     tunes = []
-    path = "randomizer/data/recorder/"
+    path = os.path.join(DATA_DIRECTORY, 'recorder', '')
     for maybe_tune in os.listdir(path):
       if '.bin' in maybe_tune:
         tunes.append(maybe_tune)
-    tune_filename = random.choice(tunes)
+    tune_filename = self.rng.choice(tunes)
     tune_data = open(path + tune_filename, "r+b").read()
     patch.AddData(0x2030, tune_data)
     print(tunes)
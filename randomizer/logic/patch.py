@@ -1,56 +1,81 @@
 # Taken with love from Dorkmaster Flek's SMRPG Randomizer
 
-from typing import Dict, Iterable, List, Union
+from typing import Dict, Iterable, List, Tuple, Union
 import hashlib
+import re
+import struct
+import zlib
 from django.core.serializers.json import DjangoJSONEncoder
 
+# A write of some data, or the removal of a number of bytes.
+Write = Tuple[int, Union[bytes, int]]
+
+
+class PatchOverlapError(ValueError):
+  pass
+
 
 class Patch:
-  """Class representing a patch for a specific seed that can be added to as we build it."""
+  """Class representing a patch for a specific seed that can be added to as we build it.
+
+  Writes are only recorded as they're made.  The first time the data is read, they're folded into a
+  sorted list of runs that neither overlap nor touch, with the newest write winning where two
+  overlap.  A patch made with allow_overlaps=False raises PatchOverlapError there instead.
+  """
 
-  def __init__(self) -> None:
-    self._data: Dict[int, bytes] = {}
+  _RUN_PATTERN = re.compile(b'\x01+')
+
+  def __init__(self, allow_overlaps: bool = True) -> None:
+    self.allow_overlaps = allow_overlaps
+    self._starts: List[int] = []
+    self._runs: Dict[int, bytearray] = {}
+    # Every write in the order it was made, since the file select hash code is defined over them.
+    # The runs include the first _num_merged_writes of them.
+    self._writes: List[Write] = []
+    self._num_merged_writes = 0
 
   def __add__(self, other: "Patch") -> "Patch":
     """Add another patch to this patch and return a new Patch object."""
     if not isinstance(other, Patch):
       raise TypeError("Other object is not Patch type")
 
-    patch = Patch()
+    patch = Patch(self.allow_overlaps)
     patch += self
     patch += other
     return patch
 
   def __iadd__(self, other: "Patch") -> "Patch":
-    """Add another patch to this patch in place."""
+    """Add another patch to this patch in place.  Its writes are merged in the next time the data
+    is read."""
     if not isinstance(other, Patch):
       raise TypeError("Other object is not Patch type")
 
-    for addr in other.addresses:
-      self.AddData(addr, other.GetData(addr))
-
+    self._writes.extend(other._writes)
     return self
 
   @property
   def addresses(self) -> List[int]:
-    """Returns a List of all addresses in the patch."""
-    return list(self._data.keys())
+    """Returns a List of the start addresses of all runs in the patch."""
+    return self.GetAddresses()
 
   def GetAddresses(self) -> List[int]:
-    """Returns a List of all addresses in the patch."""
-    return list(self._data.keys())
+    """Returns a List of the start addresses of all runs in the patch."""
+    self._MergeWrites()
+    return list(self._starts)
 
   def GetData(self, addr: int) -> List[int]:
-    """Get data in the patch for this address.
-       If the address is not present in the patch, returns empty bytes.
-        :param addr: Address for the start of the data.
+    """Get the data of the run starting at this address.
+        :param addr: Address for the start of the run.
         :type addr: int
-        :rtype: bytearray|bytes|list[int]
+        :rtype: list[int]
         """
-    int_data: List[int] = []
-    for byte in self._data[addr]:
-      int_data.append(byte)
-    return int_data
+    self._MergeWrites()
+    return list(self._runs[addr])
+
+  def GetRuns(self) -> List[Tuple[int, bytes]]:
+    """Returns the start address and data of each run in the patch, in address order."""
+    self._MergeWrites()
+    return [(start, bytes(self._runs[start])) for start in self._starts]
 
   def AddData(self, addr: int, data: Union[Iterable[int], bytes]) -> None:
     """Add data to the patch.
@@ -59,36 +84,258 @@ class Patch:
         :param data: Patch data as raw bytes.
         :type data: bytearray|bytes|list[int]|int|str
         """
-    self._data[addr] = bytes(data)
+    self._writes.append((addr, bytes(data)))
 
-  def RemoveData(self, addr: int) -> None:
-    """Remove data from the patch.
-        :param addr: Address the data was added to.
+  def RemoveData(self, addr: int, num_bytes: int) -> None:
+    """Remove data from the patch, splitting any run that only partly overlaps it.
+        :param addr: Address for the start of the data to remove.
         :type addr: int
+        :param num_bytes: How many bytes to remove.
+        :type num_bytes: int
         """
-    if addr in self._data:
-      del self._data[addr]
+    self._writes.append((addr, num_bytes))
+
+  def _MergeWrites(self) -> None:
+    """Folds the writes made since the last call into the runs."""
+    writes = self._writes[self._num_merged_writes:]
+    if not writes:
+      return
+
+    # Lay the runs and the new writes out in one buffer, marking which bytes are written, and then
+    # read the runs back off the marks.
+    low = min(addr for (addr, unused_data) in writes)
+    high = max(addr + (data if isinstance(data, int) else len(data)) for (addr, data) in writes)
+    if self._starts:
+      last_start = self._starts[-1]
+      low = min(low, self._starts[0])
+      high = max(high, last_start + len(self._runs[last_start]))
+    buffer = bytearray(high - low)
+    written = bytearray(high - low)
+    ones = b'\x01' * (high - low)
+    for (start, run) in self._runs.items():
+      buffer[start - low:start - low + len(run)] = run
+      written[start - low:start - low + len(run)] = ones[:len(run)]
+    for (addr, data) in writes:
+      offset = addr - low
+      if isinstance(data, int):
+        written[offset:offset + data] = bytes(data)
+        continue
+      if not self.allow_overlaps and written.find(1, offset, offset + len(data)) != -1:
+        raise PatchOverlapError("Data at 0x%X-0x%X overlaps data already in the patch" %
+                                (addr, addr + len(data) - 1))
+      buffer[offset:offset + len(data)] = data
+      written[offset:offset + len(data)] = ones[:len(data)]
 
-  def for_json(self) -> List[Dict[int, bytes]]:
+    self._starts = []
+    self._runs = {}
+    for match in self._RUN_PATTERN.finditer(written):
+      self._starts.append(low + match.start())
+      self._runs[low + match.start()] = buffer[match.start():match.end()]
+    self._num_merged_writes += len(writes)
+
+  def for_json(self) -> List[Dict[int, bytearray]]:
     """Return patch as a JSON serializable object.
 
         :rtype: list[dict]
         """
-    patch = []
-    addrs = list(self._data.keys())
-    addrs.sort()
+    self._MergeWrites()
+    return [{start: self._runs[start]} for start in self._starts]
+
+  # Translates the XOR of two bytes to 1 if they're the same and 0 if not.
+  _SAME_BYTE_TABLE = bytes([1] + [0] * 255)
+
+  def GetDelta(self, base: "Patch", max_gap: int = 0) -> "Patch":
+    """Returns the part of this patch that base doesn't already write.
 
-    for addr in addrs:
-      patch.append({addr: self._data[addr]})
+    Applying base and then the delta gives the same bytes as applying this patch, as long as base
+    only writes addresses that this patch writes too.
 
+    Args:
+      base: The patch applied before the delta.
+      max_gap: Bytes that base already writes are kept anyway where there are no more than this
+        many of them between two changed bytes of a run, since starting a new run costs more.
+    """
+    self._MergeWrites()
+    base_runs = base.GetRuns()
+    # Changed bytes, along with any short gaps of unchanged ones between them.
+    changes_pattern = re.compile(b'\x00+(?:\x01{1,%d}\x00+)*' % max_gap if max_gap else b'\x00+')
+    delta = Patch()
+    first_base_run = 0
+    for start in self._starts:
+      run = self._runs[start]
+      end = start + len(run)
+      while (first_base_run < len(base_runs) and
+             base_runs[first_base_run][0] + len(base_runs[first_base_run][1]) <= start):
+        first_base_run += 1
+      # Mark the bytes of the run that base writes with the same value.
+      unchanged = bytearray(len(run))
+      for (base_start, base_run) in base_runs[first_base_run:]:
+        if base_start >= end:
+          break
+        low = max(start, base_start)
+        high = min(end, base_start + len(base_run))
+        data = run[low - start:high - start]
+        base_data = base_run[low - base_start:high - base_start]
+        if data == base_data:
+          unchanged[low - start:high - start] = b'\x01' * (high - low)
+        else:
+          xor = int.from_bytes(data, 'big') ^ int.from_bytes(base_data, 'big')
+          unchanged[low - start:high - start] = xor.to_bytes(
+              high - low, 'big').translate(self._SAME_BYTE_TABLE)
+      for match in changes_pattern.finditer(unchanged):
+        delta._writes.append((start + match.start(), bytes(run[match.start():match.end()])))
+    # The changes are already sorted and neither overlap nor touch, so they're the delta's runs.
+    delta._starts = [addr for (addr, unused_data) in delta._writes]
+    delta._runs = {addr: bytearray(data) for (addr, data) in delta._writes}
+    delta._num_merged_writes = len(delta._writes)
+    return delta
+
+  # Each block in the binary form is a big-endian 4-byte address and 2-byte length, then the data.
+  _BLOCK_HEADER = struct.Struct('>IH')
+  _MAX_BLOCK_LENGTH = 0xFFFF
+
+  def ToBytes(self) -> bytes:
+    """Returns the patch in a compact binary form, with the blocks sorted by address."""
+    self._MergeWrites()
+    encoded = bytearray()
+    for start in self._starts:
+      run = self._runs[start]
+      for offset in range(0, len(run), self._MAX_BLOCK_LENGTH):
+        block = run[offset:offset + self._MAX_BLOCK_LENGTH]
+        encoded += self._BLOCK_HEADER.pack(start + offset, len(block))
+        encoded += block
+    return bytes(encoded)
+
+  @classmethod
+  def FromBytes(cls, encoded: bytes) -> "Patch":
+    """Builds a patch from the binary form returned by ToBytes()."""
+    patch = cls()
+    offset = 0
+    while offset < len(encoded):
+      (addr, length) = cls._BLOCK_HEADER.unpack_from(encoded, offset)
+      offset += cls._BLOCK_HEADER.size
+      patch.AddData(addr, encoded[offset:offset + length])
+      offset += length
     return patch
 
+  # IPS records are a 3-byte offset and 2-byte length, both big-endian, then the data.  A record
+  # with a length of zero is an RLE record instead: a 2-byte count and the byte to repeat.
+  _IPS_RECORD_HEADER = struct.Struct('>HBH')
+  _IPS_RLE_RECORD = struct.Struct('>HBHHB')
+  _IPS_EOF_OFFSET = 0x454F46
+  _IPS_MAX_OFFSET = 0xFFFFFF
+  # Shortest repeated byte worth an RLE record at the start or end of a run, and in the middle of
+  # one, where the data after it needs a record header of its own.
+  _IPS_MIN_RLE_LENGTH_AT_EDGE = 9
+  _IPS_MIN_RLE_LENGTH = 14
+  _IPS_REPEAT_PATTERN = re.compile(b'(.)\\1{%d,}' % (_IPS_MIN_RLE_LENGTH_AT_EDGE - 1), re.DOTALL)
+
+  def ToIps(self) -> bytes:
+    """Returns the patch as an IPS file, using RLE records for long runs of a repeated byte."""
+    self._MergeWrites()
+    ips = bytearray(b'PATCH')
+    for start in self._starts:
+      run = self._runs[start]
+      literal_start = 0
+      for match in self._IPS_REPEAT_PATTERN.finditer(run):
+        at_edge = match.start() == 0 or match.end() == len(run)
+        if len(match.group()) < (self._IPS_MIN_RLE_LENGTH_AT_EDGE
+                                 if at_edge else self._IPS_MIN_RLE_LENGTH):
+          continue
+        self._AddIpsRecords(ips, start + literal_start, run[literal_start:match.start()])
+        self._AddIpsRleRecords(ips, start + match.start(), run[match.start()],
+                               match.end() - match.start())
+        literal_start = match.end()
+      self._AddIpsRecords(ips, start + literal_start, run[literal_start:])
+    ips += b'EOF'
+    return bytes(ips)
+
+  @classmethod
+  def _CheckIpsOffset(cls, offset: int) -> None:
+    # An offset that reads as "EOF" would end the patch early.
+    if offset > cls._IPS_MAX_OFFSET or offset == cls._IPS_EOF_OFFSET:
+      raise ValueError("Address 0x%X can't be used in an IPS patch" % offset)
+
+  @classmethod
+  def _AddIpsRecords(cls, ips: bytearray, offset: int, data: bytearray) -> None:
+    for chunk_offset in range(0, len(data), cls._MAX_BLOCK_LENGTH):
+      chunk = data[chunk_offset:chunk_offset + cls._MAX_BLOCK_LENGTH]
+      cls._CheckIpsOffset(offset + chunk_offset)
+      ips += cls._IPS_RECORD_HEADER.pack((offset + chunk_offset) >> 8,
+                                         (offset + chunk_offset) & 0xFF, len(chunk))
+      ips += chunk
+
+  @classmethod
+  def _AddIpsRleRecords(cls, ips: bytearray, offset: int, value: int, count: int) -> None:
+    for chunk_offset in range(0, count, cls._MAX_BLOCK_LENGTH):
+      cls._CheckIpsOffset(offset + chunk_offset)
+      ips += cls._IPS_RLE_RECORD.pack((offset + chunk_offset) >> 8, (offset + chunk_offset) & 0xFF,
+                                      0, min(count - chunk_offset, cls._MAX_BLOCK_LENGTH), value)
+
+  # BPS patch actions, stored in the low two bits of each command.
+  _BPS_SOURCE_READ = 0
+  _BPS_TARGET_READ = 1
+
+  def ToBps(self, source: bytes) -> bytes:
+    """Returns the patch as a BPS file for the given source ROM.
+
+    Unlike IPS, BPS records checksums of the source and target ROMs, so it needs the source to be
+    built.  Bytes the patch doesn't write are copied from the source, and a ROM shorter than the
+    patch is padded with zeros.
+    """
+    self._MergeWrites()
+    target = bytearray(source)
+    for start in self._starts:
+      run = self._runs[start]
+      if start + len(run) > len(target):
+        target.extend(bytes(start + len(run) - len(target)))
+      target[start:start + len(run)] = run
+
+    bps = bytearray(b'BPS1')
+    bps += self._EncodeBpsNumber(len(source))
+    bps += self._EncodeBpsNumber(len(target))
+    bps += self._EncodeBpsNumber(0)  # No metadata
+    spans = [(start, start + len(self._runs[start])) for start in self._starts]
+    # An empty span at the end, to copy whatever is left of the source.
+    spans.append((len(target), len(target)))
+    offset = 0
+    for (start, end) in spans:
+      # Bytes past the end of the source can't be read from it.
+      unwritten_end = min(start, len(source))
+      if unwritten_end > offset:
+        bps += self._EncodeBpsNumber((unwritten_end - offset - 1) << 2 | self._BPS_SOURCE_READ)
+        offset = unwritten_end
+      if end > offset:
+        bps += self._EncodeBpsNumber((end - offset - 1) << 2 | self._BPS_TARGET_READ)
+        bps += target[offset:end]
+        offset = end
+    bps += struct.pack('<II', zlib.crc32(source), zlib.crc32(target))
+    bps += struct.pack('<I', zlib.crc32(bps))
+    return bytes(bps)
+
+  @staticmethod
+  def _EncodeBpsNumber(number: int) -> bytes:
+    encoded = bytearray()
+    while True:
+      if number < 0x80:
+        encoded.append(0x80 | number)
+        return bytes(encoded)
+      encoded.append(number & 0x7F)
+      number = (number >> 7) - 1
+
   def GetHashCode(self) -> bytes:
+    # Replay the writes the way a dict from start address to data would have stored them.
+    blocks: Dict[int, bytes] = {}
+    for (address, data) in self._writes:
+      if isinstance(data, int):
+        blocks.pop(address, None)
+      else:
+        blocks[address] = data
     to_be_returned = b''
     hash_string = hashlib.sha224()
-    for address in self._data.keys():
+    for address in blocks.keys():
       hash_string.update(str(address).encode('utf-8'))
-      hash_string.update(self._data[address])
+      hash_string.update(blocks[address])
     for int_of_hash in hash_string.digest()[0:4]:
       to_be_returned += bytes([int_of_hash & 0x1F])
     return to_be_returned
@@ -98,7 +345,7 @@ class PatchJSONEncoder(DjangoJSONEncoder):
   """Extension of the Django JSON serializer to support randomizer patch data."""
 
   def default(self, o: Union[bytearray, bytes,
-                             "Patch"]) -> Union[List[Dict[int, bytes]], List[int]]:
+                             "Patch"]) -> Union[List[Dict[int, bytearray]], List[int]]:
     # Support bytes and bytearray objects, which are just lists of integers.
     if isinstance(o, (bytearray, bytes)):
       return list(o)
@@ -1,8 +1,11 @@
+import hashlib
 import random
-from typing import IO, List, Optional
+from typing import IO, List, Optional, Union
 from shutil import copyfile
 from absl import logging as log
 
+from .patch import Patch
+
 
 class Rom():
   """A class representing a video game ROM file stored in a binary file."""
@@ -12,35 +15,81 @@ class Rom():
   def __init__(self,
                rom_filename: str,
                src: Optional[str] = None,
-               add_nes_header_offset: bool = False) -> None:
+               add_nes_header_offset: bool = False,
+               in_memory: bool = False,
+               data: Optional[bytes] = None) -> None:
+    """In memory mode, the whole image is read into a bytearray by OpenFile() and written out
+    to rom_filename once by SaveFile(), instead of being read and written through the file.  The
+    image can also be passed in as data, e.g. to patch one input ROM many times."""
     self.rom_filename = rom_filename
     self.rom_file: IO[bytes]
     self.write_mode = False
     self.add_nes_header_offset = add_nes_header_offset
-    if src:
+    self.in_memory = in_memory
+    self.rom_data: Optional[bytearray] = None
+    self.initial_data = data
+    self.src = src
+    if src and not in_memory:
       copyfile(src, rom_filename)
     self.address = -1
 
   # Opens a ROM file for reading
   def OpenFile(self, write_mode: bool = False) -> None:
     self.write_mode = write_mode
+    if self.in_memory and self.initial_data is not None:
+      self.rom_data = bytearray(self.initial_data)
+      return
+    if self.in_memory:
+      log.info("Reading %s into memory ...\n\n" % (self.src or self.rom_filename))
+      with open(self.src or self.rom_filename, "rb") as rom_file:
+        self.rom_data = bytearray(rom_file.read())
+      return
     log.info("Opening %s %s ...\n\n" % (self.rom_filename, "for writing" if write_mode else ""))
     self.rom_file = open(self.rom_filename, "r+b" if write_mode else "rb")
 
-  def ShuffleRanges(self, start_locations: List[int], num_bytes: int) -> None:
+  def SaveFile(self) -> None:
+    """Writes the ROM image out to rom_filename in one go in memory mode, or closes the file."""
+    if not self.in_memory:
+      self.rom_file.close()
+      return
+    assert self.rom_data is not None, "Need to run OpenFile() first."
+    assert self.write_mode, "Needs to be in write mode!"
+    with open(self.rom_filename, "wb") as rom_file:
+      rom_file.write(self.rom_data)
+
+  def GetSha1(self) -> str:
+    """Returns the SHA-1 of the ROM image, e.g. to check that the input is the expected ROM."""
+    if self.in_memory:
+      assert self.rom_data is not None, "Need to run OpenFile() first."
+      return hashlib.sha1(self.rom_data).hexdigest()
+    with open(self.rom_filename, "rb") as rom_file:
+      return hashlib.sha1(rom_file.read()).hexdigest()
+
+  def ApplyPatch(self, patch: Patch) -> None:
+    """Writes all of the patch's data to the ROM."""
+    for (address, data) in patch.GetRuns():
+      self.WriteBytes(address, data)
+
+  def _GetOffset(self, address: int) -> int:
+    return address + self.NES_HEADER_OFFSET if self.add_nes_header_offset else address
+
+  def ShuffleRanges(self, rng: random.Random, start_locations: List[int], num_bytes: int) -> None:
     """Randomly shuffles up the specified ranges/ranges of data. """
     shuffled_ranges = []
     for location in start_locations:
       shuffled_ranges.append(self.ReadBytes(location, num_bytes))
-    random.shuffle(shuffled_ranges)
+    rng.shuffle(shuffled_ranges)
     for shuffled_range, location in zip(shuffled_ranges, start_locations):
       self.WriteBytes(location, shuffled_range)
 
   def ReadBytes(self, address: int, num_bytes: int = 1) -> List[int]:
     """Reads one or more bytes (represented as Python ints) from the ROM file."""
-    assert self.rom_file, "Need to run OpenFile() first."
     assert num_bytes > 0, "Can't read zero or a negative number of bytes."
-    self.rom_file.seek(address + self.NES_HEADER_OFFSET if self.add_nes_header_offset else address)
+    if self.in_memory:
+      assert self.rom_data is not None, "Need to run OpenFile() first."
+      return list(self.rom_data[self._GetOffset(address):self._GetOffset(address) + num_bytes])
+    assert self.rom_file, "Need to run OpenFile() first."
+    self.rom_file.seek(self._GetOffset(address))
     int_data: List[int] = []
     for read_byte in self.rom_file.read(num_bytes):
       int_data.append(read_byte)
@@ -49,19 +98,18 @@ class Rom():
   def ReadByte(self, address: int) -> int:
     return self.ReadBytes(address, 1)[0]
 
-  def WriteBytes(self, address: int, data: List[int]) -> None:
+  def WriteBytes(self, address: int, data: Union[List[int], bytes, bytearray]) -> None:
     """Writes one or more bytes (represented as Python ints) to the ROM file."""
-    assert self.rom_file, "Need to run OpenFile(write_mode=True) first."
     assert self.write_mode, "Needs to be in write mode!"
     assert data is not None, "Need at least one byte to write."
-
-    offset = 0
-    for byte in data:
-      self.rom_file.seek((address +
-                          self.NES_HEADER_OFFSET if self.add_nes_header_offset else address) +
-                         offset)
-      self.rom_file.write(bytes([byte]))
-      offset = offset + 1
+    offset = self._GetOffset(address)
+    if self.in_memory:
+      assert self.rom_data is not None, "Need to run OpenFile(write_mode=True) first."
+      self.rom_data[offset:offset + len(data)] = bytes(data)
+      return
+    assert self.rom_file, "Need to run OpenFile(write_mode=True) first."
+    self.rom_file.seek(offset)
+    self.rom_file.write(bytes(data))
 
   def WriteByte(self, address: int, data: int) -> None:
     return self.WriteBytes(address, [data])
@@ -1,10 +1,11 @@
 from enum import IntEnum
-from typing import Dict, List
+from typing import Dict, List, Optional
 import math
 import random
 from .constants import RoomAction
 from .direction import Direction
 from .enemy import Enemy
+from .stats import GenerationStats
 
 
 class RoomType(IntEnum):
@@ -211,10 +212,12 @@ class RoomType(IntEnum):
     return self.value in [RoomType.TWO_BEAMOS_ROOM, RoomType.FOUR_BEAMOS_ROOM]
 
   @classmethod
-  def RandomValueOkayForStairs(cls, narrow_stair_room_okay: bool = False) -> "RoomType":
+  def RandomValueOkayForStairs(cls,
+                               rng: random.Random,
+                               narrow_stair_room_okay: bool = False) -> "RoomType":
     while True:
       try:
-        room_type = cls(random.randrange(0x0, 0x29))
+        room_type = cls(rng.randrange(0x0, 0x29))
       except ValueError:
         continue
       if room_type == RoomType.NARROW_STAIR_ROOM and not narrow_stair_room_okay:
@@ -224,11 +227,12 @@ class RoomType(IntEnum):
 
   @classmethod
   def RandomValue(cls,
+                  rng: random.Random,
                   allow_hard_to_place: bool = True,
                   okay_for_enemy: Enemy = Enemy.NO_ENEMY) -> "RoomType":
     while True:
       try:
-        room_type = cls(random.randrange(0x0, 0x29))
+        room_type = cls(rng.randrange(0x0, 0x29))
       except ValueError:
         continue
       enemy = okay_for_enemy
@@ -250,9 +254,9 @@ class RoomType(IntEnum):
         continue
 #      if room_type.HasBeamoses() and random.choice([True, False]):
 #        continue
-      if room_type.HasWater() and random.choice([True, True, True, False]):
+      if room_type.HasWater() and rng.choice([True, True, True, False]):
         continue
-      if room_type.IsBadForTraps() and random.choice([True, False]):
+      if room_type.IsBadForTraps() and rng.choice([True, False]):
         continue
 #      if room_type.IsBadForBosses() and random.choice([True, True, False]):
 #        continue
@@ -262,21 +266,33 @@ class RoomType(IntEnum):
 
   @classmethod
   def GetValidPositionForRoomType(cls,
+                                  rng: random.Random,
                                   room_type_1: "RoomType",
-                                  is_item_position: bool = False) -> int:
-    return cls.GetValidPositionForRoomTypes(room_type_1, RoomType.NO_ROOM_TYPE, is_item_position)
+                                  is_item_position: bool = False,
+                                  stats: Optional[GenerationStats] = None) -> int:
+    return cls.GetValidPositionForRoomTypes(rng, room_type_1, RoomType.NO_ROOM_TYPE,
+                                            is_item_position, stats)
 
   @classmethod
   def GetValidPositionForRoomTypes(cls,
+                                   rng: random.Random,
                                    room_type_1: "RoomType",
                                    room_type_2: "RoomType",
-                                   is_item_position: bool = False) -> int:
+                                   is_item_position: bool = False,
+                                   stats: Optional[GenerationStats] = None) -> int:
+    """Picks a random position that is valid in both room types.
+
+    Some pairs of room types have no position in common, so with stats, this stops with a
+    GenerationAbortedError when the seed's time budget runs out rather than looking forever.
+    """
     #    x_offset = 2
     #    y_offset = 6 if is_item_position else 5
     while True:
+      if stats is not None:
+        stats.CheckBudget()
       #      position_code = (0x10 * random.randint(x_offset + 0, x_offset + 11) +
       #                       random.randint(y_offset + 0, y_offset + 6))
-      position_code = random.randint(0x20, 0xDC)
+      position_code = rng.randint(0x20, 0xDC)
       if not cls.IsValidPositionForRoomType(position_code, room_type_1, is_item_position):
         continue
       if (room_type_2 is not RoomType.NO_ROOM_TYPE and
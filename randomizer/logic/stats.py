@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Union
+
+
+class GenerationAbortedError(Exception):
+  """Generation stopped before the seed was done.  The stats say how far it got."""
+
+  def __init__(self, message: str, stats: "GenerationStats") -> None:
+    super().__init__(message)
+    self.stats = stats
+
+
+class GenerationTimeoutError(GenerationAbortedError):
+  pass
+
+
+class GenerationCancelledError(GenerationAbortedError):
+  pass
+
+
+class GenerationBudget():
+  """How long generating a seed may take, and a way to cancel it from elsewhere.
+
+  Generation checks the budget at a checkpoint in each of its retry loops, so that a seed that
+  can't be made (or that nobody is waiting for any more) doesn't hold its process forever.
+  """
+  # How often to call is_cancelled, which may be slower than checking the clock.
+  CANCELLATION_POLL_INTERVAL = 0.1
+
+  def __init__(self,
+               seconds: Optional[float] = None,
+               is_cancelled: Optional[Callable[[], bool]] = None) -> None:
+    """
+    Args:
+      seconds: Time from now until generation is stopped, or None for no limit.
+      is_cancelled: Called every so often while generating, to check whether to stop.
+    """
+    self.seconds = seconds
+    self._deadline = None if seconds is None else time.monotonic() + seconds
+    self._is_cancelled = is_cancelled
+    self._next_cancellation_poll = 0.0
+    self._cancelled = threading.Event()
+
+  def Cancel(self) -> None:
+    """Stops the generation at its next checkpoint.  Can be called from any thread."""
+    self._cancelled.set()
+
+  def Remaining(self) -> Optional[float]:
+    """Returns the seconds left until the deadline, or None if there's no limit."""
+    if self._deadline is None:
+      return None
+    return max(0.0, self._deadline - time.monotonic())
+
+  def IsCancelled(self) -> bool:
+    if self._cancelled.is_set():
+      return True
+    if self._is_cancelled is None:
+      return False
+    now = time.monotonic()
+    if now < self._next_cancellation_poll:
+      return False
+    self._next_cancellation_poll = now + self.CANCELLATION_POLL_INTERVAL
+    if self._is_cancelled():
+      self.Cancel()
+      return True
+    return False
+
+  def Check(self, stats: "GenerationStats") -> None:
+    if self._deadline is not None and time.monotonic() > self._deadline:
+      raise GenerationTimeoutError("Generation took longer than %gs" % self.seconds, stats)
+    if self.IsCancelled():
+      raise GenerationCancelledError("Generation was cancelled", stats)
+
+
+class GenerationStats():
+  """Wall time per generation phase and attempt counts for each of the rejection loops.
+
+  One instance is shared by all the subsystems working on a seed, so that it is possible to see
+  where the generation time for a given flag combination actually goes.  It also carries the
+  seed's time budget, which the loops check whenever they count an attempt.
+  """
+
+  def __init__(self) -> None:
+    self.phase_times: Dict[str, float] = {}
+    self.attempts: Dict[str, int] = {}
+    self.budget = GenerationBudget()
+    # 'timeout' or 'cancelled' if generation was stopped by its budget.
+    self.aborted: Optional[str] = None
+
+  def Reset(self) -> None:
+    self.phase_times.clear()
+    self.attempts.clear()
+    self.aborted = None
+
+  @contextmanager
+  def Time(self, phase: str) -> Iterator[None]:
+    """Adds the wall time spent inside the with block to the total for the phase."""
+    start_time = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.phase_times[phase] = self.phase_times.get(phase, 0.0) + time.perf_counter() - start_time
+
+  def CheckBudget(self) -> None:
+    """Raises a GenerationAbortedError if the budget is used up or generation was cancelled."""
+    try:
+      self.budget.Check(self)
+    except GenerationTimeoutError:
+      self.aborted = 'timeout'
+      raise
+    except GenerationCancelledError:
+      self.aborted = 'cancelled'
+      raise
+
+  def CountAttempt(self, loop_name: str) -> None:
+    self.CheckBudget()
+    self.attempts[loop_name] = self.attempts.get(loop_name, 0) + 1
+
+  def GetAttempts(self, loop_name: str) -> int:
+    return self.attempts.get(loop_name, 0)
+
+  def GetPhaseTime(self, phase: str) -> float:
+    return self.phase_times.get(phase, 0.0)
+
+  def GetServerTimingHeader(self) -> str:
+    """Formats the phase times for an HTTP Server-Timing header (durations in milliseconds)."""
+    return ', '.join('%s;dur=%.1f' % (phase, seconds * 1000)
+                     for (phase, seconds) in self.phase_times.items())
+
+  def for_json(self) -> Dict[str, Union[None, str, Dict[str, Union[int, float]]]]:
+    return {
+        'phase_times_ms': {
+            phase: round(seconds * 1000, 1) for (phase, seconds) in self.phase_times.items()
+        },
+        'attempts': dict(self.attempts),
+        'aborted': self.aborted,
+    }
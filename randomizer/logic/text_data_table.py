@@ -296,22 +296,39 @@ class TextDataTable():
   TEXT_LEVEL_ADDRESS = 0x19D17
   FAST_TEXT_SPEED_SETTING = 2
 
-  def __init__(self, settings: Settings, data_table: DataTable) -> None:
+  def __init__(self, settings: Settings, data_table: DataTable, rng: random.Random) -> None:
     self.patch = Patch()
     self.settings = settings
+    self.rng = rng
     self.data_table = data_table
     self.hints = self.data_table.location_hints.copy()
     self.hints.extend(self.data_table.item_hints.copy())
-    random.shuffle(self.hints)
+    self.rng.shuffle(self.hints)
 
-  def RandomizeTitleStory(self) -> None:
+  @classmethod
+  def GetBasePatch(cls, settings: Settings) -> Patch:
+    """Returns the text changes that don't depend on the seed: the text speed, the pointers to the
+    hint text and the title screen story."""
+    patch = Patch()
+    if settings.IsEnabled(flags.FastText):
+      patch.AddData(cls.TEXT_SPEED_ADDRESS, [cls.FAST_TEXT_SPEED_SETTING])
+    for (counter, address) in enumerate(cls._GetHintAddresses()):
+      low_byte = address % 0x100
+      high_byte = int((address - low_byte) / 0x100)
+      high_byte += 0x40
+      patch.AddData(0x4000 + 0x10 + 2 * counter, [low_byte, high_byte])
+    cls._AddTitleStoryToPatch(patch)
+    return patch
+
+  @classmethod
+  def _AddTitleStoryToPatch(cls, patch: Patch) -> None:
     addr = 0x1A528
     for line in STAR_WARS_STORY_TEXT:
       log.info("%x" % addr)
       if addr >= 0x1A8B3:
         log.warning("UH OH 1!")
         break
-      self.patch.AddData(addr, self.__ascii_string_to_bytes(line))
+      patch.AddData(addr, cls.__ascii_string_to_bytes(line))
       addr += 0x23
       if "             " in line:
         log.info("blank!")
@@ -319,24 +336,19 @@ class TextDataTable():
       if addr >= 0x1A8B3:
         log.warning("UH OH 2!")
         break
-      self.patch.AddData(addr, self.__ascii_string_to_bytes("  #                          @  "))
+      patch.AddData(addr, cls.__ascii_string_to_bytes("  #                          @  "))
       addr += 0x23
 
   def GetPatch(self) -> Patch:
-    self._MaybeAddTextSpeedToPatch()
     self._MaybeAddLevelNameToPatch()
     self.DoTextyStuff()
-    self.RandomizeTitleStory()
+    self.patch += self.GetBasePatch(self.settings)
     return self.patch
 
-  def _MaybeAddTextSpeedToPatch(self) -> None:
-    if self.settings.IsEnabled(flags.FastText):
-      self.patch.AddData(self.TEXT_SPEED_ADDRESS, [self.FAST_TEXT_SPEED_SETTING])
-
   def _MaybeAddLevelNameToPatch(self) -> None:
     if not self.settings.IsEnabled(flags.RandomizeLevelText):
       return
-    phrase = random_level_text = random.choice([
+    phrase = random_level_text = self.rng.choice([
         'house-',
         'abode-',
         'block-',
@@ -356,13 +368,14 @@ class TextDataTable():
         '_cave-',
     ])
     if self.settings.IsEnabled(flags.FrenchCommunityHints):
-      phrase = random.choice(["monde-", "terre-"])  #, "tempe-"])
+      phrase = self.rng.choice(["monde-", "terre-"])  #, "tempe-"])
     assert len(self.__ascii_string_to_bytes(phrase)) == 6
     self.patch.AddData(self.TEXT_LEVEL_ADDRESS, self.__ascii_string_to_bytes(phrase))
 
-  def __ascii_string_to_bytes(self, phrase: str) -> List[int]:
+  @classmethod
+  def __ascii_string_to_bytes(cls, phrase: str) -> List[int]:
     """Convert the string to a form the game can understand."""
-    return list(map(self._ascii_char_to_bytes, phrase))
+    return list(map(cls._ascii_char_to_bytes, phrase))
 
   @staticmethod
   def _ascii_char_to_bytes(char: str) -> int:
@@ -394,21 +407,19 @@ class TextDataTable():
 
     return misc_char_map[char] or misc_char_map['_']
 
-  def DoTextyStuff(self) -> None:
+  @staticmethod
+  def _GetHintAddresses() -> List[int]:
     addresses: List[int] = []
     for n in range(19):
       addresses.append(0x4050 + n * 0x45)
     for n in range(20):
       addresses.append(0x7770 + n * 0x45)
+    return addresses
 
-    counter = 0
-    for address in addresses:
-      low_byte = address % 0x100
-      high_byte = int((address - low_byte) / 0x100)
-      high_byte += 0x40
-      self.patch.AddData(0x4000 + 0x10 + 2 * counter, [low_byte, high_byte])
+  def DoTextyStuff(self) -> None:
+    # The pointers to the text are in GetBasePatch().
+    for (counter, address) in enumerate(self._GetHintAddresses()):
       self.patch.AddData(address + 0x10, self.NewGenerateTestingString(counter))
-      counter += 1
 
   def NewGenerateTestingString(self, num: int) -> List[int]:
     hint_type = HintType(num)
@@ -422,11 +433,11 @@ class TextDataTable():
       log.warning("Warning! nothing for %s" % hint_type)
       hint_type = HintType.FRENCH_COMMUNITY_HINT if self.settings.IsEnabled(
           flags.FrenchCommunityHints) else HintType.ENGLISH_COMMUNITY_HINT
-      hint = random.choice(COMMUNITY_HINTS[hint_type])
+      hint = self.rng.choice(COMMUNITY_HINTS[hint_type])
     else:
       if self.settings.IsEnabled(flags.FrenchCommunityHints):
         hint_type = HintType.FRENCH_COMMUNITY_HINT
-      hint = random.choice(COMMUNITY_HINTS[hint_type])
+      hint = self.rng.choice(COMMUNITY_HINTS[hint_type])
     lines = hint.split('|')
     num_lines = len(lines)
     tbr: List[int] = []
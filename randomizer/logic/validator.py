@@ -1,28 +1,125 @@
 from absl import logging as log
 import sys
-from typing import List
+from typing import Iterable, List, Optional, Set
 
-from .constants import CaveType, LevelNum, Range, RoomNum, Screen, WallType
+from .constants import CaveType, LevelNum, Range, RoomNum, Screen
 from .data_table import DataTable
 from .direction import Direction
-from .enemy import Enemy
 from .item import Item
-from .inventory import Inventory
+from .inventory import SWORD, Inventory, ItemBit
 from .location import Location
-from .room import Room
-from .room_type import RoomType
+from .logic_graph import LogicGraph, Requirement, RoomNode
 from .settings import Settings
+from .stats import GenerationStats
 from . import flags
 
 
+# Used to describe what's missing when the validator gets stuck.  Keys and heart containers are
+# counted rather than kept in the item mask, so these requirements are never met.
+BEAST_REQUIREMENT = Requirement((SWORD, ItemBit(Item.BOW), ItemBit(Item.SILVER_ARROWS)))
+KEY_REQUIREMENT = Requirement((ItemBit(Item.KEY) | ItemBit(Item.MAGICAL_KEY),))
+HEART_CONTAINER_REQUIREMENT = Requirement((ItemBit(Item.HEART_CONTAINER),))
+
+
+class Blocker():
+  """Something that the validator couldn't get past, e.g. a shutter door or a locked door."""
+
+  def __init__(self,
+               description: str,
+               missing_items: List[List[Item]],
+               level_num: Optional[LevelNum] = None) -> None:
+    self.description = description
+    # Any one of the items in each of the lists would have been needed to get past.
+    self.missing_items = missing_items
+    # The level it's in, or None for the overworld.
+    self.level_num = level_num
+
+  def IsCausedByLayout(self) -> bool:
+    """Whether it's down to the level's layout rather than where the items were put.
+
+    That's the case for items that can't be picked up at all and for running out of keys, since
+    keys aren't shuffled.
+    """
+    return not self.missing_items or self.missing_items == KEY_REQUIREMENT.GetMissingItems(0, 0)
+
+  def __str__(self) -> str:
+    if not self.missing_items:
+      return self.description
+    return "%s (needs %s)" % (self.description, " and ".join(
+        "/".join(item.name for item in items) for items in self.missing_items))
+
+
+class ValidationFailure():
+  """Why a seed isn't beatable, as found by the validator's last traversal."""
+  SHOP_HAS_INCREMENTAL_UPGRADE_ITEM = 'incremental upgrade item in a shop'
+  NO_INITIAL_WEAPON = 'no initial weapon'
+  KIDNAPPED_NOT_RESCUED = 'kidnapped not rescued'
+
+  def __init__(self,
+               reason: str,
+               unentered_levels: Iterable[LevelNum] = (),
+               unreached_locations: Iterable[Location] = (),
+               blockers: Iterable[Blocker] = ()) -> None:
+    self.reason = reason
+    self.unentered_levels = list(unentered_levels)
+    self.unreached_locations = list(unreached_locations)
+    self.blockers = list(blockers)
+
+  def GetRegionsToBlame(self) -> List[Optional[LevelNum]]:
+    """The levels that kept the seed from being beatable, or None for the overworld caves.
+
+    Levels with a blocker that no item could have gotten past come first.  Otherwise, levels that
+    couldn't even be entered put the blame on the overworld caves, and failing that, on the levels
+    with items that couldn't be reached.  Level 9 can never be finished without everything else, so
+    it only gets the blame if nothing else does.  A failure that's down to where the items went
+    (e.g. no weapon in the wood sword cave) doesn't blame anything.
+    """
+    if self.reason != ValidationFailure.KIDNAPPED_NOT_RESCUED:
+      return []
+    regions: List[Optional[LevelNum]] = []
+    for blocker in self.blockers:
+      if blocker.IsCausedByLayout() and blocker.level_num not in regions:
+        regions.append(blocker.level_num)
+    if regions:
+      return regions
+    if self.unentered_levels:
+      return [None]
+    for location in self.unreached_locations:
+      if location.IsLevelRoom() and location.GetLevelNum() != LevelNum.LEVEL_9:
+        if location.GetLevelNum() not in regions:
+          regions.append(location.GetLevelNum())
+    return regions or [LevelNum.LEVEL_9]
+
+  def __str__(self) -> str:
+    lines = [self.reason]
+    if self.unentered_levels:
+      lines.append("Couldn't enter levels %s" %
+                   ", ".join(str(int(level_num)) for level_num in self.unentered_levels))
+    if self.unreached_locations:
+      lines.append("Couldn't reach %d item locations" % len(self.unreached_locations))
+    lines.extend("Blocked by %s" % blocker for blocker in self.blockers)
+    return "\n".join(lines)
+
+
 class Validator():
   NUM_HEARTS_FOR_WHITE_SWORD_ITEM = 5
   NUM_HEARTS_FOR_MAGICAL_SWORD_ITEM = 12
 
-  def __init__(self, data_table: DataTable, settings: Settings) -> None:
+  def __init__(self, data_table: DataTable, settings: Settings, stats: GenerationStats) -> None:
     self.data_table = data_table
     self.settings = settings
+    self.stats = stats
     self.inventory = Inventory()
+    self.logic_graph: Optional[LogicGraph] = None
+    self.visited_nodes = bytearray(LogicGraph.NUM_NODES)
+    self.failure_reason = ''
+    # Only collected while explaining a failure, see GetFailure().
+    self.blockers: Optional[List[Blocker]] = None
+    self.entered_levels: Set[LevelNum] = set()
+
+  def ResetLogicGraph(self) -> None:
+    """Throws away the compiled logic graph.  Needs to be called after generating a new dungeon."""
+    self.logic_graph = None
 
   def _HasInitialWeapon(self) -> bool:
     for screen_num in Screen.POSSIBLE_FIRST_WEAPON_SCREENS:
@@ -43,25 +140,74 @@ class Validator():
 
   def IsSeedValid(self) -> bool:
     log.info("Starting check of whether the seed is valid or not")
-    self.inventory.Reset()
-    self.inventory.SetStillMakingProgressBit()
-    num_iterations = 0
-    self.data_table.ClearAllVisitMarkers()
-
     # TODO: Only check this if incremental upgrade flag is enabled
     if self._IsAnIncrementalUpgradeItemAvaliableInAShop():
       log.warning("Incremental upgrade item found in shop -- shouldn't happen right?")
+      self.failure_reason = ValidationFailure.SHOP_HAS_INCREMENTAL_UPGRADE_ITEM
       return False
 
     if not self._HasInitialWeapon():
       log.warning("No initial weapon -- shouldn't happen right?")
+      self.failure_reason = ValidationFailure.NO_INITIAL_WEAPON
       return False
 
+    self.failure_reason = ValidationFailure.KIDNAPPED_NOT_RESCUED
+    return self.CanRescueKidnapped()
+
+  def GetFailure(self, item_locations: Iterable[Location]) -> ValidationFailure:
+    """Explains why the last call to IsSeedValid() returned False.
+
+    Args:
+      item_locations: The locations of the shuffled items, to tell which ones couldn't be reached.
+    """
+    if self.failure_reason != ValidationFailure.KIDNAPPED_NOT_RESCUED:
+      return ValidationFailure(self.failure_reason)
+    # Go around once more with everything that could be collected, noting what's in the way.
+    self.blockers = []
+    self.entered_levels = set()
+    self.visited_nodes = bytearray(LogicGraph.NUM_NODES)
+    self._VisitAccessibleOverworldCaves()
+    blockers = self.blockers
+    self.blockers = None
+    return ValidationFailure(
+        self.failure_reason,
+        unentered_levels=[
+            level_num for level_num in Range.VALID_LEVEL_NUMBERS
+            if level_num not in self.entered_levels
+        ],
+        unreached_locations=[
+            location for location in item_locations
+            if location.GetUniqueIdentifier() not in self.inventory.item_locations
+        ],
+        blockers=blockers)
+
+  def _AddBlocker(self,
+                  description: str,
+                  requirement: Requirement,
+                  level_num: Optional[LevelNum] = None) -> None:
+    if self.blockers is None:
+      return
+    self.blockers.append(
+        Blocker(description,
+                requirement.GetMissingItems(self.inventory.GetItemMask(),
+                                            self.inventory.GetTriforceCount()), level_num))
+
+  def CanRescueKidnapped(self, assumed_items: Iterable[Item] = ()) -> bool:
+    """Checks whether the game can be beaten when starting out with the assumed items."""
+    self.inventory.Reset()
+    for item in assumed_items:
+      self.inventory.AddAssumedItem(item)
+    self.inventory.SetStillMakingProgressBit()
+    if self.logic_graph is None:
+      self.logic_graph = LogicGraph(self.data_table, self.settings)
+    num_iterations = 0
+
     while self.inventory.StillMakingProgress():
       num_iterations += 1
+      self.stats.CountAttempt('validator_iteration')
       log.info("Iteration #%d of checking" % num_iterations)
       self.inventory.ClearMakingProgressBit()
-      self.data_table.ClearAllVisitMarkers()
+      self.visited_nodes = bytearray(LogicGraph.NUM_NODES)
       self._VisitAccessibleOverworldCaves()
       if self.inventory.Has(Item.KIDNAPPED_PLACEHOLDER_ITEM):
         if not (self.inventory.Has(Item.SILVER_ARROWS) and self.inventory.Has(Item.LADDER) and
@@ -87,61 +233,46 @@ class Validator():
     return False
 
   def _VisitAccessibleOverworldCaves(self) -> None:
-    log.info("Visiting open caves ...")
-    self._ConditionallyVisitCavesForScreens(True, Screen.OPEN_CAVE_SCREENS)
-    log.info("Visiting bomb caves if able ...")
-    self._ConditionallyVisitCavesForScreens(self.inventory.HasSwordOrWand(),
-                                            Screen.BOMB_BLOCKED_CAVE_SCREENS)
-    log.info("Visiting burn bushes if able ...")
-    self._ConditionallyVisitCavesForScreens(self.inventory.HasCandle(),
-                                            Screen.CANDLE_BLOCKED_CAVE_SCREENS)
-    log.info("Visiting power bracelet-blocked caves if able ...")
-    self._ConditionallyVisitCavesForScreens(self.inventory.Has(Item.POWER_BRACELET),
-                                            Screen.POWER_BRACELET_BLOCKED_CAVE_SCREENS)
-    log.info("Visiting raft-blocked caves if able ...")
-    self._ConditionallyVisitCavesForScreens(self.inventory.Has(Item.RAFT),
-                                            Screen.RAFT_BLOCKED_CAVE_SCREENS)
-    log.info("Visiting recorder-blocked caves if able ...")
-    self._ConditionallyVisitCavesForScreens(self.inventory.Has(Item.RECORDER),
-                                            Screen.RECORDER_BLOCKED_CAVE_SCREENS)
+    assert self.logic_graph is not None
+    for (requirement, destinations) in self.logic_graph.overworld_entrances:
+      if not requirement.IsMet(self.inventory.GetItemMask(), self.inventory.GetTriforceCount()):
+        if self.blockers is not None:
+          for destination in destinations:
+            self._AddBlocker("Overworld entrance to %s" % destination.name, requirement)
+        continue
+      for destination in destinations:
+        if isinstance(destination, CaveType):
+          self._VisitCave(destination)
+          continue
+        self.entered_levels.add(destination)
+        log.info("Entering level %s", destination)
+        (start_room_num, entrance_direction) = self.logic_graph.level_entrances[destination]
+        self._RecursivelyTraverseLevel(destination, start_room_num, entrance_direction)
+        log.info("Exiting level %s", destination)
     log.info("Visiting Armos and coast 'virtual caves'")
     self._VisitCave(CaveType.ARMOS_ITEM_VIRTUAL_CAVE)
     self._VisitCave(CaveType.COAST_ITEM_VIRTUAL_CAVE)
 
-  def _ConditionallyVisitCavesForScreens(self, condition: bool, screen_numbers: List[int]) -> None:
-    if not condition:
-      return
-    for screen_number in screen_numbers:
-      level_num_or_cave_type = self.data_table.GetLevelNumberOrCaveType(screen_number)
-      if level_num_or_cave_type in Range.VALID_LEVEL_NUMBERS:
-        level_num = LevelNum(level_num_or_cave_type)
-        log.info("Entering level %s (at screen %x)" % (level_num, screen_number))
-        self._RecursivelyTraverseLevel(level_num,
-                                       self.data_table.GetLevelStartRoomNumber(level_num),
-                                       self.data_table.GetLevelEntranceDirection(level_num))
-        log.info("Exiting level %s" % level_num)
-      elif level_num_or_cave_type in Range.VALID_CAVE_TYPES_WITH_ITEMS:
-        cave_type = CaveType(level_num_or_cave_type)
-        self._VisitCave(cave_type)
-      else:
-        pass
-
   def _VisitCave(self, cave_type: CaveType) -> None:
     if not cave_type.HasItems():
       return
     if (cave_type == CaveType.WHITE_SWORD_CAVE and
         self.inventory.GetHeartCount() < self.NUM_HEARTS_FOR_WHITE_SWORD_ITEM):
       log.info("Can access %s but not enough hearts" % cave_type)
+      self._AddBlocker("Not enough hearts for %s" % cave_type.name, HEART_CONTAINER_REQUIREMENT)
       return
     if (cave_type == CaveType.MAGICAL_SWORD_CAVE and
         self.inventory.GetHeartCount() < self.NUM_HEARTS_FOR_MAGICAL_SWORD_ITEM):
       log.info("Can access %s but not enough hearts" % cave_type)
+      self._AddBlocker("Not enough hearts for %s" % cave_type.name, HEART_CONTAINER_REQUIREMENT)
       return
     if cave_type == CaveType.POTION_SHOP and not self.inventory.Has(Item.LETTER):
       log.info("Can access %s but no paper" % cave_type)
+      self._AddBlocker(cave_type.name, Requirement((ItemBit(Item.LETTER),)))
       return
     if cave_type == CaveType.COAST_ITEM_VIRTUAL_CAVE and not self.inventory.Has(Item.LADDER):
       log.info("Can access %s but no ladder" % cave_type)
+      self._AddBlocker(cave_type.name, Requirement((ItemBit(Item.LADDER),)))
       return
     for position_num in Range.VALID_CAVE_POSITION_NUMBERS:
       location = Location(cave_type=cave_type, position_num=position_num)
@@ -155,156 +286,77 @@ class Validator():
 
   def _RecursivelyTraverseLevel(self, level_num: LevelNum, room_num: RoomNum,
                                 entry_direction: Direction) -> None:
-    log.info("  Visiting level %d room %x" % (level_num, room_num))
-    if not room_num in Range.VALID_ROOM_NUMBERS:
+    if not 0 <= room_num < 0x80:
       return
-    room = self.data_table.GetRoom(level_num, room_num)
-    if room.IsMarkedAsVisited():
+    node_id = LogicGraph.GetNodeId(level_num, room_num)
+    if self.visited_nodes[node_id]:
       return
-    room.MarkAsVisited()
-    current_location = Location.LevelRoom(level_num, room_num)
+    self.visited_nodes[node_id] = True
+    assert self.logic_graph is not None
+    room_node = self.logic_graph.GetRoomNode(node_id, level_num, room_num)
+    inventory = self.inventory
 
     # An item staircase room is a dead-end, so no need to recurse after picking up the item.
-    if room.IsItemStaircase():
-      self.inventory.AddItem(room.GetItem(), current_location)
+    if room_node.kind == RoomNode.ITEM_STAIRCASE:
+      inventory.AddItem(room_node.room.GetItem(), Location.LevelRoom(level_num, room_num))
       return
 
     # For a transport staircase, we don't know whether we came in through the left or right.
     # So try to leave both ways; the one that we came from will have already been marked as
     # visited and just return.
-    if room.IsTransportStaircase():
-      for room_num_to_visit in [room.GetStairwayRoomLeftExit(), room.GetStairwayRoomRightExit()]:
+    if room_node.kind == RoomNode.TRANSPORT_STAIRCASE:
+      for room_num_to_visit in room_node.stairway_exits:
         self._RecursivelyTraverseLevel(level_num, room_num_to_visit, Direction.STAIRCASE)
       return
 
-    if room.HasItem():
-      if self._CanGetRoomItem(entry_direction, room):
-        log.info("-- Room has item %s. Got it!" % room.GetItem())
-        self.inventory.AddItem(room.GetItem(), current_location)
-      else:
-        log.info("-- Room has %s but I can't get it. Enemy is %s" %
-                 (room.GetItem(), room.GetEnemy()))
-    if room.GetEnemy() == Enemy.THE_BEAST and self.inventory.HasBowSilverArrowsAndSword():
-      log.info("Got the triforce of power!")
-      #input()
-      self.inventory.AddItem(Item.TRIFORCE_OF_POWER_PLACEHOLDER_ITEM, current_location)
-    if room.GetEnemy() == Enemy.THE_KIDNAPPED:
+    if room_node.has_item:
+      item_requirement = room_node.GetItemRequirement(entry_direction)
+      if item_requirement is not None and item_requirement.IsMet(
+          inventory.GetItemMask(), inventory.GetTriforceCount()):
+        inventory.AddItem(room_node.room.GetItem(), Location.LevelRoom(level_num, room_num))
+      elif self.blockers is not None:
+        if item_requirement is None:
+          self.blockers.append(
+              Blocker("Item in level %d room %x can't be picked up coming in %s" %
+                      (level_num, room_num, entry_direction.name), [], level_num))
+        else:
+          self._AddBlocker("Item in level %d room %x" % (level_num, room_num), item_requirement,
+                           level_num)
+    if room_node.has_the_beast:
+      if inventory.HasBowSilverArrowsAndSword():
+        log.info("Got the triforce of power!")
+        inventory.AddItem(Item.TRIFORCE_OF_POWER_PLACEHOLDER_ITEM,
+                          Location.LevelRoom(level_num, room_num))
+      elif self.blockers is not None:
+        self._AddBlocker("The beast in level %d room %x" % (level_num, room_num),
+                         BEAST_REQUIREMENT, level_num)
+    if room_node.has_the_kidnapped:
       log.info("Found the kidnapped")
-      self.inventory.AddItem(Item.KIDNAPPED_PLACEHOLDER_ITEM, current_location)
+      inventory.AddItem(Item.KIDNAPPED_PLACEHOLDER_ITEM, Location.LevelRoom(level_num, room_num))
 
-    for direction in (Direction.WEST, Direction.NORTH, Direction.EAST, Direction.SOUTH):
-      if direction == entry_direction:
-        continue
-      if not self.inventory.HasReusableWeapon() and room.GetEnemy().HasHardCombatEnemies():
-        log.info("  Found enemy %s but no reusable weapon. Abort!" % room.GetEnemy())
+    for (exit_direction, next_room_num, next_entry_direction, requirement,
+         is_locked) in room_node.GetEdges(entry_direction):
+      if not requirement.IsMet(inventory.GetItemMask(), inventory.GetTriforceCount()):
+        if self.blockers is not None:
+          self._AddBlocker(
+              "%s exit of level %d room %x" % (exit_direction.name, level_num, room_num),
+              requirement, level_num)
         continue
-      if self._CanMove(entry_direction, direction, level_num, room_num, room):
-        self._RecursivelyTraverseLevel(level_num, RoomNum(room_num + direction),
-                                       direction.Reverse())
-    if room.GetRoomType().HasUnobstructedStairs() or (room.HasStairs() and
-                                                      self._CanDefeatEnemies(room)):
-      if entry_direction != Direction.STAIRCASE:
-        log.info("Taking a staircase in room %s" % room_num)
-        self._RecursivelyTraverseLevel(level_num, room.GetStairsDestination(), Direction.STAIRCASE)
-
-    if room.HasStairs() and not self._CanDefeatEnemies(room):
-      log.info("!!! Can't take a staircase. Enemy is %s" % room.GetEnemy())
-
-  def _CanMove(self, entry_direction: Direction, exit_direction: Direction, level_num: LevelNum,
-               room_num: RoomNum, room: Room) -> bool:
-
-    # Hungry enemy's room doesn't have a closed shutter door. So need a special check to similate
-    # how it's not possible to move up in the room until the goriya has been properly fed.
-    if (exit_direction == Direction.NORTH and room.GetEnemy() == Enemy.HUNGRY_ENEMY and
-        not self.inventory.Has(Item.BAIT)):
-      log.info("!!!!! Hungry enemy block :(")
-      return False
-
-    if not room.GetRoomType().AllowsDoorToDoorMovement(entry_direction, exit_direction,
-                                                       self.inventory.Has(Item.LADDER)):
-      log.info("!!!!! Movement block -- maybe ladder block?  Roomtype %s" % room.GetRoomType())
-      return False
-
-    wall_type = room.GetWallType(exit_direction)
-    if wall_type == WallType.SOLID_WALL:
-      return False
-    if wall_type == WallType.SHUTTER_DOOR and not self._CanDefeatEnemies(room):
-      log.info("!!!!! Can't proceed through shutter door. Enemy is %s" % room.GetEnemy())
-      return False
-
-    if wall_type in [WallType.LOCKED_DOOR_1, WallType.LOCKED_DOOR_2]:
-      if self.inventory.HasKey():
-        self.inventory.UseKey(level_num, room_num, exit_direction)
-      else:
-        log.info("????  Found a locked door but don't have a key. :(")
-        return False
-    return True
-
-  def _CanGetRoomItem(self, entry_direction: Direction, room: Room) -> bool:
-    # Can't pick up a room in any rooms with water/moats without a ladder.
-    # TODO: Make a better determination here based on the drop location and the entry direction.
-    if room.GetRoomType().HasWater() and not self.inventory.Has(Item.LADDER):
-      log.info("!!!!! Ladder block")
-      return False
-    if room.HasDropBitSet() and not self._CanDefeatEnemies(room):
-      log.info("!!!!! Can't get drop item %s because of enemy %s" %
-               (room.GetItem(), room.GetEnemy()))
-      return False
-    if (room.GetRoomType() == RoomType.HORIZONTAL_CHUTE_ROOM and
-        entry_direction in [Direction.NORTH, Direction.SOUTH]):
-      log.info("!!!! OH CHUTE")
-      return False
-    if (room.GetRoomType() == RoomType.VERTICAL_CHUTE_ROOM and
-        entry_direction in [Direction.EAST, Direction.WEST]):
-      log.info("!!!! OH CHUTE 2")
-      return False
-    if room.GetRoomType() in [RoomType.T_ROOM, RoomType.SECOND_QUEST_T_LIKE_ROOM]:
-      log.info("!!!! T WHIZ!")
-      return False
-    return True
-
-  def _CanDefeatEnemies(self, room: Room) -> bool:
-    enemy = room.GetEnemy()
-    if enemy == Enemy.NO_ENEMY:
-      log.info("NO ENEMY")
-    if enemy.HasNoEnemiesToKill():
-      return True
-    if enemy == Enemy.NO_ENEMY:
-      log.info("NO ENEMY -- this shouldn't happen")
-    if enemy.IsBoomerangOnly() and not self.inventory.HasBoomerang():
-      return False
-    if enemy.IsFireOnly() and not self.inventory.HasFireSource():
-      return False
-    if enemy.IsWandOnly() and not self.inventory.Has(Item.WAND):
-      return False
-    if room.HasPowerBraceletRoomAction() and not self.inventory.Has(Item.POWER_BRACELET):
-      return False
-    if (room.HasKillingTheBeastOpensShutterDoorsRoomAction() and
-        not self.inventory.Has(Item.TRIFORCE_OF_POWER_PLACEHOLDER_ITEM)):
-      return False
-    if (enemy == Enemy.ELDER and self.inventory.GetTriforceCount() < 8):
-      log.info("triforce check failed -- %d tringles" % self.inventory.GetTriforceCount())
-      return False
-    if enemy == Enemy.THE_BEAST and not self.inventory.HasBowSilverArrowsAndSword():
-      return False
-    if enemy.IsDigdogger() and not self.inventory.HasRecorderAndReusableWeapon():
-      return False
-    if enemy.IsGohma() and not self.inventory.HasBowAndArrows():
-      return False
-    if enemy.HasWizzrobes() and not self.inventory.HasSword():
-      return False
-    if enemy.HasSwordOrWandRequiredEnemies() and not self.inventory.HasSwordOrWand():
-      return False
-    if enemy.HasOnlyZeroHPEnemies() and not self.inventory.HasReusableWeaponOrBoomerang():
-      return False
-    if enemy == Enemy.HUNGRY_ENEMY and not self.inventory.Has(Item.BAIT):
-      return False
-    if (enemy.HasPolsVoice() and
-        not (self.inventory.HasSwordOrWand() or self.inventory.HasBowAndArrows())):
-      return False
-    if (self.settings.IsEnabled(flags.AvoidHardCombat) and enemy.HasHardCombatEnemies() and
-        not (self.inventory.HasRing() and self.inventory.Has(Item.WHITE_SWORD))):
-      return False
+      if is_locked:
+        if not inventory.HasKey():
+          if self.blockers is not None:
+            self._AddBlocker(
+                "Locked door %s of level %d room %x" % (exit_direction.name, level_num, room_num),
+                KEY_REQUIREMENT, level_num)
+          continue
+        inventory.UseKey(level_num, room_num, exit_direction)
+      self._RecursivelyTraverseLevel(level_num, next_room_num, next_entry_direction)
 
-    # At this point, assume regular enemies
-    return self.inventory.HasReusableWeapon()
+    stairs_edge = room_node.GetStairsEdge(entry_direction)
+    if stairs_edge is not None:
+      (stairs_destination, requirement) = stairs_edge
+      if requirement.IsMet(inventory.GetItemMask(), inventory.GetTriforceCount()):
+        self._RecursivelyTraverseLevel(level_num, stairs_destination, Direction.STAIRCASE)
+      elif self.blockers is not None:
+        self._AddBlocker("Stairs in level %d room %x" % (level_num, room_num), requirement,
+                         level_num)
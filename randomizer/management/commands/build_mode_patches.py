@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+import json
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ...logic.patch import Patch
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MODE_PATCHES = ('linear_mode', 'open_mode')
+
+# Maps each mode patch to the content-hashed filename of its binary form.
+MANIFEST_FILENAME = 'mode_patches.json'
+
+
+def read_json_patch(filename):
+    """
+    Args:
+        filename (str): Patch in the JSON form the website sends, a list of {address: data} writes.
+
+    Returns:
+        randomizer.logic.patch.Patch: The patch.  Later writes win over earlier ones, as they do
+            when the browser applies the JSON.
+
+    """
+    with open(filename) as f:
+        writes = json.load(f)
+    patch = Patch()
+    for write in writes:
+        for address, data in write.items():
+            patch.AddData(int(address), data)
+    return patch
+
+
+def hashed_filename(name, data):
+    """Name a file after its content, as ManifestStaticFilesStorage does, so it never changes."""
+    return '{}.{}.bin'.format(name, hashlib.md5(data).hexdigest()[:12])
+
+
+class Command(BaseCommand):
+    help = ("Convert the JSON mode patches to the binary form of Patch.ToBytes(), with "
+            "precompressed .gz and .br copies and content-hashed filenames.  The JSON patches are "
+            "left as they are.")
+
+    def add_arguments(self, parser):
+        patches_dir = os.path.join(apps.get_app_config('randomizer').path, 'static', 'randomizer',
+                                   'patches')
+        parser.add_argument('--source-dir', default=patches_dir,
+                            help="Directory with the JSON mode patches.")
+        parser.add_argument('--output-dir', default=patches_dir,
+                            help="Directory to write the binary patches and {} to.".format(
+                                MANIFEST_FILENAME))
+
+    def handle(self, *args, **options):
+        source_dir = options['source_dir']
+        output_dir = options['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+        if brotli is None:
+            self.stderr.write("brotli isn't installed, so no .br patches will be written.")
+
+        manifest = {}
+        for name in MODE_PATCHES:
+            json_filename = os.path.join(source_dir, name + '.json')
+            if not os.path.exists(json_filename):
+                raise CommandError("{} doesn't exist".format(json_filename))
+            data = read_json_patch(json_filename).ToBytes()
+            filename = hashed_filename(name, data)
+            manifest[name] = filename
+
+            # WhiteNoise serves the .gz or .br copy of a file in place of it when the client accepts
+            # that encoding.
+            variants = {filename: data, filename + '.gz': gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                variants[filename + '.br'] = brotli.compress(data)
+            for variant_filename, variant_data in variants.items():
+                with open(os.path.join(output_dir, variant_filename), 'wb') as f:
+                    f.write(variant_data)
+
+            json_size = os.path.getsize(json_filename)
+            self.stdout.write("{}: {} bytes of JSON".format(name, json_size))
+            for variant_filename, variant_data in variants.items():
+                self.stdout.write("  {}: {} bytes ({:.1%} of the JSON)".format(
+                    variant_filename, len(variant_data), len(variant_data) / json_size))
+
+        with open(os.path.join(output_dir, MANIFEST_FILENAME), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
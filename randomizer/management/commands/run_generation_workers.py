@@ -0,0 +1,108 @@
+import datetime
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...logic.flags import FlagError
+from ...logic.main import VERSION
+from ...logic.settings import Settings
+from ...logic.stats import GenerationAbortedError
+from ...models import GenerationJob
+from ...views import find_or_generate_seed
+
+logger = logging.getLogger(__name__)
+
+# Seconds between each worker's checks for stale jobs.
+REAP_INTERVAL = 60
+
+
+def run_job(job):
+    """Generate the seed of a claimed job, and record how it went."""
+    seed_settings = Settings(job.seed, job.flags, job.mode, job.debug_mode)
+    try:
+        s, _, stats = find_or_generate_seed(seed_settings, job.race_mode)
+    except FlagError as e:
+        job.fail(e.args[0])
+        return
+    except GenerationAbortedError as e:
+        logger.warning("Generation job {} gave up: {}".format(job.id, e))
+        job.fail(e.args[0])
+        return
+    except Exception:
+        logger.exception("Generation job {} failed".format(job.id))
+        job.fail("Generation failed")
+        return
+    job.finish(s)
+    logger.info("Generation job {} made seed {}: {}".format(job.id, s.hash,
+                                                            stats.GetServerTimingHeader()))
+
+
+def reap_stale_jobs():
+    return GenerationJob.reap_stale(datetime.timedelta(seconds=settings.ZORA_JOB_TIMEOUT),
+                                    settings.ZORA_JOB_MAX_ATTEMPTS,
+                                    datetime.timedelta(seconds=settings.ZORA_JOB_RETENTION))
+
+
+def work(poll_interval, exit_when_empty):
+    """Run queued jobs one at a time until interrupted, or until the queue is empty."""
+    # Workers started with the spawn method begin without Django set up.
+    django.setup()
+    worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+    last_reap = -REAP_INTERVAL
+    try:
+        while True:
+            if time.monotonic() - last_reap >= REAP_INTERVAL:
+                reap_stale_jobs()
+                last_reap = time.monotonic()
+            job = GenerationJob.claim_next(worker, VERSION)
+            if job is not None:
+                try:
+                    run_job(job)
+                except KeyboardInterrupt:
+                    job.requeue()
+                    raise
+                continue
+            if exit_when_empty:
+                return
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Generate the seeds queued through /api/v2/generate."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Number of worker processes, each generating one seed at a time.")
+        parser.add_argument('--poll-interval', type=float, default=0.5,
+                            help="Seconds to wait before checking an empty queue again.")
+        parser.add_argument('--exit-when-empty', action='store_true',
+                            help="Stop once there are no more queued jobs.")
+
+    def handle(self, *args, **options):
+        work_args = (options['poll_interval'], options['exit_when_empty'])
+        if options['processes'] == 1:
+            work(*work_args)
+            return
+
+        # Each process has to open its own database connection.
+        connections.close_all()
+        workers = [multiprocessing.Process(target=work, args=work_args)
+                   for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # The workers were interrupted too, and give their jobs back to the queue as they stop.
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,127 @@
+import gc
+import json
+import os
+import signal
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...generator_pool import GeneratorPoolError, handle_request, serve_connection
+from ...logic.main import VERSION
+
+
+def warm_up():
+    """
+    Generate a seed (one that is quick to make), so that everything generation needs is imported
+    and built before the workers are forked, and shared between them instead of each one loading
+    its own copy.
+    """
+    handle_request(json.dumps({
+        'seed': 4,
+        'flag_string': '',
+        'mode': 'open',
+        'debug_mode': False,
+    }).encode())
+
+
+def is_listening(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(listener):
+    """Accept connections and answer their requests, one connection at a time, until killed."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    while True:
+        (sock, _) = listener.accept()
+        try:
+            serve_connection(sock)
+        except (OSError, GeneratorPoolError, ValueError):
+            # The client went away, or sent something that isn't a request.
+            pass
+
+
+class Command(BaseCommand):
+    help = ("Run a pool of pre-forked processes that generate seeds for the web workers, which "
+            "send them requests over a Unix socket.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.ZORA_GENERATOR_SOCKET,
+                            help="Path of the socket to listen on.  Defaults to the "
+                                 "ZORA_GENERATOR_SOCKET setting.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Number of worker processes, each generating one seed at a time.")
+
+    def handle(self, *args, **options):
+        path = options['socket']
+        if not path:
+            raise CommandError("No socket given, and ZORA_GENERATOR_SOCKET isn't set")
+
+        warm_up()
+        # The workers don't use the database, and mustn't share the connection if there is one.
+        connections.close_all()
+        # Keep the warmed-up objects out of the garbage collector's way, so that collections in the
+        # workers don't write to (and so copy) the pages they share with this process.
+        gc.freeze()
+
+        if os.path.exists(path):
+            if is_listening(path):
+                raise CommandError("A generator pool is already running on {}".format(path))
+            # Left behind by a daemon that didn't shut down cleanly.
+            os.unlink(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(128)
+
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+            for pid in list(workers):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        workers = set()
+        try:
+            for _ in range(options['workers']):
+                workers.add(self.fork_worker(listener))
+            self.stdout.write("Generating version {} seeds in {} processes on {}".format(
+                VERSION, len(workers), path))
+            # Replace workers that die, until told to stop.
+            while workers:
+                try:
+                    (pid, status) = os.wait()
+                except ChildProcessError:
+                    break
+                workers.discard(pid)
+                if not stopping:
+                    self.stderr.write("Worker {} exited with status {}; starting another".format(
+                        pid, status))
+                    workers.add(self.fork_worker(listener))
+        finally:
+            listener.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    @staticmethod
+    def fork_worker(listener):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve(listener)
+            finally:
+                os._exit(1)
+        return pid
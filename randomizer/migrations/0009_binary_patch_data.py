@@ -0,0 +1,101 @@
+import hashlib
+import json
+import struct
+import zlib
+
+from django.db import migrations, models
+
+# The binary form of randomizer.logic.patch.Patch.ToBytes() as of this migration, copied here so
+# that later changes to the Patch class don't change what the migration writes: blocks of up to
+# 0xFFFF bytes, each a 4-byte address and 2-byte length and then the data, sorted by address, with
+# no two blocks overlapping.
+BLOCK_HEADER = struct.Struct('>IH')
+MAX_BLOCK_LENGTH = 0xFFFF
+
+
+def json_patch_to_bytes(patch_json):
+    """Encode a patch stored as a JSON list of {address: data} writes, later writes winning."""
+    memory = {}
+    for block in json.loads(patch_json):
+        for addr, data in block.items():
+            for offset, value in enumerate(data):
+                memory[int(addr) + offset] = value
+
+    encoded = bytearray()
+    addresses = sorted(memory)
+    run_start = 0
+    while run_start < len(addresses):
+        run_end = run_start + 1
+        while (run_end < len(addresses) and run_end - run_start < MAX_BLOCK_LENGTH and
+               addresses[run_end] == addresses[run_end - 1] + 1):
+            run_end += 1
+        encoded += BLOCK_HEADER.pack(addresses[run_start], run_end - run_start)
+        encoded += bytes(memory[addr] for addr in addresses[run_start:run_end])
+        run_start = run_end
+    return bytes(encoded)
+
+
+def bytes_to_json_patch(encoded):
+    writes = []
+    offset = 0
+    while offset < len(encoded):
+        (addr, length) = BLOCK_HEADER.unpack_from(encoded, offset)
+        offset += BLOCK_HEADER.size
+        writes.append({str(addr): list(encoded[offset:offset + length])})
+        offset += length
+    return json.dumps(writes)
+
+
+def encode_json_patches(apps, schema_editor):
+    """Convert patches stored as JSON text to compressed binary patch data."""
+    Patch = apps.get_model('randomizer', 'Patch')
+    for p in Patch.objects.all().iterator():
+        data = json_patch_to_bytes(p.patch_json)
+        p.patch = zlib.compress(data, 9)
+        p.sha1 = hashlib.sha1(data).hexdigest()
+        p.save(update_fields=['patch', 'sha1'])
+
+
+def decode_binary_patches(apps, schema_editor):
+    """Convert compressed binary patch data back to JSON text."""
+    Patch = apps.get_model('randomizer', 'Patch')
+    for p in Patch.objects.all().iterator():
+        p.patch_json = bytes_to_json_patch(zlib.decompress(p.patch))
+        p.save(update_fields=['patch_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('randomizer', '0008_race_mode_spoiler'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='patch',
+            old_name='patch',
+            new_name='patch_json',
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='patch',
+            field=models.BinaryField(default=b''),
+            preserve_default=False,
+        ),
+        migrations.RunPython(encode_json_patches, decode_binary_patches),
+        # With a default, migrating back can add the column to a table that has rows, before
+        # decode_binary_patches fills it in.
+        migrations.AlterField(
+            model_name='patch',
+            name='patch_json',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='patch',
+            name='patch_json',
+        ),
+        migrations.AddIndex(
+            model_name='seed',
+            index=models.Index(fields=['seed', 'version'], name='randomizer__seed_821d9d_idx'),
+        ),
+    ]
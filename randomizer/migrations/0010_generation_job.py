@@ -0,0 +1,40 @@
+# Generated by Django 3.1.2 on 2026-10-17 21:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('randomizer', '0009_binary_patch_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('priority', models.IntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('worker', models.CharField(default='', max_length=100)),
+                ('attempts', models.IntegerField(default=0)),
+                ('seed', models.BigIntegerField()),
+                ('version', models.CharField(max_length=16)),
+                ('mode', models.CharField(max_length=16)),
+                ('debug_mode', models.BooleanField(default=False)),
+                ('flags', models.TextField(default='')),
+                ('race_mode', models.BooleanField(default=False)),
+                ('error', models.TextField(default='')),
+                ('result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='randomizer.seed')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='generationjob',
+            index=models.Index(fields=['status', '-priority', 'created'], name='randomizer__status_681204_idx'),
+        ),
+    ]
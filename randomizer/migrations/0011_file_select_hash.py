@@ -0,0 +1,43 @@
+import struct
+import zlib
+
+from django.db import migrations
+
+# As written by ZoraRandomizer.GetPatch() when this migration was made.
+HASH_CODE_ADDRESS = 0xAFD0
+HASH_CODE_LENGTH = 4
+# Block header of the binary patch data, as in 0009_binary_patch_data.
+BLOCK_HEADER = struct.Struct('>IH')
+
+
+def read_hash_code(encoded):
+    offset = 0
+    while offset < len(encoded):
+        (addr, length) = BLOCK_HEADER.unpack_from(encoded, offset)
+        offset += BLOCK_HEADER.size
+        start = HASH_CODE_ADDRESS - addr
+        if 0 <= start and start + HASH_CODE_LENGTH <= length:
+            return encoded[offset + start:offset + start + HASH_CODE_LENGTH]
+        offset += length
+    return b''
+
+
+def fill_in_file_select_hashes(apps, schema_editor):
+    """Replace the placeholders that seeds were stored with by the hash code in their patch."""
+    Seed = apps.get_model('randomizer', 'Seed')
+    Patch = apps.get_model('randomizer', 'Patch')
+    for p in Patch.objects.filter(region='US', seed__file_select_hash="TODO: add hash here"):
+        Seed.objects.filter(id=p.seed_id).update(
+            file_select_char='',
+            file_select_hash=read_hash_code(zlib.decompress(p.patch)).hex())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('randomizer', '0010_generation_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_in_file_select_hashes, migrations.RunPython.noop),
+    ]
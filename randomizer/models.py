@@ -1,6 +1,16 @@
+import hashlib
+import uuid
+import zlib
+
 from django.db import models
+from django.utils import timezone
 from jsonfield import JSONField
 
+from .logic.patch import Patch as RomPatch
+
+# Length of the content hash used in permalinks, in hex digits.
+HASH_LENGTH = 16
+
 
 class Seed(models.Model):
     hash = models.CharField(max_length=1000, unique=True)
@@ -15,14 +25,148 @@ class Seed(models.Model):
     race_mode = models.BooleanField(default=False)
     spoiler = JSONField(default={})
 
+    class Meta:
+        indexes = [
+            # Looking up a seed that was already generated with the same settings.
+            models.Index(fields=['seed', 'version']),
+        ]
+
 
 class Patch(models.Model):
     seed = models.ForeignKey(Seed, on_delete=models.CASCADE)
     region = models.CharField(max_length=8)
     sha1 = models.CharField(max_length=40)
-    patch = models.TextField()
+    # zlib-compressed RomPatch.ToBytes() output.
+    patch = models.BinaryField()
 
     class Meta:
         unique_together = [
             ('seed', 'region'),
         ]
+
+    @staticmethod
+    def encode(rom_patch):
+        """
+        Args:
+            rom_patch (randomizer.logic.patch.Patch): Patch to store.
+
+        Returns:
+            (bytes, str): Compressed patch data and the SHA-1 of the uncompressed data.
+
+        """
+        data = rom_patch.ToBytes()
+        return zlib.compress(data, 9), hashlib.sha1(data).hexdigest()
+
+    def get_rom_patch(self):
+        """Decompress the stored patch data back into a randomizer.logic.patch.Patch."""
+        return RomPatch.FromBytes(zlib.decompress(self.patch))
+
+
+class GenerationJob(models.Model):
+    """A seed waiting to be generated by a worker (manage.py run_generation_workers)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    # Jobs with a higher priority are run first, and then the oldest ones.
+    priority = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # Worker running the job (host and process id), and how many times one has started it.
+    worker = models.CharField(max_length=100, default='')
+    attempts = models.IntegerField(default=0)
+
+    seed = models.BigIntegerField()
+    version = models.CharField(max_length=16)
+    mode = models.CharField(max_length=16)
+    debug_mode = models.BooleanField(default=False)
+    flags = models.TextField(default='')
+    race_mode = models.BooleanField(default=False)
+
+    result = models.ForeignKey(Seed, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(default='')
+
+    class Meta:
+        indexes = [
+            # Finding the next job to run.
+            models.Index(fields=['status', '-priority', 'created']),
+        ]
+
+    @classmethod
+    def claim_next(cls, worker, version):
+        """
+        Take the next queued job for a worker.  Several workers can call this at once: each job is
+        only given to one of them, without needing row locks, which SQLite doesn't have.
+
+        Args:
+            worker (str): Name of the worker, to tell who is running the job.
+            version (str): Logic version the worker generates.  Jobs queued for other versions are
+                left for other workers.
+
+        Returns:
+            GenerationJob: The job, now running, or None if the queue is empty.
+
+        """
+        while True:
+            job = cls.objects.filter(status=cls.QUEUED, version=version).order_by(
+                '-priority', 'created').first()
+            if job is None:
+                return None
+            claimed = cls.objects.filter(id=job.id, status=cls.QUEUED).update(
+                status=cls.RUNNING, started=timezone.now(), worker=worker,
+                attempts=models.F('attempts') + 1)
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    def finish(self, seed):
+        self.status = self.DONE
+        self.result = seed
+        self.finished = timezone.now()
+        self.save(update_fields=['status', 'result', 'finished'])
+
+    def requeue(self):
+        """Give a job that was started back to the queue, e.g. because its worker is stopping."""
+        GenerationJob.objects.filter(id=self.id, status=self.RUNNING).update(status=self.QUEUED,
+                                                                            worker='')
+
+    def fail(self, error):
+        self.status = self.FAILED
+        self.error = error
+        self.finished = timezone.now()
+        self.save(update_fields=['status', 'error', 'finished'])
+
+    @classmethod
+    def reap_stale(cls, timeout, max_attempts, retention):
+        """
+        Clean up after workers that died, and remove old jobs.
+
+        Args:
+            timeout (datetime.timedelta): How long a job may run before its worker is assumed dead.
+                Such jobs are queued again, or failed once they've been tried max_attempts times.
+            max_attempts (int): How many times a job is started before giving up on it.
+            retention (datetime.timedelta): How long finished jobs are kept.  The seeds they made
+                are kept regardless.
+
+        Returns:
+            int: Number of jobs requeued, failed or removed.
+
+        """
+        now = timezone.now()
+        stale = cls.objects.filter(status=cls.RUNNING, started__lt=now - timeout)
+        failed = stale.filter(attempts__gte=max_attempts).update(
+            status=cls.FAILED, finished=now, error="Generation timed out")
+        requeued = stale.filter(attempts__lt=max_attempts).update(status=cls.QUEUED, worker='')
+        removed, _ = cls.objects.filter(status__in=(cls.DONE, cls.FAILED),
+                                        finished__lt=now - retention).delete()
+        return failed + requeued + removed
@@ -0,0 +1,105 @@
+import collections
+import threading
+from concurrent.futures import Future
+
+HIT = 'hit'
+MISS = 'miss'
+COALESCED = 'coalesced'
+
+
+class ResultCache:
+    """
+    LRU cache of generated seeds, bounded by an estimate of the memory they take.
+
+    Concurrent requests for a key that isn't cached yet share one call to create instead of each
+    making their own ("single flight"): the first request runs it, and the others wait for its
+    result.  The cache is per process, so with several workers each one has its own.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes (int): Total size the cached values may add up to.  0 turns off caching, but
+                not the sharing of in-flight results.
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Key -> (value, size), least recently used first.
+        self._entries = collections.OrderedDict()
+        # Key -> Future of the value that a request is creating right now.
+        self._in_flight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_create(self, key, create, size_of):
+        """
+        Args:
+            key: Hashable key of the value.
+            create (callable): Makes the value if it isn't cached.  Exceptions it raises are raised
+                to every request waiting on it, and nothing is cached.
+            size_of (callable): Estimates the memory a value takes, in bytes.
+
+        Returns:
+            tuple: The value, and how it was found: HIT, MISS (created by this call) or COALESCED
+                (created by a concurrent call).
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], HIT
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+
+        if in_flight is not None:
+            return in_flight.result(), COALESCED
+        return self._create(key, future, create, size_of), MISS
+
+    def _create(self, key, future, create, size_of):
+        try:
+            value = create()
+            size = size_of(value)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if size <= self.max_bytes:
+                self._entries[key] = (value, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._bytes -= evicted_size
+                    self.evictions += 1
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """Return the counters and current size of the cache, for monitoring."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
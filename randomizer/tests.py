@@ -1,3 +1,986 @@
-from django.test import TestCase
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+
+import zora_cli
+
+from . import views
+
+from .admission import CLIENT_LIMIT, QUEUE_FULL, WAIT_TIMEOUT, AdmissionController, Overloaded
+from .generator_pool import (GeneratorPoolClient, GeneratorPoolUnavailableError, receive_message,
+                             serve_connection)
+from .logic.archive import ArchiveError, SeedArchive, WriteSeedArchive
+from .logic.constants import LevelNum, RoomNum
+from .logic.data_table import VANILLA_DATA_PATCH, VANILLA_LEVEL_METADATA, DataTable
+from .logic.flags import FlagError
+from .logic.inventory import Inventory
+from .logic.item import Item
+from .logic.location import Location
+from .logic.logic_graph import LogicGraph
+from .logic.main import VERSION, ZoraRandomizer
+from .logic.patch import Patch, PatchJSONEncoder, PatchOverlapError
+from .logic.rom import Rom
+from .logic.settings import Settings
+from .logic.stats import GenerationBudget, GenerationCancelledError, GenerationTimeoutError
+from .logic.validator import ValidationFailure
+from .models import GenerationJob, Seed
+from .result_cache import ResultCache
+
+# SHA-1 digests of the JSON patch for a few known-good seeds.  Any change to these means seeds that
+# players have already shared would now produce a different ROM.
+GOLDEN_PATCH_DIGESTS = {
+    (4, ''): '5fb2ee938debae62043bedefca2884e2b936452a',
+    (10, ''): '52863d9141a6f07699d750bb18f1431d314186ea',
+    (13, ''): 'd3ed0ac1d78fa1b337901c7c5e0f0f8737470c5f',
+    (4, 'C Hz F T Xblst'): 'fd4b87ecec1f3fa6ca588c138811018c828e3d01',
+}
+
+
+def generate_patch_digest(seed, flag_string=''):
+    randomizer = ZoraRandomizer(Settings(seed, flag_string))
+    randomizer.Randomize()
+    patch = randomizer.GetPatch()
+    return hashlib.sha1(json.dumps(patch, cls=PatchJSONEncoder).encode()).hexdigest()
+
+
+class GenerationTest(SimpleTestCase):
+
+    def test_golden_seeds(self):
+        for (seed, flag_string), digest in GOLDEN_PATCH_DIGESTS.items():
+            with self.subTest(seed=seed, flag_string=flag_string):
+                self.assertEqual(generate_patch_digest(seed, flag_string), digest)
+
+    def test_bytes_left_as_vanilla_are_left_out_of_patch(self):
+        rom = bytearray(random.Random(0).randbytes(0x20010))
+        for (address, data) in VANILLA_DATA_PATCH.GetRuns():
+            rom[address:address + len(data)] = data
+
+        def apply(patch):
+            patched_rom = bytearray(rom)
+            for (address, data) in patch.GetRuns():
+                patched_rom[address:address + len(data)] = data
+            return patched_rom
+
+        for flag_string in ('', 'C Hz F T Xblst'):
+            with self.subTest(flag_string=flag_string):
+                randomizer = ZoraRandomizer(Settings(4, flag_string))
+                randomizer.Randomize()
+                whole_patch = randomizer._GetPatch()
+                randomizer = ZoraRandomizer(Settings(4, flag_string))
+                randomizer.Randomize()
+                patch = randomizer.GetPatch()
+                self.assertLess(len(patch.ToBytes()), len(whole_patch.ToBytes()))
+                self.assertEqual(apply(patch), apply(whole_patch))
+
+    def test_concurrent_generation_is_deterministic(self):
+        """Seeds generated on several threads at once must match the sequential output."""
+        seeds = [seed for (seed, flag_string) in GOLDEN_PATCH_DIGESTS if not flag_string] * 2
+
+        random.seed(0)
+        global_state = random.getstate()
+        with ThreadPoolExecutor(max_workers=len(seeds)) as executor:
+            digests = list(executor.map(generate_patch_digest, seeds))
+
+        for seed, digest in zip(seeds, digests):
+            self.assertEqual(digest, GOLDEN_PATCH_DIGESTS[(seed, '')])
+        # Generation must not touch the shared module-level generator.
+        self.assertEqual(random.getstate(), global_state)
+
+
+class AssumedFillTest(SimpleTestCase):
+
+    def test_assumed_fill_seed_is_valid_and_deterministic(self):
+        randomizer = ZoraRandomizer(Settings(4, 'Ia'))
+        randomizer.Randomize()
+        self.assertTrue(randomizer.validator.IsSeedValid())
+        self.assertEqual(generate_patch_digest(4, 'Ia'), generate_patch_digest(4, 'Ia'))
+
+
+class ValidatorTest(SimpleTestCase):
+
+    def test_logic_graph_is_reused_until_reset(self):
+        randomizer = ZoraRandomizer(Settings(4, ''))
+        randomizer.Randomize()
+        validator = randomizer.validator
+        logic_graph = validator.logic_graph
+        self.assertIsInstance(logic_graph, LogicGraph)
+        self.assertTrue(validator.IsSeedValid())
+        self.assertIs(validator.logic_graph, logic_graph)
+
+        validator.ResetLogicGraph()
+        self.assertTrue(validator.IsSeedValid())
+        self.assertIsNot(validator.logic_graph, logic_graph)
+
+
+class PartialRegenerationTest(SimpleTestCase):
+
+    def test_regenerated_seed_is_valid_and_deterministic(self):
+        flag_string = 'C Hz F T Xblst Ir'
+        randomizer = ZoraRandomizer(Settings(5, flag_string))
+        stats = randomizer.Randomize()
+        self.assertGreaterEqual(stats.GetAttempts('level_regeneration'), 1)
+        self.assertEqual(stats.GetAttempts('dungeon'), 1)
+        self.assertTrue(randomizer.validator.IsSeedValid())
+        digest = hashlib.sha1(
+            json.dumps(randomizer.GetPatch(), cls=PatchJSONEncoder).encode()).hexdigest()
+        self.assertEqual(generate_patch_digest(5, flag_string), digest)
+
+    def test_failure_names_unreached_items(self):
+        randomizer = ZoraRandomizer(Settings(4, ''))
+        randomizer.Randomize()
+        item_locations = randomizer.item_randomizer.item_locations
+        triforce_locations = [
+            location for location in item_locations
+            if location.IsLevelRoom() and
+            randomizer.data_table.GetRoomItem(location) == Item.TRIFORCE
+        ]
+        for location in triforce_locations:
+            randomizer.data_table.SetRoomItem(Item.RUPEE, location)
+        validator = randomizer.validator
+        self.assertFalse(validator.IsSeedValid())
+
+        failure = validator.GetFailure(item_locations)
+        self.assertEqual(failure.reason, ValidationFailure.KIDNAPPED_NOT_RESCUED)
+        unreached_location_ids = [
+            location.GetUniqueIdentifier() for location in failure.unreached_locations
+        ]
+        for location in triforce_locations:
+            self.assertIn(location.GetUniqueIdentifier(), unreached_location_ids)
+        self.assertTrue(failure.blockers)
+        self.assertTrue(failure.GetRegionsToBlame())
+
+
+class InventoryTest(SimpleTestCase):
+
+    def test_items_found_again_are_upgraded(self):
+        inventory = Inventory()
+        for room_num, item in enumerate([Item.WOOD_SWORD, Item.WOOD_SWORD, Item.BLUE_CANDLE,
+                                         Item.BLUE_CANDLE, Item.WOOD_ARROWS, Item.BOW]):
+            inventory.AddItem(item, Location.LevelRoom(LevelNum.LEVEL_1, RoomNum(room_num)))
+        self.assertTrue(inventory.Has(Item.WHITE_SWORD))
+        self.assertFalse(inventory.Has(Item.MAGICAL_SWORD))
+        self.assertTrue(inventory.Has(Item.RED_CANDLE))
+        self.assertTrue(inventory.HasBowAndArrows())
+        self.assertFalse(inventory.HasBowSilverArrowsAndSword())
+
+        inventory.AddItem(Item.WOOD_ARROWS, Location.LevelRoom(LevelNum.LEVEL_1, RoomNum(0x10)))
+        self.assertTrue(inventory.HasBowSilverArrowsAndSword())
+        # Picking up an item from the same location twice doesn't count.
+        inventory.AddItem(Item.WOOD_SWORD, Location.LevelRoom(LevelNum.LEVEL_1, RoomNum(0)))
+        self.assertFalse(inventory.Has(Item.MAGICAL_SWORD))
+
+
+class PatchTest(SimpleTestCase):
+
+    def test_adjacent_writes_are_coalesced(self):
+        patch = Patch()
+        patch.AddData(0x12, [3])
+        patch.AddData(0x10, [1, 2])
+        patch.AddData(0x20, [9])
+        patch.AddData(0x13, [4])
+        self.assertEqual(patch.GetAddresses(), [0x10, 0x20])
+        self.assertEqual(patch.GetData(0x10), [1, 2, 3, 4])
+
+    def test_overlapping_writes(self):
+        patch = Patch()
+        patch.AddData(0x10, [1, 2, 3, 4])
+        patch.AddData(0x0F, [5, 6])
+        self.assertEqual(patch.for_json(), [{0x0F: bytearray([5, 6, 2, 3, 4])}])
+
+        strict_patch = Patch(allow_overlaps=False)
+        strict_patch.AddData(0x10, [1, 2, 3, 4])
+        strict_patch.AddData(0x14, [5])
+        self.assertEqual(strict_patch.GetAddresses(), [0x10])
+        strict_patch.AddData(0x0F, [5, 6])
+        with self.assertRaises(PatchOverlapError):
+            strict_patch.GetAddresses()
+
+    def test_composed_patch_keeps_hash_code(self):
+        first = Patch()
+        first.AddData(0x10, [1])
+        first.AddData(0x11, [2])
+        second = Patch()
+        second.AddData(0x10, [3])
+        second.AddData(0x30, [4])
+        expected = Patch()
+        for addr, data in [(0x10, [1]), (0x11, [2]), (0x10, [3]), (0x30, [4])]:
+            expected.AddData(addr, data)
+
+        first += second
+        self.assertEqual(first.for_json(), [{0x10: bytearray([3, 2])}, {0x30: bytearray([4])}])
+        self.assertEqual(first.GetHashCode(), expected.GetHashCode())
+
+
+    def test_ips_uses_rle_records_for_repeated_bytes(self):
+        patch = Patch()
+        patch.AddData(0x10, [1, 2, 3])
+        patch.AddData(0x100, [7] * 20)
+        self.assertEqual(
+            patch.ToIps(), b'PATCH' + bytes([0x00, 0x00, 0x10, 0x00, 0x03, 1, 2, 3]) +
+            bytes([0x00, 0x01, 0x00, 0x00, 0x00, 0x00, 0x14, 7]) + b'EOF')
+
+    def test_bps_copies_unpatched_bytes_from_source(self):
+        source = bytes(range(16))
+        patch = Patch()
+        patch.AddData(2, [0xAA, 0xBB])
+        patch.AddData(20, [0xCC])
+        target = source[:2] + bytes([0xAA, 0xBB]) + source[4:] + bytes(4) + bytes([0xCC])
+
+        bps = patch.ToBps(source)
+        # Sizes, then: read 2 from the source, 2 from the patch, 12 from the source and the last 5
+        # from the patch.
+        self.assertEqual(
+            bps[:-12], b'BPS1' + bytes([0x90, 0x95, 0x80, 0x84, 0x85, 0xAA, 0xBB, 0xAC, 0x91]) +
+            bytes(4) + bytes([0xCC]))
+        self.assertEqual(bps[-12:-4], zlib.crc32(source).to_bytes(4, 'little') +
+                         zlib.crc32(target).to_bytes(4, 'little'))
+        self.assertEqual(bps[-4:], zlib.crc32(bps[:-4]).to_bytes(4, 'little'))
+
+    def test_delta_leaves_out_what_base_writes(self):
+        base = Patch()
+        base.AddData(0x10, [1, 2, 3, 4])
+        base.AddData(0x20, [5, 6])
+        patch = Patch()
+        patch.AddData(0x0E, [9, 9, 1, 2, 7, 4, 8])
+        patch.AddData(0x20, [5, 6])
+        delta = patch.GetDelta(base)
+        self.assertEqual(delta.GetRuns(), [(0x0E, bytes([9, 9])), (0x12, bytes([7])),
+                                           (0x14, bytes([8]))])
+        self.assertEqual((base + delta).GetRuns(), patch.GetRuns())
+
+        # Gaps of up to max_gap unchanged bytes are kept rather than starting a new run.
+        self.assertEqual(patch.GetDelta(base, max_gap=2).GetRuns(),
+                         [(0x0E, bytes([9, 9, 1, 2, 7, 4, 8]))])
+        patch.AddData(0x30, [1, 0, 0, 0, 1])
+        base.AddData(0x31, [0, 0, 0])
+        self.assertEqual(
+            patch.GetDelta(base, max_gap=2).GetRuns(),
+            [(0x0E, bytes([9, 9, 1, 2, 7, 4, 8])), (0x30, bytes([1])), (0x34, bytes([1]))])
+
+
+class RomTest(SimpleTestCase):
+
+    def test_in_memory_rom_is_written_once_patched(self):
+        patch = Patch()
+        patch.AddData(0x10, [1, 2, 3])
+        patch.AddData(0x30, [4])
+        with tempfile.TemporaryDirectory() as directory:
+            src = os.path.join(directory, 'vanilla.nes')
+            with open(src, 'wb') as f:
+                f.write(bytes(0x40))
+            rom = Rom(os.path.join(directory, 'randomized.nes'), src=src, in_memory=True)
+            rom.OpenFile(write_mode=True)
+            self.assertEqual(rom.GetSha1(), hashlib.sha1(bytes(0x40)).hexdigest())
+            rom.ApplyPatch(patch)
+            self.assertEqual(rom.ReadBytes(0x0F, 5), [0, 1, 2, 3, 0])
+            self.assertFalse(os.path.exists(rom.rom_filename))
+
+            rom.SaveFile()
+            with open(rom.rom_filename, 'rb') as f:
+                self.assertEqual(f.read(), bytes(0x10) + bytes([1, 2, 3]) + bytes(0x1D) + bytes([4]) +
+                                 bytes(0x0F))
+
+
+class BatchTest(SimpleTestCase):
+
+    def test_batch_does_not_depend_on_jobs_and_resumes(self):
+        def read_batch(directory):
+            with open(os.path.join(directory, zora_cli.MANIFEST_FILENAME)) as f:
+                entries = [json.loads(line) for line in f]
+            patches = {}
+            for entry in entries:
+                with open(os.path.join(directory, entry['filename']), 'rb') as f:
+                    patches[entry['seed']] = f.read()
+            return ([(e['seed'], e['flag_string'], e['sha1']) for e in entries], patches)
+
+        with tempfile.TemporaryDirectory() as directory:
+            batches = []
+            for jobs in (1, 2):
+                options = zora_cli.OutputOptions(flag_string='',
+                                                 debug_mode=False,
+                                                 input_filename='zelda.nes',
+                                                 output_location=os.path.join(
+                                                     directory, str(jobs)),
+                                                 patch_format='ips')
+                zora_cli.GenerateBatch(options, [4, 10], jobs=jobs)
+                batches.append(read_batch(options.output_location))
+            self.assertEqual(batches[0], batches[1])
+            self.assertEqual([seed for (seed, _, _) in batches[0][0]], [4, 10])
+
+            # Everything is already there, so nothing is generated again.
+            zora_cli.GenerateBatch(options, [4, 10, 4], jobs=2)
+            self.assertEqual(read_batch(options.output_location), batches[1])
+
+
+    def test_shards_merge_into_one_catalog(self):
+        self.assertEqual(zora_cli.GetShard(list(range(1, 8)), 1, 3), [2, 5])
+        with tempfile.TemporaryDirectory() as directory:
+            shard_locations = []
+            for shard_index in range(2):
+                options = zora_cli.OutputOptions(flag_string='',
+                                                 debug_mode=False,
+                                                 input_filename='zelda.nes',
+                                                 output_location=os.path.join(
+                                                     directory, str(shard_index)),
+                                                 patch_format='ips')
+                zora_cli.GenerateBatch(options, zora_cli.GetShard([4, 10], shard_index, 2))
+                shard_locations.append(options.output_location)
+            catalog = os.path.join(directory, 'catalog')
+
+            report = zora_cli.MergeBatches(shard_locations + shard_locations[:1], catalog, [4, 10])
+            self.assertEqual([entry['seed'] for entry in report.entries], [4, 10])
+            self.assertEqual(zora_cli.ReadManifest(catalog), report.entries)
+            self.assertEqual(sorted(os.listdir(catalog)), [
+                'manifest.jsonl', 'zelda-randomized-10.ips', 'zelda-randomized-4.ips'
+            ])
+            self.assertEqual((report.duplicates, report.conflicts, report.gaps), ([], [], {}))
+
+            report = zora_cli.MergeBatches([catalog, shard_locations[1]], catalog, [4, 10, 13])
+            self.assertEqual(report.duplicates, [('', 10)])
+            self.assertEqual(report.gaps, {'': [13]})
+
+
+class ModePatchTest(SimpleTestCase):
+
+    def test_mode_patches_are_built_from_json(self):
+        patches_dir = os.path.join(os.path.dirname(__file__), 'static', 'randomizer', 'patches')
+        with tempfile.TemporaryDirectory() as directory:
+            stdout = io.StringIO()
+            call_command('build_mode_patches', output_dir=directory, stdout=stdout,
+                         stderr=io.StringIO())
+            with open(os.path.join(directory, 'mode_patches.json')) as f:
+                manifest = json.load(f)
+            self.assertEqual(sorted(manifest), ['linear_mode', 'open_mode'])
+            for (name, filename) in manifest.items():
+                self.assertIn(filename, stdout.getvalue())
+                with gzip.open(os.path.join(directory, filename + '.gz')) as f:
+                    patch = Patch.FromBytes(f.read())
+                with open(os.path.join(patches_dir, name + '.json')) as f:
+                    json_patch = Patch()
+                    for write in json.load(f):
+                        for (address, data) in write.items():
+                            json_patch.AddData(int(address), data)
+                self.assertEqual(patch.GetRuns(), json_patch.GetRuns())
+
+
+class ArchiveTest(SimpleTestCase):
+
+    def test_patches_are_found_by_version_seed_and_flags(self):
+        patches = {}
+        for seed in range(1, 200):
+            patch = Patch()
+            patch.AddData(seed, [seed & 0xFF] * 3)
+            for version in ('1.0', '0.9'):
+                for flag_string in ('', 'C Hz F T Xblst'):
+                    patches[(version, seed, flag_string)] = zlib.compress(patch.ToBytes())
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'seeds.zora')
+            # Shuffled, since the writer sorts the index itself.
+            keys = list(patches)
+            random.Random(0).shuffle(keys)
+            self.assertEqual(WriteSeedArchive(filename, [(key, patches[key]) for key in keys]),
+                             len(patches))
+
+            with SeedArchive(filename) as archive:
+                self.assertEqual(len(archive), len(patches))
+                for key in patches:
+                    self.assertEqual(archive.GetEncodedPatch(*key), patches[key])
+                self.assertEqual(archive.GetPatch('1.0', 57, 'C Hz F T Xblst').GetRuns(),
+                                 [(57, bytes([57] * 3))])
+                self.assertIsNone(archive.GetPatch('1.0', 200, ''))
+                self.assertIsNone(archive.GetPatch('1.0', 0, ''))
+                self.assertIsNone(archive.GetPatch('1.1', 57, ''))
+                self.assertIsNone(archive.GetPatch('1.0', 57, 'C'))
+
+            with self.assertRaises(ArchiveError):
+                WriteSeedArchive(filename, [(('1.0', 1, ''), b'a'), (('1.0', 1, ''), b'b')])
+            WriteSeedArchive(filename, [(('1.0', 1, ''), b'a')])
+            with open(filename, 'r+b') as f:
+                data = f.read()
+                f.seek(data.index(b'a'))
+                f.write(b'b')
+            with SeedArchive(filename) as archive:
+                with self.assertRaises(ArchiveError):
+                    archive.GetEncodedPatch('1.0', 1, '')
+            with open(filename, 'wb') as f:
+                f.write(b'PATCH' + bytes(40))
+            with self.assertRaises(ArchiveError):
+                SeedArchive(filename)
+
+
+class DataTableTest(SimpleTestCase):
+
+    def test_vanilla_data_does_not_depend_on_working_directory(self):
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            data_table = DataTable(random.Random(0))
+            data_table.ResetToVanilla()
+        self.assertEqual(bytes(data_table.level_metadata), VANILLA_LEVEL_METADATA)
+
+    def test_reset_restores_vanilla_level_metadata(self):
+        data_table = DataTable(random.Random(0))
+        data_table.ResetToVanilla()
+        data_table.level_metadata[0] ^= 0xFF
+        data_table.ResetToVanilla()
+        self.assertEqual(bytes(data_table.level_metadata), VANILLA_LEVEL_METADATA)
+
+
+class GenerationStatsTest(TestCase):
+
+    def test_phases_and_attempts_are_recorded(self):
+        randomizer = ZoraRandomizer(Settings(4, ''))
+        stats = randomizer.Randomize()
+        randomizer.GetPatch()
+
+        for phase in ['grid', 'level_plan', 'room_trees', 'items', 'validation', 'patch', 'text']:
+            self.assertGreater(stats.GetPhaseTime(phase), 0, phase)
+        for loop_name in ['dungeon', 'item_shuffle', 'grid', 'room_tree', 'validator_iteration']:
+            self.assertGreaterEqual(stats.GetAttempts(loop_name), 1, loop_name)
+        # Every dungeon attempt reshuffles items at least once.
+        self.assertGreaterEqual(stats.GetAttempts('item_shuffle'), stats.GetAttempts('dungeon'))
+
+    def test_generate_view_reports_stats(self):
+        response = self.client.post(reverse('randomizer:generate'), {'seed': '4', 'stats': 'on'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('room_trees;dur=', response['Server-Timing'])
+        stats = response.json()['stats']
+        self.assertIn('validation', stats['phase_times_ms'])
+        self.assertGreaterEqual(stats['attempts']['dungeon'], 1)
+
+    def test_generation_stops_when_budget_runs_out(self):
+        # Seed 1 never gets past laying out the dungeon grids.
+        randomizer = ZoraRandomizer(Settings(1, ''))
+        with self.assertRaises(GenerationTimeoutError) as context:
+            randomizer.Randomize(GenerationBudget(0.5))
+        self.assertEqual(context.exception.stats.aborted, 'timeout')
+        self.assertGreaterEqual(context.exception.stats.GetAttempts('grid'), 1)
+
+        budget = GenerationBudget()
+        threading.Timer(0.5, budget.Cancel).start()
+        with self.assertRaises(GenerationCancelledError) as context:
+            randomizer.Randomize(budget)
+        self.assertEqual(context.exception.stats.aborted, 'cancelled')
+
+        with self.assertRaises(GenerationCancelledError):
+            randomizer.Randomize(GenerationBudget(is_cancelled=lambda: True))
+
+    def test_generate_view_gives_up_after_budget(self):
+        with self.settings(ZORA_GENERATION_BUDGET=0.5):
+            with self.assertLogs('randomizer.views', 'WARNING'):
+                response = self.client.post(reverse('randomizer:generate'), {'seed': '1'})
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(response.json()['stats']['aborted'], 'timeout')
+        self.assertIn('grid;dur=', response['Server-Timing'])
+        self.assertFalse(Seed.objects.filter(seed=1).exists())
+
+
+class ResultCacheTest(SimpleTestCase):
+
+    def test_concurrent_misses_share_one_creation(self):
+        cache = ResultCache(max_bytes=100)
+        release = threading.Event()
+        calls = []
+
+        def create():
+            calls.append(1)
+            release.wait()
+            return 'value'
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(cache.get_or_create, 'key', create, len) for _ in range(4)]
+            while cache.coalesced < 3:
+                time.sleep(0.001)
+            release.set()
+            results = sorted(future.result() for future in futures)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [('value', 'coalesced')] * 3 + [('value', 'miss')])
+        self.assertEqual(cache.get_or_create('key', create, len), ('value', 'hit'))
+        self.assertEqual(len(calls), 1)
+
+    def test_least_recently_used_values_are_evicted_by_size(self):
+        cache = ResultCache(max_bytes=10)
+        for key in ('a', 'b', 'c'):
+            cache.get_or_create(key, lambda: 'xxxx', len)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+        self.assertEqual(cache.get_or_create('b', lambda: 'yyyy', len), ('xxxx', 'hit'))
+        self.assertEqual(cache.get_or_create('a', lambda: 'yyyy', len), ('yyyy', 'miss'))
+        # Too big to keep at all.
+        cache.get_or_create('d', lambda: 'z' * 11, len)
+        self.assertEqual(cache.get_stats()['bytes'], 8)
+
+        def fail():
+            raise FlagError("Unknown flag")
+        with self.assertRaises(FlagError):
+            cache.get_or_create('e', fail, len)
+        self.assertEqual(cache.get_or_create('e', lambda: 'ok', len), ('ok', 'miss'))
+
+
+class AdmissionControllerTest(TransactionTestCase):
+
+    def setUp(self):
+        views._admission_controller = None
+        self.addCleanup(setattr, views, '_admission_controller', None)
+
+    @staticmethod
+    def hold_slot(controller, client):
+        """Take a slot (possibly after waiting) in a thread, and keep it until the event is set."""
+        release = threading.Event()
+        admitted = threading.Event()
+
+        def run():
+            with controller.admit(client):
+                admitted.set()
+                release.wait()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread, admitted, release
+
+    def wait_for_waiting(self, controller, count):
+        deadline = time.monotonic() + 10
+        while controller.get_stats()['waiting'] != count:
+            self.assertLess(time.monotonic(), deadline, "Nothing waiting for a slot")
+            time.sleep(0.01)
+
+    def test_requests_over_the_limit_wait_then_are_shed(self):
+        controller = AdmissionController(max_running=1, max_waiting=1, max_per_client=2,
+                                         max_wait=60)
+        thread_a, admitted_a, release_a = self.hold_slot(controller, 'a')
+        admitted_a.wait()
+        thread_b, admitted_b, release_b = self.hold_slot(controller, 'b')
+        self.wait_for_waiting(controller, 1)
+
+        with self.assertRaises(Overloaded) as context:
+            with controller.admit('c'):
+                pass
+        self.assertEqual(context.exception.reason, QUEUE_FULL)
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+
+        release_a.set()
+        self.assertTrue(admitted_b.wait(10))
+        release_b.set()
+        thread_a.join()
+        thread_b.join()
+
+        controller.max_wait = 0.1
+        with controller.admit('a'):
+            with self.assertRaises(Overloaded) as context:
+                with controller.admit('b'):
+                    pass
+        self.assertEqual(context.exception.reason, WAIT_TIMEOUT)
+        stats = controller.get_stats()
+        self.assertEqual((stats['running'], stats['waiting']), (0, 0))
+        self.assertEqual((stats['admitted'], stats['waited']), (3, 2))
+        self.assertEqual(stats['shed'], {QUEUE_FULL: 1, CLIENT_LIMIT: 0, WAIT_TIMEOUT: 1})
+
+    def test_freed_slots_go_to_clients_with_fewest_running(self):
+        controller = AdmissionController(max_running=2, max_waiting=4, max_per_client=3,
+                                         max_wait=60)
+        holders = [self.hold_slot(controller, 'a') for _ in range(2)]
+        for (_, admitted, _) in holders:
+            admitted.wait()
+        holders.append(self.hold_slot(controller, 'a'))
+        self.wait_for_waiting(controller, 1)
+        holders.append(self.hold_slot(controller, 'b'))
+        self.wait_for_waiting(controller, 2)
+
+        # Client a already has all it may have running or waiting.
+        with self.assertRaises(Overloaded) as context:
+            with controller.admit('a'):
+                pass
+        self.assertEqual(context.exception.reason, CLIENT_LIMIT)
+
+        # b arrived later, but has nothing running, so it goes first.
+        holders[0][2].set()
+        self.assertTrue(holders[3][1].wait(10))
+        self.assertFalse(holders[2][1].is_set())
+
+        for (thread, _, release) in holders:
+            release.set()
+            thread.join()
+        self.assertEqual(controller.get_stats()['clients'], 0)
+
+    def test_client_limit_applies_while_slots_are_free(self):
+        controller = AdmissionController(max_running=4, max_waiting=4, max_per_client=1,
+                                         max_wait=0.1)
+        with controller.admit('a'):
+            with self.assertRaises(Overloaded) as context:
+                with controller.admit('a'):
+                    pass
+            self.assertEqual(context.exception.reason, CLIENT_LIMIT)
+            with controller.admit('b'):
+                self.assertEqual(controller.get_stats()['running'], 2)
+
+    def test_request_sharing_a_shed_generation_tries_for_itself(self):
+        views._result_cache = None
+        self.addCleanup(setattr, views, '_result_cache', None)
+        controller = views._admission_controller = AdmissionController(
+            max_running=1, max_waiting=2, max_per_client=2, max_wait=0.5)
+        holder, admitted, release = self.hold_slot(controller, 'other')
+        self.addCleanup(release.set)
+        admitted.wait()
+        responses = {}
+
+        def post(address):
+            responses[address] = self.client.post(reverse('randomizer:generate'), {'seed': '4'},
+                                                  REMOTE_ADDR=address)
+
+        with self.assertLogs('randomizer.views', 'WARNING'):
+            # The first client waits for a slot, and the second waits for the first's seed.
+            first = threading.Thread(target=post, args=('10.0.0.1',))
+            first.start()
+            self.wait_for_waiting(controller, 1)
+            second = threading.Thread(target=post, args=('10.0.0.2',))
+            second.start()
+            deadline = time.monotonic() + 10
+            while views._get_result_cache().get_stats()['coalesced'] != 1:
+                self.assertLess(time.monotonic(), deadline, "Second request didn't coalesce")
+                time.sleep(0.01)
+
+            # The first times out waiting, and the second gets in line for itself.
+            first.join()
+            self.assertEqual(responses['10.0.0.1'].status_code, 503)
+            self.wait_for_waiting(controller, 1)
+            release.set()
+            holder.join()
+            second.join()
+        self.assertEqual(responses['10.0.0.2'].status_code, 200)
+        self.assertEqual(responses['10.0.0.2']['X-Zora-Cache'], 'miss')
+
+    def test_generate_view_sheds_load(self):
+        with self.settings(ZORA_MAX_GENERATIONS=0, ZORA_MAX_WAITING_GENERATIONS=0):
+            with self.assertLogs('randomizer.views', 'WARNING'):
+                response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+
+            response = self.client.get(reverse('randomizer:api-v1-admission-stats'))
+            self.assertEqual(response.json()['shed'][QUEUE_FULL], 1)
+
+    def test_stored_seeds_are_served_without_a_slot(self):
+        views._result_cache = None
+        self.addCleanup(setattr, views, '_result_cache', None)
+        generated = self.client.post(reverse('randomizer:generate'), {'seed': '4'}).json()
+        views._result_cache = None
+
+        views._admission_controller = None
+        with self.settings(ZORA_MAX_GENERATIONS=0, ZORA_MAX_WAITING_GENERATIONS=0):
+            response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('store;dur=', response['Server-Timing'])
+            self.assertEqual(response.json()['hash'], generated['hash'])
+            stats = views._get_admission_controller().get_stats()
+            self.assertEqual((stats['admitted'], sum(stats['shed'].values())), (0, 0))
+
+
+class SeedStoreTest(TestCase):
+
+    def setUp(self):
+        # Seeds cached by other tests are gone from the database with their transactions.
+        views._result_cache = None
+        self.addCleanup(setattr, views, '_result_cache', None)
+
+    def test_patch_binary_form_round_trips(self):
+        randomizer = ZoraRandomizer(Settings(4, ''))
+        randomizer.Randomize()
+        patch = randomizer.GetPatch()
+        decoded = Patch.FromBytes(patch.ToBytes())
+        self.assertEqual(json.dumps(decoded, cls=PatchJSONEncoder),
+                         json.dumps(patch, cls=PatchJSONEncoder))
+
+    def test_rerolled_seed_is_served_from_store(self):
+        response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+        self.assertIn('room_trees;dur=', response['Server-Timing'])
+        generated = response.json()
+        self.assertEqual(Seed.objects.get().hash, generated['hash'])
+        digest = hashlib.sha1(json.dumps(generated['patch']).encode()).hexdigest()
+        self.assertEqual(digest, GOLDEN_PATCH_DIGESTS[(4, '')])
+
+        response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+        self.assertNotIn('room_trees', response['Server-Timing'])
+        self.assertEqual(response['X-Zora-Cache'], 'hit')
+        self.assertEqual(response.json(), generated)
+        self.assertEqual(Seed.objects.count(), 1)
+        cache_stats = self.client.get(reverse('randomizer:api-v1-cache-stats')).json()
+        self.assertEqual((cache_stats['hits'], cache_stats['misses']), (1, 1))
+
+        # Without the cache, it comes from the database.
+        views._get_result_cache().clear()
+        response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+        self.assertIn('store;dur=', response['Server-Timing'])
+        self.assertNotIn('room_trees', response['Server-Timing'])
+        self.assertEqual(response.json(), generated)
+
+        response = self.client.get(generated['permalink'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('randomizer:generate-from-hash',
+                                           kwargs={'hash': generated['hash'], 'region': 'EU'}))
+        self.assertEqual(response.json()['patch'], generated['patch'])
+        self.assertEqual(response.json()['seed'], 4)
+
+        # The hash code that the seed shows on the file select screen.
+        patch = Patch()
+        for write in generated['patch']:
+            for address, data in write.items():
+                patch.AddData(int(address), data)
+        hash_code = ZoraRandomizer.ReadHashCode(patch)
+        self.assertEqual(len(hash_code), ZoraRandomizer.HASH_CODE_LENGTH)
+        self.assertEqual(generated['file_select_hash'], hash_code.hex())
+        self.assertEqual(response.json()['file_select_hash'], hash_code.hex())
+
+    def test_seed_is_served_from_archive(self):
+        archived_patch = Patch()
+        archived_patch.AddData(0x10, [1, 2, 3])
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'seeds.zora')
+            WriteSeedArchive(filename, [(('1.0', 4, ''), zlib.compress(archived_patch.ToBytes()))])
+            views._open_seed_archive.cache_clear()
+            self.addCleanup(views._open_seed_archive.cache_clear)
+            with self.settings(ZORA_SEED_ARCHIVE=filename):
+                response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+                views._open_seed_archive().Close()
+        self.assertIn('archive;dur=', response['Server-Timing'])
+        self.assertNotIn('room_trees', response['Server-Timing'])
+        self.assertEqual(response.json()['patch'], [{'16': [1, 2, 3]}])
+        self.assertEqual(Seed.objects.get().hash, response.json()['hash'])
+
+    def test_delta_and_base_patch_make_up_the_patch(self):
+        response = self.client.post(reverse('randomizer:generate') + '?delta=1', {'seed': '4'})
+        delta = response.json()
+        base_response = self.client.get(delta['base_patch'])
+        self.assertIn('max-age=31536000', base_response['Cache-Control'])
+        self.assertIn('immutable', base_response['Cache-Control'])
+
+        patch = Patch()
+        for run in base_response.json()['patch'] + delta['patch']:
+            for (address, data) in run.items():
+                patch.AddData(int(address), data)
+        digest = hashlib.sha1(json.dumps(patch, cls=PatchJSONEncoder).encode()).hexdigest()
+        self.assertEqual(digest, GOLDEN_PATCH_DIGESTS[(4, '')])
+
+        url = reverse('randomizer:generate-from-hash', kwargs={'hash': delta['hash'], 'region': 'US'})
+        self.assertEqual(self.client.get(url + '?delta=1').json()['patch'], delta['patch'])
+        url = reverse('randomizer:api-v1-base-patch', kwargs={'version': '0.1'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_binary_patch_is_negotiated(self):
+        response = self.client.post(reverse('randomizer:api-v1-generate'), json.dumps({'seed': '4'}),
+                                    content_type='application/json',
+                                    HTTP_ACCEPT='application/octet-stream')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Zora-Seed'], '4')
+        self.assertEqual(response['X-Zora-Flag-String'], '')
+        patch = Patch.FromBytes(response.content)
+        digest = hashlib.sha1(json.dumps(patch, cls=PatchJSONEncoder).encode()).hexdigest()
+        self.assertEqual(digest, GOLDEN_PATCH_DIGESTS[(4, '')])
+
+        url = reverse('randomizer:generate-from-hash',
+                      kwargs={'hash': response['X-Zora-Hash'], 'region': 'US'})
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='application/octet-stream').content,
+                         response.content)
+        # JSON stays the default, e.g. for jQuery's "application/json, text/javascript, */*".
+        json_response = self.client.get(
+            url, HTTP_ACCEPT='application/json, application/octet-stream;q=0.5')
+        self.assertEqual(json_response['Content-Type'], 'application/json')
+        self.assertIn('Accept', json_response['Vary'])
+        binary_delta = self.client.get(url + '?delta=1', HTTP_ACCEPT='application/octet-stream')
+        self.assertEqual(binary_delta['X-Zora-Base-Patch'],
+                         self.client.get(url + '?delta=1').json()['base_patch'])
+        self.assertEqual(json.dumps(Patch.FromBytes(binary_delta.content), cls=PatchJSONEncoder),
+                         json.dumps(self.client.get(url + '?delta=1').json()['patch']))
+
+        for (encoding, decompress) in (('gzip', gzip.decompress), ('deflate', zlib.decompress)):
+            compressed = self.client.get(url, HTTP_ACCEPT='application/octet-stream',
+                                         HTTP_ACCEPT_ENCODING=encoding + ', br;q=0.5')
+            self.assertEqual(compressed['Content-Encoding'], encoding)
+            self.assertEqual(decompress(compressed.content), response.content)
+            compressed = self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+            self.assertEqual(json.loads(decompress(compressed.content)), json_response.json())
+
+    def test_patch_formats(self):
+        response = self.client.post(reverse('randomizer:api-v1-generate') + '?format=ips',
+                                    json.dumps({'seed': '4'}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'PATCH'))
+        self.assertIn('.ips', response['Content-Disposition'])
+
+        seed = Seed.objects.get()
+        url = reverse('randomizer:generate-from-hash', kwargs={'hash': seed.hash, 'region': 'US'})
+        self.assertEqual(self.client.get(url + '?format=ips').content, response.content)
+        with self.settings(ZORA_BASE_ROM=''):
+            self.assertEqual(self.client.get(url + '?format=bps').status_code, 400)
+        self.assertEqual(self.client.get(url + '?format=zip').status_code, 400)
+
+
+class GenerationJobTest(TestCase):
+
+    def post_job(self, data):
+        return self.client.post(reverse('randomizer:api-v2-generate'), json.dumps(data),
+                                content_type='application/json')
+
+    def test_queued_job_is_generated_by_worker(self):
+        response = self.post_job({'seed': '4'})
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual((job['status'], job['position']), ('queued', 0))
+        self.assertEqual(response['Location'], job['url'])
+
+        call_command('run_generation_workers', exit_when_empty=True)
+        response = self.client.get(job['url'])
+        job = response.json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['seed']['hash'], Seed.objects.get().hash)
+        patch = self.client.get(job['seed']['patch']).json()['patch']
+        digest = hashlib.sha1(json.dumps(patch).encode()).hexdigest()
+        self.assertEqual(digest, GOLDEN_PATCH_DIGESTS[(4, '')])
+
+        url = reverse('randomizer:api-v2-job', kwargs={'job_id': uuid.uuid4()})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_race_jobs_are_run_first(self):
+        first = self.post_job({'seed': '10'}).json()
+        race = self.post_job({'seed': '4', 'race_mode': True}).json()
+        self.assertEqual(self.client.get(first['url']).json()['position'], 1)
+        self.assertEqual(str(GenerationJob.claim_next('test', VERSION).id), race['id'])
+        self.assertEqual(str(GenerationJob.claim_next('test', VERSION).id), first['id'])
+        self.assertIsNone(GenerationJob.claim_next('test', VERSION))
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job_id = self.post_job({'seed': '4'}).json()['id']
+        timeout = datetime.timedelta(minutes=5)
+        retention = datetime.timedelta(days=1)
+        for attempt in range(2):
+            job = GenerationJob.claim_next('test', VERSION)
+            self.assertEqual(job.attempts, attempt + 1)
+            self.assertEqual(GenerationJob.reap_stale(timeout, 2, retention), 0)
+            GenerationJob.objects.filter(id=job_id).update(
+                started=job.started - datetime.timedelta(minutes=6))
+            self.assertEqual(GenerationJob.reap_stale(timeout, 2, retention), 1)
+        job = GenerationJob.objects.get(id=job_id)
+        self.assertEqual(job.status, GenerationJob.FAILED)
+
+        GenerationJob.objects.filter(id=job_id).update(
+            finished=job.finished - datetime.timedelta(days=2))
+        GenerationJob.reap_stale(timeout, 2, retention)
+        self.assertFalse(GenerationJob.objects.exists())
+
+
+class GeneratorPoolTest(TestCase):
+
+    def setUp(self):
+        views._generator_pool = None
+        self.addCleanup(setattr, views, '_generator_pool', None)
+        views._result_cache = None
+        self.addCleanup(setattr, views, '_result_cache', None)
+
+    def test_seeds_are_generated_over_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'generator.sock')
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+                listener.bind(path)
+                listener.listen(1)
+                # One connection, for every request, since the client keeps it open.
+                thread = threading.Thread(target=lambda: serve_connection(listener.accept()[0]))
+                thread.start()
+                client = GeneratorPoolClient(path, timeout=60)
+                for seed in (4, 10):
+                    patch, stats = client.generate(Settings(seed, ''))
+                    digest = hashlib.sha1(json.dumps(patch, cls=PatchJSONEncoder).encode())
+                    self.assertEqual(digest.hexdigest(), GOLDEN_PATCH_DIGESTS[(seed, '')])
+                    self.assertGreaterEqual(stats.GetAttempts('dungeon'), 1)
+                client.close()
+                thread.join()
+
+            with self.assertRaises(GeneratorPoolUnavailableError):
+                client.generate(Settings(4, ''))
+
+    def test_daemon_stops_generating_when_out_of_budget_or_cancelled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'generator.sock')
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+                listener.bind(path)
+                listener.listen(1)
+
+                def serve():
+                    try:
+                        serve_connection(listener.accept()[0])
+                    except OSError:
+                        # The client went away.
+                        pass
+
+                thread = threading.Thread(target=serve)
+                thread.start()
+                client = GeneratorPoolClient(path, timeout=60)
+                with self.assertRaises(GenerationTimeoutError) as context:
+                    client.generate(Settings(1, ''), GenerationBudget(0.5))
+                self.assertGreaterEqual(context.exception.stats.GetAttempts('grid'), 1)
+
+                # Cancelling closes the connection, which stops the daemon.
+                budget = GenerationBudget()
+                threading.Timer(0.5, budget.Cancel).start()
+                with self.assertRaises(GenerationCancelledError):
+                    client.generate(Settings(1, ''), budget)
+                thread.join(10)
+                self.assertFalse(thread.is_alive())
+                client.close()
+
+    def test_daemon_gets_remaining_budget_and_is_not_retried_here(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'generator.sock')
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+                listener.bind(path)
+                listener.listen(1)
+                client = GeneratorPoolClient(path, timeout=1)
+                budget = GenerationBudget(30)
+                time.sleep(0.5)
+                errors = []
+
+                def generate():
+                    try:
+                        client.generate(Settings(4, ''), budget)
+                    except GenerationTimeoutError as e:
+                        errors.append(e)
+
+                thread = threading.Thread(target=generate)
+                thread.start()
+                # Take the request, but never answer it.
+                (sock, _) = listener.accept()
+                with sock:
+                    request = json.loads(receive_message(sock))
+                    self.assertLess(request['budget'], 29.6)
+                    thread.join()
+                self.assertEqual(errors[0].stats.aborted, 'timeout')
+
+                # The web worker doesn't generate the seed itself after giving up on the daemon.
+                with self.settings(ZORA_GENERATOR_SOCKET=path, ZORA_GENERATOR_TIMEOUT=0.5):
+                    with self.assertLogs('randomizer.views', 'WARNING'):
+                        response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.json()['stats']['aborted'], 'timeout')
+                self.assertFalse(Seed.objects.exists())
+
+    def test_seeds_are_generated_in_process_without_daemon(self):
+        with self.settings(ZORA_GENERATOR_SOCKET='/nonexistent/generator.sock'):
+            with self.assertLogs('randomizer.views', 'WARNING'):
+                response = self.client.post(reverse('randomizer:generate'), {'seed': '4'})
+        digest = hashlib.sha1(json.dumps(response.json()['patch']).encode()).hexdigest()
+        self.assertEqual(digest, GOLDEN_PATCH_DIGESTS[(4, '')])
@@ -26,4 +26,9 @@ urlpatterns = [
     # API
     path('api/v1/generate', views.APIGenerateView.as_view(), name='api-v1-generate'),
     path('api/v1/flags', views.APIFlags.as_view(), name='api-v1-flags'),
+    path('api/v1/base-patch/<str:version>', views.APIBasePatchView.as_view(), name='api-v1-base-patch'),
+    path('api/v1/cache-stats', views.APICacheStatsView.as_view(), name='api-v1-cache-stats'),
+    path('api/v1/admission-stats', views.APIAdmissionStatsView.as_view(), name='api-v1-admission-stats'),
+    path('api/v2/generate', views.APIGenerateJobView.as_view(), name='api-v2-generate'),
+    path('api/v2/jobs/<uuid:job_id>', views.APIJobView.as_view(), name='api-v2-job'),
 ]
@@ -1,4 +1,6 @@
 import binascii
+import contextlib
+import functools
 import hashlib
 import json
 import logging
@@ -7,22 +9,35 @@ import random
 import string
 import tempfile
 import shutil
+import threading
+import zlib
+from urllib.parse import urlencode
 
 from django.conf import settings
 from django.db import transaction
+from django.db.models import Q
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, HttpResponseNotFound, QueryDict
 from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.text import compress_string
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView, FormView
 
-from .models import Seed, Patch
+from .models import HASH_LENGTH, GenerationJob, Seed, Patch
+from .admission import AdmissionController, Overloaded
 from .forms import GenerateForm
+from .generator_pool import (GeneratorPoolClient, GeneratorPoolUnavailableError,
+                             is_connection_closed)
+from .result_cache import ResultCache
+from .logic.archive import SeedArchive
 from .logic.flags import CATEGORIES, PRESETS, FlagError
 from .logic.main import ZoraRandomizer, VERSION
 from .logic.patch import PatchJSONEncoder
 from .logic.settings import Settings
+from .logic.stats import (GenerationAbortedError, GenerationBudget, GenerationCancelledError,
+                          GenerationStats, GenerationTimeoutError)
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -114,6 +129,402 @@ class HashView(RandomizerView):
     template_name = 'randomizer/patch_from_hash.html'
 
 
+def _check_patch_format(patch_format):
+    """
+    Args:
+        patch_format (str): Value of the format query parameter: json, ips or bps.
+
+    Returns:
+        str: Why the patch can't be served in this format, or None if it can.
+
+    """
+    if patch_format not in ('json', 'ips', 'bps'):
+        return "Unknown patch format {!r}".format(patch_format)
+    # BPS patches include a checksum of the ROM they apply to, so they can't be made without it.
+    if patch_format == 'bps' and not settings.ZORA_BASE_ROM:
+        return "BPS patches aren't available because the base ROM isn't configured"
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _read_base_rom():
+    with open(settings.ZORA_BASE_ROM, 'rb') as f:
+        return f.read()
+
+
+# Base patches only change with the version, which is part of their URL, so clients can keep them.
+BASE_PATCH_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@functools.lru_cache(maxsize=64)
+def _get_base_patch(flag_string, mode):
+    """
+    Build the part of the patch that is the same for every seed with these flags, once per process.
+
+    Args:
+        flag_string (str): Normalized flag string.
+        mode (str): Game mode.
+
+    Returns:
+        randomizer.logic.patch.Patch: The base patch.  It's shared, so it mustn't be changed.
+
+    """
+    base_patch = ZoraRandomizer(Settings(0, flag_string, mode)).GetBasePatch()
+    # Merge its writes now, rather than while several requests are reading it.
+    base_patch.GetRuns()
+    return base_patch
+
+
+def _base_patch_url(flag_string, mode):
+    return reverse('randomizer:api-v1-base-patch', kwargs={'version': VERSION}) + '?' + urlencode({
+        'mode': mode,
+        'flags': flag_string,
+    })
+
+
+@functools.lru_cache(maxsize=1)
+def _open_seed_archive():
+    """Map the configured seed archive once per process, or return None if there isn't one."""
+    if not settings.ZORA_SEED_ARCHIVE:
+        return None
+    return SeedArchive(settings.ZORA_SEED_ARCHIVE)
+
+
+# Held while creating the per-process objects below on first use, so that concurrent first requests
+# (e.g. everyone in a race rolling the seed at once) don't each create their own.
+_create_lock = threading.Lock()
+
+# Recently generated seeds, keyed by everything that goes into them.  Created on first use, so that
+# tests can change the size limit.
+_result_cache = None
+
+
+def _get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        with _create_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(settings.ZORA_RESULT_CACHE_BYTES)
+    return _result_cache
+
+
+# Limits on the seeds this process generates at once.  Created on first use, like the result cache.
+_admission_controller = None
+
+
+def _get_admission_controller():
+    global _admission_controller
+    if _admission_controller is None:
+        with _create_lock:
+            if _admission_controller is None:
+                _admission_controller = AdmissionController(
+                    settings.ZORA_MAX_GENERATIONS, settings.ZORA_MAX_WAITING_GENERATIONS,
+                    settings.ZORA_MAX_GENERATIONS_PER_CLIENT,
+                    settings.ZORA_GENERATION_QUEUE_TIMEOUT)
+    return _admission_controller
+
+
+def _client_id(request):
+    """
+    Tell clients apart, so that each gets a fair share of generation: by API key if the request has
+    one of ZORA_API_KEYS, otherwise by IP address.
+    """
+    api_key = request.META.get('HTTP_X_API_KEY')
+    if api_key and api_key in settings.ZORA_API_KEYS:
+        return 'key:' + api_key
+    if settings.ZORA_CLIENT_IP_HEADER and request.META.get(settings.ZORA_CLIENT_IP_HEADER):
+        # A proxy adds the address it got the request from to the end of the header.
+        return 'ip:' + request.META[settings.ZORA_CLIENT_IP_HEADER].split(',')[-1].strip()
+    return 'ip:' + request.META.get('REMOTE_ADDR', '')
+
+
+def _patches_size(cached_seed):
+    """
+    Estimate the memory a cached seed takes, which is mostly the data its patches write.
+
+    This also merges the patches' writes now, rather than while several requests are reading them.
+    """
+    seed_hash, patches = cached_seed
+    return sum(len(data) for patch in patches.values() for (address, data) in patch.GetRuns())
+
+
+def _patch_file_response(rom_patch, patch_format, filename):
+    """Return the patch as an IPS or BPS file download."""
+    if patch_format == 'ips':
+        data = rom_patch.ToIps()
+    else:
+        data = rom_patch.ToBps(_read_base_rom())
+    response = HttpResponse(data, content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename, patch_format)
+    return response
+
+
+def _parse_accept_header(header):
+    """
+    Args:
+        header (str): Value of an Accept or Accept-Encoding header.
+
+    Returns:
+        dict[str, float]: Quality value of each media range or coding listed in the header.
+
+    """
+    qualities = {}
+    for item in header.split(','):
+        params = item.split(';')
+        name = params[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = max(quality, qualities.get(name, 0.0))
+    return qualities
+
+
+def _accepts_binary_patch(request):
+    """
+    Check whether the client would rather have the patch as Patch.ToBytes() output than as JSON.
+
+    JSON stays the default, so the binary form is only sent when application/octet-stream is
+    listed, and with a higher quality than anything that also matches JSON.
+    """
+    qualities = _parse_accept_header(request.META.get('HTTP_ACCEPT', ''))
+    json_quality = max(qualities.get(media_range, 0.0)
+                       for media_range in ('application/json', 'application/*', '*/*'))
+    return qualities.get('application/octet-stream', 0.0) > json_quality
+
+
+def _binary_patch_response(patch_data, result):
+    """
+    Return the patch as Patch.ToBytes() output, with the rest of the JSON response in headers.
+
+    Args:
+        patch_data (bytes): Patch.ToBytes() output of the patch (or delta) to send.
+        result (dict): The JSON response the patch would otherwise be part of.  Its scalar values
+            are sent as X-Zora-* headers, e.g. 'flag_string' as X-Zora-Flag-String.
+
+    """
+    response = HttpResponse(patch_data, content_type='application/octet-stream')
+    for key, value in result.items():
+        if key == 'patch' or isinstance(value, (dict, list)):
+            continue
+        header = 'X-Zora-' + key.replace('_', '-').title()
+        response[header] = value if isinstance(value, str) else json.dumps(value)
+    return response
+
+
+def _compress_response(request, response):
+    """
+    Gzip or deflate the response body if the client accepts it and it gets smaller.
+
+    Returns:
+        HttpResponse: The same response.
+
+    """
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    if response.has_header('Content-Encoding') or response.status_code != 200:
+        return response
+
+    qualities = _parse_accept_header(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    # gzip wins ties, since it's what most clients ask for first.
+    encoding = max(('gzip', 'deflate'),
+                   key=lambda coding: qualities.get(coding, qualities.get('*', 0.0)))
+    if qualities.get(encoding, qualities.get('*', 0.0)) <= 0:
+        return response
+
+    if encoding == 'gzip':
+        compressed = compress_string(response.content)
+    else:
+        # HTTP's deflate coding is the zlib format, not raw deflate.
+        compressed = zlib.compress(response.content)
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(compressed))
+    return response
+
+
+def _file_select_hash(rom_patch):
+    """Return the hash code that the seed shows on the file select screen, in hex."""
+    return ZoraRandomizer.ReadHashCode(rom_patch).hex()
+
+
+def _store_seed(seed, mode, debug_mode, race_mode, flag_string, patches):
+    """
+    Save generated patches to the database under the content hash of the US patch.
+
+    Args:
+        patches (dict[str, randomizer.logic.patch.Patch]): Patch for each region.
+
+    Returns:
+        Seed: The stored seed.  If an identical patch was already stored, that seed is returned.
+
+    """
+    encoded = {region: Patch.encode(patch) for region, patch in patches.items()}
+    content_hash = encoded['US'][1][:HASH_LENGTH]
+
+    with transaction.atomic():
+        s, created = Seed.objects.get_or_create(
+            hash=content_hash,
+            defaults={
+                'seed': seed,
+                'version': VERSION,
+                'mode': mode,
+                'debug_mode': debug_mode,
+                'flags': flag_string,
+                'file_select_hash': _file_select_hash(patches['US']),
+                'race_mode': race_mode,
+                'spoiler': {},
+            })
+        if created:
+            for region, (data, sha1) in encoded.items():
+                Patch.objects.create(seed=s, region=region, sha1=sha1, patch=data)
+    return s
+
+
+def _parse_seed(value):
+    """
+    Args:
+        value (str): Seed form field.  Non-numeric seeds are turned into their CRC-32.
+
+    Returns:
+        int: The seed, or a random 32-bit seed if none (or an out of range one) was given.
+
+    """
+    seed = None
+    if value:
+        if value.isdigit():
+            seed = int(value)
+            if seed < 1 or seed > 0xFFFFFFFF:
+                seed = None
+        else:
+            seed = binascii.crc32(value.encode())
+
+    # If seed is not provided, generate a 32 bit seed integer using the CSPRNG.
+    if not seed:
+        r = random.SystemRandom()
+        seed = r.getrandbits(32)
+        del r
+    return seed
+
+
+# Client for the generator daemon, if one is configured.  Created on first use, like the result
+# cache.
+_generator_pool = None
+
+
+def _get_generator_pool():
+    global _generator_pool
+    if _generator_pool is None and settings.ZORA_GENERATOR_SOCKET:
+        with _create_lock:
+            if _generator_pool is None:
+                _generator_pool = GeneratorPoolClient(settings.ZORA_GENERATOR_SOCKET,
+                                                      settings.ZORA_GENERATOR_TIMEOUT)
+    return _generator_pool
+
+
+def _client_disconnect_check(request):
+    """
+    Returns:
+        callable: Tells whether the client has closed its connection, or None if there's no telling.
+            Only gunicorn lets the view see the connection.
+
+    """
+    sock = request.META.get('gunicorn.socket')
+    if sock is None:
+        return None
+    return functools.partial(is_connection_closed, sock)
+
+
+def _generate_patch(seed_settings, budget):
+    """
+    Generate a seed in the generator daemon, or in this process if there's no daemon to do it.
+
+    Returns:
+        (randomizer.logic.patch.Patch, GenerationStats): The seed's patch and where the time went.
+
+    """
+    generator_pool = _get_generator_pool()
+    if generator_pool is not None:
+        try:
+            return generator_pool.generate(seed_settings, budget)
+        except GeneratorPoolUnavailableError as e:
+            logger.warning("{}; generating the seed here instead".format(e))
+
+    randomizer = ZoraRandomizer(seed_settings)
+    stats = randomizer.Randomize(budget)
+    return randomizer.GetPatch(), stats
+
+
+def find_or_generate_seed(seed_settings, race_mode, use_stored=True, is_cancelled=None,
+                          admission_controller=None, client=None):
+    """
+    Find a seed in the database or the seed archive, or generate and store it if it's in neither.
+
+    Args:
+        seed_settings (randomizer.logic.settings.Settings): The seed's settings.
+        race_mode (bool): Whether the seed is stored as a race seed, if it's new.
+        use_stored (bool): Whether to look for the seed before generating it.  Profiling requests
+            always generate.
+        is_cancelled (callable): Tells whether to stop generating, e.g. because the client has
+            gone.  Generation also stops after ZORA_GENERATION_BUDGET seconds.
+        admission_controller (AdmissionController): Limits on generation to wait for, if the seed
+            has to be generated.  Seeds that are found aren't held up by them.
+        client (str): Who the request is from, for the admission controller.
+
+    Returns:
+        (Seed, dict[str, randomizer.logic.patch.Patch], GenerationStats): The stored seed, its patch
+            for each region, and where the time went.
+
+    Raises:
+        GenerationAbortedError: Generation ran out of time or was cancelled.
+        Overloaded: The admission controller turned the request away.
+
+    """
+    seed = seed_settings.seed
+    flag_string = seed_settings.flag_string
+    mode = seed_settings.mode
+    debug_mode = seed_settings.debug_mode
+    stats = GenerationStats()
+
+    # Seeds that were already generated with the same settings (e.g. the same race seed rolled by
+    # every entrant) are served from the database.  Seeds pre-generated into the seed archive are
+    # served from it the same way.
+    if use_stored:
+        s = Seed.objects.filter(seed=seed, version=VERSION, mode=mode, debug_mode=debug_mode,
+                                flags=flag_string).first()
+        if s is not None:
+            with stats.Time('store'):
+                return s, {p.region: p.get_rom_patch() for p in s.patch_set.all()}, stats
+        if not debug_mode and _open_seed_archive() is not None:
+            with stats.Time('archive'):
+                archived_patch = _open_seed_archive().GetPatch(VERSION, seed, flag_string)
+            if archived_patch is not None:
+                patches = {'US': archived_patch}
+                # Store it too, so that it gets a permalink.
+                with stats.Time('store'):
+                    s = _store_seed(seed, mode, debug_mode, race_mode, flag_string, patches)
+                return s, patches, stats
+
+    with (admission_controller.admit(client) if admission_controller is not None else
+          contextlib.nullcontext()):
+        # The budget starts once there's a slot, so waiting for one doesn't use it up.
+        budget = GenerationBudget(settings.ZORA_GENERATION_BUDGET or None, is_cancelled)
+        rom_patch, stats = _generate_patch(seed_settings, budget)
+    patches = {'US': rom_patch}
+
+    # Save patch to the database (don't need to save EU since it's the same as US).
+    with stats.Time('store'):
+        s = _store_seed(seed, mode, debug_mode, race_mode, flag_string, patches)
+    return s, patches, stats
+
+
 class GenerateView(FormView):
     form_class = GenerateForm
     return_patch_data = True
@@ -121,96 +532,132 @@ class GenerateView(FormView):
     def form_valid(self, form):
         data = form.cleaned_data
 
+        # The patch can also be downloaded as an IPS or BPS file instead of the JSON response.
+        patch_format = self.request.GET.get('format', 'json')
+        error = _check_patch_format(patch_format)
+        if error:
+            logger.error(error)
+            return HttpResponseBadRequest(error.encode())
+
         # Debug mode is only allowed if the server is running in debug mode for development.
         if not settings.DEBUG:
             data['debug_mode'] = False
 
-        # If seed is provided, use it.  Otherwise generate a random seed (10 digits max).
-        # For non-numeric values, take the CRC32 checksum of it.
-        seed = data['seed']
-        if seed:
-            if seed.isdigit():
-                seed = int(seed)
-                if seed < 1 or seed > 0xFFFFFFFF:
-                    seed = None
-            else:
-                seed = binascii.crc32(seed.encode())
-
-        # If seed is not provided, generate a 32 bit seed integer using the CSPRNG.
-        if not seed:
-            r = random.SystemRandom()
-            seed = r.getrandbits(32)
-            del r
-
+        seed = _parse_seed(data['seed'])
         mode = data['mode'] or 'open'
         debug_mode = bool(data['debug_mode'])
         race_mode = bool(data['race_mode'])
 
-        # Build game world, randomize it, and generate the patch.
-        randomizer = ZoraRandomizer(Settings(seed, data['flags'] or '', mode, debug_mode))
+        seed_settings = Settings(seed, data['flags'] or '', mode, debug_mode)
+        flag_string = seed_settings.flag_string
+        stats = GenerationStats()
+        is_cancelled = _client_disconnect_check(self.request)
+
+        # Whether this request ran generate(), rather than waiting for another request's result.
+        generated_here = False
+
+        def generate():
+            nonlocal stats, generated_here
+            generated_here = True
+            s, patches, stats = find_or_generate_seed(
+                seed_settings, race_mode, use_stored=not data['stats'], is_cancelled=is_cancelled,
+                admission_controller=_get_admission_controller(),
+                client=_client_id(self.request))
+            return s.hash, patches
 
         try:
-            print("Randomize()")
-            randomizer.Randomize()
-            print("GetPatch()")
-            patches = {'US': randomizer.GetPatch()}
+            if data['stats']:
+                seed_hash, patches = generate()
+                cache_status = None
+            else:
+                while True:
+                    try:
+                        # Concurrent requests for the same seed wait for the first one to make it.
+                        (seed_hash, patches), cache_status = _get_result_cache().get_or_create(
+                            (VERSION, seed, flag_string, mode, debug_mode, race_mode), generate,
+                            _patches_size)
+                        break
+                    except GenerationCancelledError:
+                        # The request making the seed was cancelled because its client went away.
+                        # Make it for this request instead, unless this client has gone as well.
+                        if is_cancelled is None or is_cancelled():
+                            raise
+                    except Overloaded:
+                        # The request making the seed was turned away, which may be down to its
+                        # client's share rather than this one's.  Ask for a slot for this request.
+                        if generated_here:
+                            raise
         except FlagError as e:
             # Catch error with flags and return that error message instead.
             result = {
                 'error': e.args[0],
             }
             return JsonResponse(result, encoder=PatchJSONEncoder)
+        except Overloaded as e:
+            logger.warning("Turned away seed {} for {}: {}".format(seed, _client_id(self.request),
+                                                                   e.reason))
+            response = JsonResponse({'error': e.args[0]}, status=503)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        except GenerationAbortedError as e:
+            logger.warning("Gave up generating seed {} with flags {!r}: {}".format(
+                seed, flag_string, e))
+            result = {
+                'error': e.args[0],
+                'stats': e.stats.for_json(),
+            }
+            response = JsonResponse(result, status=503)
+            response['Server-Timing'] = e.stats.GetServerTimingHeader()
+            # A cancelled request's client has gone, so there's nobody to tell when to try again.
+            if isinstance(e, GenerationTimeoutError):
+                response['Retry-After'] = str(_get_admission_controller().estimate_retry_after())
+            return response
         except Exception:
             logger.error("ERROR form data: {!r}, generated seed: {!r}".format(data, seed))
             raise
-        print("making result")
+
         # Send back patch data.
         result = {
             'logic': VERSION,
             'seed': seed,
-            'hash': "hash", #world.hash,
+            'hash': seed_hash,
             'mode': mode,
             'debug_mode': debug_mode,
-            'flag_string': randomizer.settings.flag_string,
-            'file_select_character': "character", # world.file_select_character,
-            'file_select_hash': "file_select_hash", # world.file_select_hash,
-            'permalink': reverse('randomizer:patch-from-hash', kwargs={'hash': "hash"}),# world.hash}),
+            'flag_string': flag_string,
+            'file_select_character': '',
+            'file_select_hash': _file_select_hash(patches['US']),
+            'permalink': reverse('randomizer:patch-from-hash', kwargs={'hash': seed_hash}),
             'race_mode': race_mode,
             'spoiler': {} #world.spoiler if not race_mode else {},
         }
 
-        # Save patch to the database (don't need to save EU since it's the same as US).
-        """with transaction.atomic():
-            # If there's an existing seed with the same hash, replace it.
-            try:
-                s = Seed.objects.get(hash="hash") #world.hash)
-            except Seed.DoesNotExist:
-                pass
-            else:
-                s.delete()
-
-            #s = Seed(hash=world.hash, seed=seed, version=VERSION, mode=mode, debug_mode=debug_mode,
-            #         flags=world.settings.flag_string, file_select_char=world.file_select_character,
-            #         file_select_hash=world.file_select_hash, race_mode=race_mode, spoiler=world.spoiler)
-            s = Seed(hash="hash", seed=seed, version=VERSION, mode=mode, debug_mode=debug_mode,
-                     flags=randomizer.settings.flag_string, file_select_char="ignore-this",
-                     file_select_hash="TODO: add hash here", race_mode=race_mode, spoiler={})
-            s.save()
-
-            for region, patch in patches.items():
-                patch_dump = json.dumps(patch, cls=PatchJSONEncoder)
-                h = hashlib.sha1()
-                h.update(patch_dump.encode())
-                p = Patch(seed=s, region=region, sha1=h.hexdigest(), patch=patch_dump)
-                p.save()
-        """
-        # Check if we're including the patch data in the response.
+        # Check if we're including the patch data in the response.  Patch for EU version is the same
+        # as US.  With ?delta=1, only the part that differs from the base patch for these flags is
+        # included, and the client fetches the base patch (once) from the URL that comes with it.
+        # Clients that ask for the binary form get the patch whether or not the JSON would have it.
+        binary_patch = patch_format == 'json' and _accepts_binary_patch(self.request)
+        rom_patch = patches['US']
+        if (self.return_patch_data or binary_patch) and self.request.GET.get('delta') == '1':
+            rom_patch = rom_patch.GetDelta(_get_base_patch(flag_string, mode))
+            result['base_patch'] = _base_patch_url(flag_string, mode)
         if self.return_patch_data:
-            result['patch'] = patches['US']  # Patch for EU version is the same as US.
-        
-        print("response")
-
-        return JsonResponse(result, encoder=PatchJSONEncoder)
+            result['patch'] = rom_patch
+
+        # Per-phase timings and retry counts, for profiling slow flag combinations.
+        if data['stats']:
+            result['stats'] = stats.for_json()
+
+        if binary_patch:
+            response = _binary_patch_response(rom_patch.ToBytes(), result)
+        elif patch_format == 'json':
+            response = JsonResponse(result, encoder=PatchJSONEncoder)
+        else:
+            response = _patch_file_response(patches['US'], patch_format,
+                                            "ZORA_{}_{}_{}_{}".format(VERSION, mode, seed_hash, seed))
+        response['Server-Timing'] = stats.GetServerTimingHeader()
+        if cache_status:
+            response['X-Zora-Cache'] = cache_status
+        return _compress_response(self.request, response)
 
     def form_invalid(self, form):
         msg = "{} form error: ".format(self.__class__.__name__) + '; '.join(form.errors)
@@ -228,6 +675,11 @@ class GenerateFromHashView(View):
     @staticmethod
     def get(request, hash, region):
         """Get a previously generated patch via hash value."""
+        patch_format = request.GET.get('format', 'json')
+        error = _check_patch_format(patch_format)
+        if error:
+            return HttpResponseBadRequest(error.encode())
+
         # EU patch is actually the US one.
         if region == 'EU':
             region = 'US'
@@ -242,6 +694,11 @@ class GenerateFromHashView(View):
         except Patch.DoesNotExist:
             return HttpResponseNotFound("No patch found for hash {0!r}, region {1!r}".format(hash, region))
 
+        if patch_format != 'json':
+            return _compress_response(request, _patch_file_response(
+                p.get_rom_patch(), patch_format,
+                "ZORA_{}_{}_{}_{}".format(s.version, s.mode, s.hash, s.seed)))
+
         result = {
             'logic': s.version,
             'seed': s.seed,
@@ -251,11 +708,55 @@ class GenerateFromHashView(View):
             'flag_string': s.flags,
             'file_select_character': s.file_select_char,
             'file_select_hash': s.file_select_hash,
-            'patch': json.loads(p.patch),
             'race_mode': s.race_mode,
             'spoiler': s.spoiler,
         }
-        return JsonResponse(result)
+        # Seeds from older versions don't match the current base patch, so they're sent whole.
+        delta = request.GET.get('delta') == '1' and s.version == VERSION
+        binary_patch = _accepts_binary_patch(request)
+        if binary_patch and not delta:
+            # The stored data is already in the binary form, so it's sent without decoding it.
+            return _compress_response(request,
+                                      _binary_patch_response(zlib.decompress(p.patch), result))
+
+        rom_patch = p.get_rom_patch()
+        if delta:
+            rom_patch = rom_patch.GetDelta(_get_base_patch(s.flags, s.mode))
+            result['base_patch'] = _base_patch_url(s.flags, s.mode)
+        if binary_patch:
+            response = _binary_patch_response(rom_patch.ToBytes(), result)
+        else:
+            result['patch'] = rom_patch
+            response = JsonResponse(result, encoder=PatchJSONEncoder)
+        return _compress_response(request, response)
+
+
+class APIBasePatchView(View):
+    @staticmethod
+    def get(request, version):
+        """Get the part of the patch that is the same for every seed with the given flags."""
+        if version != VERSION:
+            return HttpResponseNotFound("No base patch for version {0!r}".format(version))
+        patch_format = request.GET.get('format', 'json')
+        error = _check_patch_format(patch_format)
+        if error:
+            return HttpResponseBadRequest(error.encode())
+
+        mode = request.GET.get('mode', 'open')
+        flag_string = Settings(0, request.GET.get('flags', ''), mode).flag_string
+        base_patch = _get_base_patch(flag_string, mode)
+        if patch_format == 'json':
+            response = JsonResponse({
+                'logic': VERSION,
+                'mode': mode,
+                'flag_string': flag_string,
+                'patch': base_patch,
+            }, encoder=PatchJSONEncoder)
+        else:
+            response = _patch_file_response(base_patch, patch_format,
+                                            "ZORA_{}_{}_base".format(VERSION, mode))
+        patch_cache_control(response, public=True, max_age=BASE_PATCH_MAX_AGE, immutable=True)
+        return response
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -350,10 +851,10 @@ class PackingView(View):
                                       {'C', 'D', 'E', 'F', 'G', 'H', 'J', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'W', 'X'})
             first_char_choices.sort()
 
-            random.seed(seed)
-            new_id = bytearray([0x00, 0x01, 0x00, 0x01, ord(random.choice(first_char_choices))])
+            rng = random.Random(seed)
+            new_id = bytearray([0x00, 0x01, 0x00, 0x01, ord(rng.choice(first_char_choices))])
             for i in range(3):
-                new_id.append(ord(random.choice(choices)))
+                new_id.append(ord(rng.choice(choices)))
 
             tid = int.from_bytes(new_id, 'big')
             newwad.tmd.setTitleID(tid)
@@ -388,6 +889,90 @@ class APIGenerateView(GenerateView):
         return kwargs
 
 
+class APIGenerateJobView(APIGenerateView):
+    """
+    Queue the seed for a worker to generate, instead of generating it during the request.  The
+    response is the job, to poll until its status is done or failed.
+    """
+
+    def form_valid(self, form):
+        data = form.cleaned_data
+
+        # Debug mode is only allowed if the server is running in debug mode for development.
+        if not settings.DEBUG:
+            data['debug_mode'] = False
+
+        seed = _parse_seed(data['seed'])
+        mode = data['mode'] or 'open'
+        debug_mode = bool(data['debug_mode'])
+        race_mode = bool(data['race_mode'])
+        job = GenerationJob.objects.create(
+            seed=seed,
+            version=VERSION,
+            mode=mode,
+            debug_mode=debug_mode,
+            flags=Settings(seed, data['flags'] or '', mode, debug_mode).flag_string,
+            race_mode=race_mode,
+            priority=settings.ZORA_RACE_JOB_PRIORITY if race_mode else 0,
+        )
+        return _job_response(job, status=202)
+
+
+def _job_response(job, status=200):
+    """
+    Return the status of a generation job and, once it's done, the seed it made.
+
+    Args:
+        job (GenerationJob): The job.
+        status (int): HTTP status of the response.
+
+    """
+    url = reverse('randomizer:api-v2-job', kwargs={'job_id': job.id})
+    result = {
+        'id': str(job.id),
+        'status': job.status,
+        'url': url,
+    }
+    if job.status == GenerationJob.QUEUED:
+        # Number of jobs that will be run before this one.
+        result['position'] = GenerationJob.objects.filter(
+            Q(priority__gt=job.priority) | Q(priority=job.priority, created__lt=job.created),
+            status=GenerationJob.QUEUED, version=job.version).count()
+    elif job.status == GenerationJob.FAILED:
+        result['error'] = job.error
+    elif job.result is not None:
+        s = job.result
+        result['seed'] = {
+            'logic': s.version,
+            'seed': s.seed,
+            'hash': s.hash,
+            'mode': s.mode,
+            'debug_mode': s.debug_mode,
+            'flag_string': s.flags,
+            'permalink': reverse('randomizer:patch-from-hash', kwargs={'hash': s.hash}),
+            'patch': reverse('randomizer:generate-from-hash',
+                             kwargs={'hash': s.hash, 'region': 'US'}),
+            'race_mode': s.race_mode,
+        }
+
+    response = JsonResponse(result, status=status)
+    response['Location'] = url
+    if job.status in (GenerationJob.QUEUED, GenerationJob.RUNNING):
+        response['Retry-After'] = '1'
+    return response
+
+
+class APIJobView(View):
+    @staticmethod
+    def get(request, job_id):
+        """Get the status of a generation job queued through APIGenerateJobView."""
+        try:
+            job = GenerationJob.objects.select_related('result').get(id=job_id)
+        except GenerationJob.DoesNotExist:
+            return HttpResponseNotFound("No generation job {0!r}".format(str(job_id)))
+        return _job_response(job)
+
+
 class APIFlags(View):
     @staticmethod
     def get(request):
@@ -395,3 +980,17 @@ class APIFlags(View):
             'flags': FLAGS,
         }
         return JsonResponse(data)
+
+
+class APICacheStatsView(View):
+    @staticmethod
+    def get(request):
+        """Get the hit, miss and coalesce counters of this process's cache of generated seeds."""
+        return JsonResponse(_get_result_cache().get_stats())
+
+
+class APIAdmissionStatsView(View):
+    @staticmethod
+    def get(request):
+        """Get the queue depth and admitted and shed counters of this process's generate views."""
+        return JsonResponse(_get_admission_controller().get_stats())
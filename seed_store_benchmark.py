@@ -0,0 +1,69 @@
+import os
+import statistics
+import time
+from absl import app
+from absl import flags
+from typing import Any, Callable, List
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zora_web.settings')
+django.setup()
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+flags.DEFINE_list(name='seeds',
+                  default=['2', '3', '4', '5', '9', '10', '13'],
+                  help='The seed numbers to generate.')
+flags.DEFINE_string(name='flag_string',
+                    default='',
+                    help='The flags to use when randomizing the game')
+flags.DEFINE_integer(name='lookups', default=20, help='How many times to look up each seed.')
+COMMAND_LINE_FLAGS = flags.FLAGS
+
+
+def TimeRequest(request: Callable[[], Any]) -> float:
+  start_time = time.perf_counter()
+  response = request()
+  seconds = time.perf_counter() - start_time
+  assert response.status_code == 200, response.content
+  return seconds
+
+
+def PrintTimes(name: str, times: List[float]) -> None:
+  print("%-28s mean %9.2f ms  median %9.2f ms  max %9.2f ms" %
+        (name, 1000 * statistics.mean(times), 1000 * statistics.median(times), 1000 * max(times)))
+
+
+def main(unused_argv: Any) -> None:
+  # Run against a throwaway test database rather than the configured one.
+  setup_test_environment()
+  connection.creation.create_test_db(verbosity=0)
+  client = Client()
+
+  generate_times: List[float] = []
+  reroll_times: List[float] = []
+  permalink_times: List[float] = []
+  for seed in COMMAND_LINE_FLAGS.seeds:
+    form_data = {'seed': seed, 'flags': COMMAND_LINE_FLAGS.flag_string}
+    generate = lambda: client.post(reverse('randomizer:generate'), form_data)
+    generate_times.append(TimeRequest(generate))
+    hash_url = reverse('randomizer:generate-from-hash',
+                       kwargs={
+                           'hash': generate().json()['hash'],
+                           'region': 'US'
+                       })
+    for unused_counter in range(COMMAND_LINE_FLAGS.lookups):
+      reroll_times.append(TimeRequest(generate))
+      permalink_times.append(TimeRequest(lambda: client.get(hash_url)))
+
+  PrintTimes("Generate and store", generate_times)
+  PrintTimes("Re-roll from store", reroll_times)
+  PrintTimes("Permalink /hash/<hash>/US", permalink_times)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,105 @@
+import collections
+import statistics
+import time
+from absl import app
+from absl import flags
+from typing import Any, DefaultDict, Dict, List
+
+from randomizer.logic.item import Item
+from randomizer.logic.main import ZoraRandomizer
+from randomizer.logic.settings import Settings
+
+flags.DEFINE_list(name='seeds',
+                  default=['2', '3', '4', '5', '9', '10', '13'],
+                  help='The seed numbers to generate.')
+flags.DEFINE_string(name='flag_string',
+                    default='',
+                    help='The flags to use when randomizing the game')
+flags.DEFINE_integer(name='repeat', default=1, help='How many times to generate each seed.')
+flags.DEFINE_bool(name='compare_assumed_fill',
+                  default=False,
+                  help='Also generate each seed with assumed fill item placement and compare.')
+COMMAND_LINE_FLAGS = flags.FLAGS
+
+ItemDistribution = DefaultDict[Item, DefaultDict[str, int]]
+
+
+def GenerateSeed(seed: int, flag_string: str, item_distribution: ItemDistribution) -> Dict[str, Any]:
+  start_time = time.perf_counter()
+  randomizer = ZoraRandomizer(Settings(seed=seed, flag_string=flag_string))
+  stats = randomizer.Randomize()
+  randomizer.GetPatch()
+  seconds = time.perf_counter() - start_time
+
+  for location in randomizer.item_randomizer.item_locations:
+    if location.IsLevelRoom():
+      item = randomizer.data_table.GetRoomItem(location)
+      region = "L%d" % location.GetLevelNum()
+    else:
+      item = randomizer.data_table.GetCaveItem(location)
+      region = "OW"
+    item_distribution[item][region] += 1
+
+  return {
+      'seconds': seconds,
+      'phase_times': dict(stats.phase_times),
+      'attempts': dict(stats.attempts),
+  }
+
+
+def RunBenchmark(flag_string: str, item_distribution: ItemDistribution) -> List[float]:
+  print("Flag string is %s" % flag_string)
+  times: List[float] = []
+  phase_totals: Dict[str, float] = {}
+  for seed in COMMAND_LINE_FLAGS.seeds:
+    for unused_counter in range(COMMAND_LINE_FLAGS.repeat):
+      result = GenerateSeed(int(seed), flag_string, item_distribution)
+      times.append(result['seconds'])
+      for phase, seconds in result['phase_times'].items():
+        phase_totals[phase] = phase_totals.get(phase, 0.0) + seconds
+      print("Seed %s: %.2fs  dungeons=%d  item shuffles=%d  room trees=%d" %
+            (seed, result['seconds'], result['attempts'].get('dungeon', 0),
+             result['attempts'].get('item_shuffle', 0), result['attempts'].get('room_tree', 0)))
+
+  print("")
+  print("Generated %d seeds in %.2fs (mean %.2fs, median %.2fs, %.3f seeds/s)" %
+        (len(times), sum(times), statistics.mean(times), statistics.median(times),
+         len(times) / sum(times)))
+  for phase, seconds in sorted(phase_totals.items(), key=lambda entry: -entry[1]):
+    print("  %-12s %8.2fs  %5.1f%%" % (phase, seconds, 100 * seconds / sum(times)))
+  print("")
+  return times
+
+
+def PrintItemDistribution(item_distribution: ItemDistribution) -> None:
+  regions = ["L%d" % level_num for level_num in range(1, 10)] + ["OW"]
+  print("%-18s" % "Item" + "".join("%6s" % region for region in regions))
+  for item in sorted(item_distribution, key=lambda item: item.name):
+    total = sum(item_distribution[item].values())
+    print("%-18s" % item.name + "".join("%5.0f%%" % (100 * item_distribution[item][region] / total)
+                                        for region in regions))
+  print("")
+
+
+def main(unused_argv: Any) -> None:
+  flag_string = COMMAND_LINE_FLAGS.flag_string
+  item_distribution: ItemDistribution = collections.defaultdict(
+      lambda: collections.defaultdict(int))
+  times = RunBenchmark(flag_string, item_distribution)
+  if not COMMAND_LINE_FLAGS.compare_assumed_fill:
+    return
+
+  assumed_fill_distribution: ItemDistribution = collections.defaultdict(
+      lambda: collections.defaultdict(int))
+  assumed_fill_times = RunBenchmark((flag_string + ' Ia').strip(), assumed_fill_distribution)
+  print("Shuffle and validate: %.3f seeds/s" % (len(times) / sum(times)))
+  print("Assumed fill:         %.3f seeds/s" % (len(assumed_fill_times) / sum(assumed_fill_times)))
+  print("")
+  print("Item locations with shuffle and validate:")
+  PrintItemDistribution(item_distribution)
+  print("Item locations with assumed fill:")
+  PrintItemDistribution(assumed_fill_distribution)
+
+
+if __name__ == '__main__':
+  app.run(main)
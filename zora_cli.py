@@ -1,10 +1,17 @@
+import concurrent.futures
+import hashlib
+import json
 import os
+import shutil
 import sys
+import time
+import zlib
 from absl import app
 from absl import flags
-from typing import Any, List
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
 
-from randomizer.logic.main import ZoraRandomizer
+from randomizer.logic.archive import WriteSeedArchive
+from randomizer.logic.main import VERSION, ZoraRandomizer
 from randomizer.logic.rom import Rom
 from randomizer.logic.settings import Settings
 
@@ -21,32 +28,346 @@ flags.DEFINE_string(name='input_filename',
 flags.DEFINE_string(name='output_location',
                     default='',
                     help='The location to put the randomized ROM.')
+flags.DEFINE_string(name='input_sha1',
+                    default='',
+                    help='If set, the SHA-1 the input ROM must have before it is patched.')
+flags.DEFINE_enum(name='patch_format',
+                  default='rom',
+                  enum_values=['rom', 'ips', 'bps', 'zpatch'],
+                  help='Write the randomized ROM, an IPS or BPS patch for the input ROM, or the '
+                  'compressed patch the website stores (which a seed archive is built from).')
+flags.DEFINE_string(name='seeds',
+                    default='',
+                    help='Seeds to generate as a batch, e.g. "1-5000" or "1,5,10-20".')
+flags.DEFINE_integer(name='count',
+                     default=0,
+                     help='How many consecutive seeds to generate as a batch, from --start_seed.')
+flags.DEFINE_integer(name='start_seed', default=1, help='The first seed of a --count batch.')
+flags.DEFINE_integer(name='jobs', default=1, help='How many processes to generate a batch with.')
+flags.DEFINE_integer(name='shard_index',
+                     default=0,
+                     lower_bound=0,
+                     help="Which shard of the batch's seeds to generate, counting from 0.")
+flags.DEFINE_integer(name='shard_count',
+                     default=1,
+                     lower_bound=1,
+                     help="How many shards (e.g. machines) the batch's seeds are split between.")
+flags.register_multi_flags_validator(
+    ['shard_index', 'shard_count'],
+    lambda flag_values: flag_values['shard_index'] < flag_values['shard_count'],
+    message='--shard_index must be less than --shard_count.')
 COMMAND_LINE_FLAGS = flags.FLAGS
 
+# One line of JSON per seed in a batch's output directory, in seed order.
+MANIFEST_FILENAME = 'manifest.jsonl'
 
-def main(unused_argv: Any) -> None:
-  print("Seed is %s" % COMMAND_LINE_FLAGS.seed)
-  print("Flag string is %s" % COMMAND_LINE_FLAGS.flag_string)
-  settings = Settings(seed=COMMAND_LINE_FLAGS.seed,
-                      flag_string=COMMAND_LINE_FLAGS.flag_string,
+
+class OutputOptions(NamedTuple):
+  flag_string: str
+  debug_mode: bool
+  input_filename: str
+  output_location: str
+  patch_format: str
+
+
+# The input ROM, read once per process by LoadInputRom().
+_input_rom: Optional[bytes] = None
+
+
+def LoadInputRom(options: OutputOptions) -> None:
+  global _input_rom
+  if options.patch_format in ('rom', 'bps'):
+    with open(options.input_filename, 'rb') as input_file:
+      _input_rom = input_file.read()
+
+
+def ParseSeeds(seeds: str) -> List[int]:
+  """Parses a comma-separated list of seeds and inclusive ranges of seeds, e.g. "1,5,10-20"."""
+  seed_list: List[int] = []
+  for part in seeds.split(','):
+    (first, unused_dash, last) = part.strip().partition('-')
+    seed_list.extend(range(int(first), int(last or first) + 1))
+  return seed_list
+
+
+def GetShard(seeds: Sequence[int], shard_index: int, shard_count: int) -> List[int]:
+  """Returns every shard_count-th seed, starting at shard_index.
+
+  Interleaving the seeds rather than splitting them into blocks spreads the slow seeds evenly
+  between the shards, and a seed's shard depends only on its position in the seed list.
+  """
+  return list(seeds[shard_index::shard_count])
+
+
+def GetOutputFilename(options: OutputOptions, seed: int) -> str:
+  (input_path, input_full_filename) = os.path.split(options.input_filename)
+  (input_filename, input_extension) = os.path.splitext(input_full_filename)
+  if options.patch_format == 'rom':
+    extension = input_extension or ".nes"
+  else:
+    extension = "." + options.patch_format
+  return os.path.join(options.output_location or input_path,
+                      "%s-randomized-%d%s" % (input_filename, seed, extension))
+
+
+def GenerateSeed(options: OutputOptions, seed: int) -> Dict[str, Any]:
+  """Randomizes one seed and writes its ROM or patch.  Returns the seed's manifest entry."""
+  start_time = time.perf_counter()
+  settings = Settings(seed=seed,
+                      flag_string=options.flag_string,
                       mode='standard',
-                      debug_mode=COMMAND_LINE_FLAGS.debug_mode)
+                      debug_mode=options.debug_mode)
   randomizer = ZoraRandomizer(settings)
   randomizer.Randomize()
   patch = randomizer.GetPatch()
 
-  (input_path, input_full_filename) = os.path.split(COMMAND_LINE_FLAGS.input_filename)
-  (input_filename, input_extension) = os.path.splitext(input_full_filename)
-  output_filename = os.path.join(
-      COMMAND_LINE_FLAGS.output_location or input_path,
-      "%s-randomized-%d%s" % (input_filename, COMMAND_LINE_FLAGS.seed, input_extension or ".nes"))
-  output_rom = Rom(output_filename, src=COMMAND_LINE_FLAGS.input_filename)
-  output_rom.OpenFile(write_mode=True)
-
-  for address in patch.GetAddresses():
-    data: List[int]
-    data = patch.GetData(address)
-    output_rom.WriteBytes(address, data)
+  # Write to a temporary file first, so that an interrupted batch never leaves a partial file
+  # behind that would be skipped when the batch is resumed.
+  output_filename = GetOutputFilename(options, seed)
+  temp_filename = output_filename + '.tmp'
+  if options.patch_format == 'rom':
+    output_rom = Rom(temp_filename, in_memory=True, data=_input_rom)
+    output_rom.OpenFile(write_mode=True)
+    output_rom.ApplyPatch(patch)
+    output_rom.SaveFile()
+  else:
+    with open(temp_filename, 'wb') as output_file:
+      if options.patch_format == 'ips':
+        output_file.write(patch.ToIps())
+      elif options.patch_format == 'bps':
+        assert _input_rom is not None
+        output_file.write(patch.ToBps(_input_rom))
+      else:
+        output_file.write(zlib.compress(patch.ToBytes(), 9))
+  os.replace(temp_filename, output_filename)
+
+  return {
+      'seed': seed,
+      'version': VERSION,
+      'flag_string': settings.flag_string,
+      'sha1': hashlib.sha1(patch.ToBytes()).hexdigest(),
+      'filename': os.path.basename(output_filename),
+      'seconds': round(time.perf_counter() - start_time, 3),
+  }
+
+
+def ReadFinishedSeeds(options: OutputOptions, manifest_filename: str) -> Set[int]:
+  """Returns the seeds of a previous run of the batch whose output is still there."""
+  finished_seeds: Set[int] = set()
+  if not os.path.exists(manifest_filename):
+    return finished_seeds
+  flag_string = Settings(0, options.flag_string).flag_string
+  with open(manifest_filename) as manifest:
+    for line in manifest:
+      entry = json.loads(line)
+      if (entry['flag_string'] == flag_string and entry.get('version') == VERSION and
+          os.path.exists(GetOutputFilename(options, entry['seed']))):
+        finished_seeds.add(entry['seed'])
+  return finished_seeds
+
+
+def GenerateBatch(options: OutputOptions, seeds: Iterable[int], jobs: int = 1) -> None:
+  """Generates the seeds across jobs processes, skipping any already in the output directory.
+
+  Every seed is randomized with its own generator, so the output doesn't depend on the number of
+  processes or the order they finish in.
+  """
+  os.makedirs(options.output_location, exist_ok=True)
+  manifest_filename = os.path.join(options.output_location, MANIFEST_FILENAME)
+  finished_seeds = ReadFinishedSeeds(options, manifest_filename)
+  remaining_seeds = [seed for seed in seeds if seed not in finished_seeds]
+  print("Generating %d seeds, skipping %d already generated" %
+        (len(remaining_seeds), len(finished_seeds)))
+
+  executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+  if jobs > 1:
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                      initializer=LoadInputRom,
+                                                      initargs=(options,))
+    entries = executor.map(GenerateSeed, [options] * len(remaining_seeds), remaining_seeds)
+  else:
+    LoadInputRom(options)
+    entries = map(GenerateSeed, [options] * len(remaining_seeds), remaining_seeds)
+  try:
+    with open(manifest_filename, 'a') as manifest:
+      for entry in entries:
+        manifest.write(json.dumps(entry) + '\n')
+        manifest.flush()
+        print("Seed %d: %.2fs" % (entry['seed'], entry['seconds']))
+  finally:
+    if executor:
+      executor.shutdown(cancel_futures=True)
+
+
+def ReadManifest(batch_location: str) -> List[Dict[str, Any]]:
+  with open(os.path.join(batch_location, MANIFEST_FILENAME)) as manifest:
+    return [json.loads(line) for line in manifest]
+
+
+class MergeReport(NamedTuple):
+  # The merged manifest, sorted by flag string and then seed.
+  entries: List[Dict[str, Any]]
+  # (flag string, seed) pairs that more than one batch generated identically.
+  duplicates: List[Tuple[str, int]]
+  # (flag string, seed) pairs that batches generated differently.  These aren't merged.
+  conflicts: List[Tuple[str, int]]
+  # The seeds missing from each flag string's range.
+  gaps: Dict[str, List[int]]
+
+
+def MergeBatches(batch_locations: Iterable[str],
+                 output_location: str,
+                 seeds: Optional[Sequence[int]] = None) -> MergeReport:
+  """Combines the manifests and output of batches (e.g. shards) into one catalog.
+
+  Args:
+    batch_locations: The output directories of the batches to merge.
+    output_location: The directory to put the catalog in.  This may be one of the batches.
+    seeds: The seeds every flag string should have.  If not given, the seeds from the lowest to the
+      highest merged seed of each flag string are expected.
+
+  Returns:
+    The merged manifest, along with any duplicate, conflicting and missing seeds.
+  """
+  entries: Dict[Tuple[str, int], Dict[str, Any]] = {}
+  entry_locations: Dict[Tuple[str, int], str] = {}
+  duplicates: Set[Tuple[str, int]] = set()
+  conflicts: Set[Tuple[str, int]] = set()
+  for batch_location in batch_locations:
+    for entry in ReadManifest(batch_location):
+      if not os.path.exists(os.path.join(batch_location, entry['filename'])):
+        continue
+      key = (entry['flag_string'], entry['seed'])
+      if key not in entries:
+        entries[key] = entry
+        entry_locations[key] = batch_location
+      elif entries[key]['sha1'] != entry['sha1']:
+        conflicts.add(key)
+      elif os.path.realpath(entry_locations[key]) != os.path.realpath(batch_location):
+        # A batch that was resumed may list a seed twice, so only count seeds from other batches.
+        duplicates.add(key)
+  for key in conflicts:
+    del entries[key]
+
+  gaps: Dict[str, List[int]] = {}
+  for flag_string in sorted(set(flag_string for (flag_string, seed) in entries)):
+    merged_seeds = set(seed for (entry_flag_string, seed) in entries
+                       if entry_flag_string == flag_string)
+    expected_seeds = seeds if seeds is not None else range(min(merged_seeds), max(merged_seeds) + 1)
+    missing_seeds = sorted(set(expected_seeds) - merged_seeds -
+                           set(seed for (entry_flag_string, seed) in conflicts
+                               if entry_flag_string == flag_string))
+    if missing_seeds:
+      gaps[flag_string] = missing_seeds
+
+  os.makedirs(output_location, exist_ok=True)
+  for (key, entry) in entries.items():
+    source_filename = os.path.join(entry_locations[key], entry['filename'])
+    output_filename = os.path.join(output_location, entry['filename'])
+    if os.path.realpath(source_filename) != os.path.realpath(output_filename):
+      shutil.copyfile(source_filename, output_filename + '.tmp')
+      os.replace(output_filename + '.tmp', output_filename)
+  merged_entries = [entries[key] for key in sorted(entries)]
+  manifest_filename = os.path.join(output_location, MANIFEST_FILENAME)
+  with open(manifest_filename + '.tmp', 'w') as manifest:
+    for entry in merged_entries:
+      manifest.write(json.dumps(entry) + '\n')
+  os.replace(manifest_filename + '.tmp', manifest_filename)
+
+  return MergeReport(entries=merged_entries,
+                     duplicates=sorted(duplicates),
+                     conflicts=sorted(conflicts),
+                     gaps=gaps)
+
+
+def ArchiveBatches(batch_locations: Iterable[str], output_filename: str) -> int:
+  """Packs batches of zpatch files into one seed archive.  Returns the number of seeds in it."""
+  encoded_patches: Dict[Tuple[str, int, str], bytes] = {}
+  for batch_location in batch_locations:
+    for entry in ReadManifest(batch_location):
+      filename = os.path.join(batch_location, entry['filename'])
+      if not os.path.exists(filename):
+        continue
+      if not filename.endswith('.zpatch'):
+        raise ValueError("%s isn't a zpatch file, which a seed archive is built from" % filename)
+      with open(filename, 'rb') as patch_file:
+        encoded_patch = patch_file.read()
+      key = (entry['version'], entry['seed'], entry['flag_string'])
+      if encoded_patches.setdefault(key, encoded_patch) != encoded_patch:
+        raise ValueError("Seed %d with flags \"%s\" differs between batches" %
+                         (entry['seed'], entry['flag_string']))
+  # Write to a temporary file first, so that a server never maps a partly written archive.
+  num_seeds = WriteSeedArchive(output_filename + '.tmp', encoded_patches.items())
+  os.replace(output_filename + '.tmp', output_filename)
+  return num_seeds
+
+
+def GetBatchSeeds() -> List[int]:
+  if COMMAND_LINE_FLAGS.seeds:
+    return ParseSeeds(COMMAND_LINE_FLAGS.seeds)
+  return list(
+      range(COMMAND_LINE_FLAGS.start_seed,
+            COMMAND_LINE_FLAGS.start_seed + COMMAND_LINE_FLAGS.count))
+
+
+def Merge(batch_locations: List[str]) -> None:
+  if not COMMAND_LINE_FLAGS.output_location:
+    raise app.UsageError('merge needs an --output_location for the catalog.')
+  seeds = GetBatchSeeds() if COMMAND_LINE_FLAGS.seeds or COMMAND_LINE_FLAGS.count else None
+  report = MergeBatches(batch_locations, COMMAND_LINE_FLAGS.output_location, seeds)
+  print("Merged %d seeds from %d batches into %s" %
+        (len(report.entries), len(batch_locations), COMMAND_LINE_FLAGS.output_location))
+  for (flag_string, seed) in report.duplicates:
+    print("Seed %d with flags \"%s\" is in more than one batch" % (seed, flag_string))
+  for (flag_string, seed) in report.conflicts:
+    print("Seed %d with flags \"%s\" differs between batches" % (seed, flag_string))
+  for (flag_string, missing_seeds) in report.gaps.items():
+    print("%d seeds with flags \"%s\" are missing: %s" %
+          (len(missing_seeds), flag_string, ",".join(str(seed) for seed in missing_seeds)))
+  if report.conflicts or report.gaps:
+    sys.exit(1)
+
+
+def main(argv: List[str]) -> None:
+  if len(argv) > 1:
+    if argv[1] not in ('merge', 'archive') or len(argv) == 2:
+      raise app.UsageError('Usage: zora_cli.py merge --output_location=CATALOG BATCH [BATCH ...]\n'
+                           '       zora_cli.py archive --output_location=ARCHIVE BATCH [BATCH ...]')
+    if argv[1] == 'merge':
+      Merge(argv[2:])
+    else:
+      if not COMMAND_LINE_FLAGS.output_location:
+        raise app.UsageError('archive needs an --output_location for the archive file.')
+      num_seeds = ArchiveBatches(argv[2:], COMMAND_LINE_FLAGS.output_location)
+      print("Archived %d seeds in %s" % (num_seeds, COMMAND_LINE_FLAGS.output_location))
+    return
+
+  print("Flag string is %s" % COMMAND_LINE_FLAGS.flag_string)
+  options = OutputOptions(flag_string=COMMAND_LINE_FLAGS.flag_string,
+                          debug_mode=COMMAND_LINE_FLAGS.debug_mode,
+                          input_filename=COMMAND_LINE_FLAGS.input_filename,
+                          output_location=COMMAND_LINE_FLAGS.output_location,
+                          patch_format=COMMAND_LINE_FLAGS.patch_format)
+  if COMMAND_LINE_FLAGS.input_sha1:
+    input_rom = Rom(COMMAND_LINE_FLAGS.input_filename, in_memory=True)
+    input_rom.OpenFile()
+    input_sha1 = input_rom.GetSha1()
+    if input_sha1 != COMMAND_LINE_FLAGS.input_sha1.lower():
+      sys.exit("Input ROM %s has SHA-1 %s, expected %s" %
+               (COMMAND_LINE_FLAGS.input_filename, input_sha1, COMMAND_LINE_FLAGS.input_sha1))
+
+  if COMMAND_LINE_FLAGS.seeds or COMMAND_LINE_FLAGS.count:
+    seeds = GetShard(GetBatchSeeds(), COMMAND_LINE_FLAGS.shard_index,
+                     COMMAND_LINE_FLAGS.shard_count)
+    output_location = options.output_location or os.path.dirname(options.input_filename) or '.'
+    GenerateBatch(options._replace(output_location=output_location),
+                  seeds,
+                  jobs=COMMAND_LINE_FLAGS.jobs)
+    return
+
+  print("Seed is %s" % COMMAND_LINE_FLAGS.seed)
+  LoadInputRom(options)
+  GenerateSeed(options, COMMAND_LINE_FLAGS.seed)
 
 
 if __name__ == '__main__':
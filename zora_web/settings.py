@@ -79,6 +79,26 @@ WSGI_APPLICATION = 'zora_web.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
+if os.getenv("DATABASE_URL"):
+    database_url = urlparse(os.getenv("DATABASE_URL"))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': database_url.path.lstrip('/'),
+            'USER': database_url.username,
+            'PASSWORD': database_url.password,
+            'HOST': database_url.hostname,
+            'PORT': database_url.port or '',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -141,3 +161,52 @@ USE_TZ = True
 
 STATIC_URL = '/randomizer/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+
+# Files with a content hash in their name, like the binary mode patches written by
+# "manage.py build_mode_patches", never change, so WhiteNoise lets clients cache them forever.
+WHITENOISE_IMMUTABLE_FILE_TEST = r'^.+\.[0-9a-f]{12}\..+$'
+
+# Path to the vanilla ROM, which BPS patches need for their checksums.  Without it, the API only
+# serves JSON and IPS patches.
+ZORA_BASE_ROM = os.getenv("ZORA_BASE_ROM", "")
+
+# Path to a seed archive written by "zora_cli.py archive".  Seeds in it are served from it instead of
+# being generated.
+ZORA_SEED_ARCHIVE = os.getenv("ZORA_SEED_ARCHIVE", "")
+
+# Memory that each process may use to keep recently generated seeds, so that a seed everyone in a
+# race asks for at once is generated only once.  0 turns the cache off.
+ZORA_RESULT_CACHE_BYTES = int(os.getenv("ZORA_RESULT_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Seconds that generating a seed may take before it's given up on, so that flags that can't be made
+# into a seed don't keep a worker busy forever.  0 means no limit.  Generation for a web request
+# also stops if the client disconnects (under gunicorn, which lets us see the connection).
+ZORA_GENERATION_BUDGET = float(os.getenv("ZORA_GENERATION_BUDGET", 30))
+
+# Admission control for the generate views, per process: how many seeds may be generated at once,
+# how many requests may wait (for up to the timeout, in seconds) for one of them to finish, and how
+# many of those each client may have.  Requests beyond that get a 503 with a Retry-After.  Clients
+# are told apart by IP address (taken from the request header that the proxy in front of the
+# server puts it in, if there is one, e.g. HTTP_X_FORWARDED_FOR), or by an X-API-Key header with
+# one of the comma-separated API keys.
+ZORA_MAX_GENERATIONS = int(os.getenv("ZORA_MAX_GENERATIONS", 2))
+ZORA_MAX_WAITING_GENERATIONS = int(os.getenv("ZORA_MAX_WAITING_GENERATIONS", 4))
+ZORA_MAX_GENERATIONS_PER_CLIENT = int(os.getenv("ZORA_MAX_GENERATIONS_PER_CLIENT", 2))
+ZORA_GENERATION_QUEUE_TIMEOUT = float(os.getenv("ZORA_GENERATION_QUEUE_TIMEOUT", 10))
+ZORA_CLIENT_IP_HEADER = os.getenv("ZORA_CLIENT_IP_HEADER", "")
+ZORA_API_KEYS = [key for key in os.getenv("ZORA_API_KEYS", "").split(",") if key]
+
+# Generation jobs queued through /api/v2/generate.  Race seeds are run before other jobs.  A job that
+# has been running for longer than the timeout (in seconds) is assumed to have lost its worker, and
+# is queued again until it has been tried the maximum number of times.  Finished jobs are removed
+# after the retention period (in seconds).
+ZORA_RACE_JOB_PRIORITY = int(os.getenv("ZORA_RACE_JOB_PRIORITY", 10))
+ZORA_JOB_TIMEOUT = int(os.getenv("ZORA_JOB_TIMEOUT", 5 * 60))
+ZORA_JOB_MAX_ATTEMPTS = int(os.getenv("ZORA_JOB_MAX_ATTEMPTS", 2))
+ZORA_JOB_RETENTION = int(os.getenv("ZORA_JOB_RETENTION", 24 * 60 * 60))
+
+# Unix socket of the generator daemon run by "manage.py run_generator_pool".  Without it, or while the
+# daemon isn't running, seeds are generated by the web worker itself.  The timeout (in seconds) is
+# how long to wait for the daemon before generating the seed here instead.
+ZORA_GENERATOR_SOCKET = os.getenv("ZORA_GENERATOR_SOCKET", "")
+ZORA_GENERATOR_TIMEOUT = float(os.getenv("ZORA_GENERATOR_TIMEOUT", 60))